@@ -126,3 +126,69 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+# Uploaded files and generated artifacts (cached PDF reports live under
+# MEDIA_ROOT/REPORT_CACHE_DIR)
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+REPORT_CACHE_DIR = 'report_cache'
+
+# Point TestBooking.result_file at the cached PDF the first time a
+# patient downloads a completed test report
+REPORT_CACHE_WRITE_BACK = True
+
+# Process pool used to render PDF/XLSX reports off the request thread
+# (set RENDER_POOL_WORKERS to 0 to render inline)
+
+RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", "2"))
+RENDER_POOL_MAX_PENDING = 8
+RENDER_POOL_TIMEOUT = 30
+
+# Full-period lab reports can run to thousands of pages (the Excel export
+# of the same report gets the same allowance)
+LAB_REPORT_PDF_TIMEOUT = 300
+
+# Patient search index: 'auto' (by database vendor), 'sqlite_fts5',
+# 'postgres_trgm' or 'basic' (unindexed icontains)
+PATIENT_SEARCH_BACKEND = 'auto'
+
+# Country code assumed for patient phone numbers entered without one
+PHONE_DEFAULT_COUNTRY_CODE = '91'
+
+# Seconds a process keeps its diagnostic test catalogue snapshot before
+# reloading, as a fallback when the cache is not shared between processes
+TEST_CATALOGUE_MAX_AGE = 300
+
+# Seconds a process keeps its doctor directory snapshot (see
+# TEST_CATALOGUE_MAX_AGE)
+DOCTOR_DIRECTORY_MAX_AGE = 300
+
+# Rows per page of the keyset-paginated list views
+KEYSET_PAGE_SIZE = 50
+
+# Seconds the front desk patient typeahead caches the results of a prefix
+PATIENT_TYPEAHEAD_CACHE_TTL = 30
+
+# Payment gateway used by the patient payment pages: 'direct' (confirms in
+# the request) or 'simulator' (local stand-in for a real gateway that
+# confirms through the payment webhook after a delay, for development).
+# With a webhook gateway, payments stay Pending until the webhook is
+# applied, so a `manage.py process_webhooks` worker must run alongside the
+# web server.
+PAYMENT_GATEWAY = 'direct'
+# Simulator only: seconds before its webhook, and the share of charges it
+# declines and of webhooks it delivers twice
+PAYMENT_SIMULATOR_DELAY = 2
+PAYMENT_SIMULATOR_FAILURE_RATE = 0
+PAYMENT_SIMULATOR_DUPLICATE_RATE = 0.2
+# Tries before a webhook event that keeps failing is given up
+WEBHOOK_MAX_ATTEMPTS = 5
+
+# Turnaround of a diagnostic test whose result duration cannot be read,
+# for the due times of the lab work queue
+LAB_DEFAULT_TURNAROUND_HOURS = 24
+# Minutes after which a technician's unfinished claim on a test goes back
+# to the queue
+LAB_CLAIM_TIMEOUT_MINUTES = 120
@@ -17,7 +17,8 @@ from .models import (
     LabResult,
     Payment,
     LoginHistory,
-    PatientHistory
+    PatientHistory,
+    TestReferenceRange
 )
 
 admin.site.register(PatientProfile)
@@ -34,5 +35,6 @@ admin.site.register(LabResult)
 admin.site.register(Payment)
 admin.site.register(LoginHistory)
 admin.site.register(PatientHistory)
+admin.site.register(TestReferenceRange)
 
 # Add this to your admin.py file
@@ -0,0 +1,222 @@
+"""
+Import of lab analyzer result files.
+
+Analyzers export one result per line as CSV, or as tab, semicolon or pipe
+delimited text (the delimiter is detected from the header line). The
+header names the columns; matching ignores case, spaces and underscores:
+
+* ``booking_id`` (or ``accession``, ``sample_id``) - required. The
+  ``TestBooking`` id, optionally with a letter prefix (``LAB-000123``)
+* ``result`` (or ``value``) - required
+* ``normal_range`` (or ``reference_range``, ``range``) - optional
+* ``flag`` (or ``result_status``) - optional, stored as the result
+  status when no flag can be computed from the value and reference
+  range (``Pending`` when missing too)
+* ``remarks`` (or ``comment``) - optional
+
+``ingest_results()`` reads the file line by line and works in chunks of
+``CHUNK_SIZE`` lines: one query looks up the chunk's bookings in the
+technician's lab, then the chunk's ``LabResult`` rows are inserted with
+one ``bulk_create`` (flagged in one batch by
+``core.lab_values.classify()``) and its bookings marked Completed with one
+``bulk_update``, in a transaction per chunk. A bad line (unknown booking,
+missing value, booking not Booked or In Progress ...) is reported and
+skipped without stopping the run, so memory use does not grow with the
+file.
+"""
+
+import csv
+import io
+import re
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lab_results import OPEN_STATUSES
+from .lab_values import classify
+
+
+CHUNK_SIZE = 1000
+
+# Errors kept on the returned IngestReport; all of them go to ``on_error``
+MAX_REPORTED_ERRORS = 500
+
+COLUMNS = {
+    'booking_id': ('bookingid', 'booking', 'accession', 'accessionid', 'accessionno', 'sampleid'),
+    'value': ('result', 'value', 'resultvalue', 'testvalue'),
+    'normal_range': ('normalrange', 'referencerange', 'range', 'refrange'),
+    'result_status': ('flag', 'resultstatus', 'status'),
+    'remarks': ('remarks', 'remark', 'comment', 'comments'),
+}
+
+REQUIRED_COLUMNS = ('booking_id', 'value')
+
+_ACCESSION = re.compile(r'^(?:[A-Za-z]+-?)?0*(\d+)$')
+
+IngestError = namedtuple('IngestError', 'line message')
+
+# lines: data lines read; created: LabResult rows inserted; errors: the
+# first MAX_REPORTED_ERRORS errors; error_count: all of them
+IngestReport = namedtuple('IngestReport', 'lines created errors error_count')
+
+
+class IngestFileError(Exception):
+    """The file cannot be imported at all (no header, missing columns)."""
+
+
+def text_stream(binary_file, encoding='utf-8-sig'):
+    """A text stream over an uploaded or opened binary file, for ``ingest_results()``."""
+    return io.TextIOWrapper(binary_file, encoding=encoding, errors='replace', newline='')
+
+
+def _columns(header):
+    names = [re.sub(r'[\s_\-.#]', '', name).lower() for name in header]
+    columns = {}
+    for column, aliases in COLUMNS.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                columns[column] = index
+                break
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise IngestFileError(f"Missing column(s): {', '.join(missing)}.")
+    return columns
+
+
+def _reader(stream):
+    header_line = stream.readline()
+    if not header_line.strip():
+        raise IngestFileError("The file is empty.")
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=',\t;|')
+    except csv.Error:
+        dialect = csv.excel
+    header = next(csv.reader([header_line], dialect))
+    return _columns(header), csv.reader(stream, dialect)
+
+
+def _rows(stream):
+    """``(line number, {column: value})`` for each non-blank data line."""
+    columns, reader = _reader(stream)
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        # The header is line 1
+        yield reader.line_num + 1, {
+            column: row[index].strip() if index < len(row) else ''
+            for column, index in columns.items()
+        }
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _booking_id(value):
+    match = _ACCESSION.match(value)
+    return int(match.group(1)) if match else None
+
+
+def _ingest_chunk(chunk, tech_profile, doctor, limits):
+    """Save one chunk; returns ``(created, errors)``."""
+    from .models import LabResult, TestBooking
+
+    errors = []
+    ids = {line: _booking_id(row['booking_id']) for line, row in chunk}
+    with transaction.atomic():
+        bookings = TestBooking.objects.select_for_update(of=('self',)).filter(
+            lab=tech_profile.lab, id__in={booking_id for booking_id in ids.values() if booking_id},
+        ).select_related('patient', 'test').in_bulk()
+
+        today = timezone.localdate()
+        results, completed = [], {}
+        for line, row in chunk:
+            booking = bookings.get(ids[line])
+            status = row.get('result_status') or 'Pending'
+            if ids[line] is None:
+                message = f"Invalid booking id {row['booking_id']!r}."
+            elif booking is None:
+                message = f"Booking {ids[line]} not found in this lab."
+            elif booking.status == 'Completed' or booking.id in completed:
+                message = f"Booking {booking.id} already has a result."
+            elif booking.status not in OPEN_STATUSES:
+                message = f"Booking {booking.id} is {booking.status}, not open for results."
+            elif not row['value']:
+                message = "Missing result value."
+            else:
+                message = next((
+                    f"{label} is longer than {limits[field]} characters."
+                    for field, label, value in (
+                        ('test_value', 'Result', row['value']),
+                        ('normal_range', 'Normal range', row.get('normal_range', '')),
+                        ('result_status', 'Flag', status),
+                    )
+                    if len(value) > limits[field]
+                ), None)
+            if message:
+                errors.append(IngestError(line, message))
+                continue
+
+            completed[booking.id] = booking
+            results.append(LabResult(
+                patient=booking.patient,
+                doctor=doctor,
+                lab_technician=tech_profile,
+                test_name=booking.test.test_name,
+                test_code=booking.test.test_code or '',
+                test_value=row['value'],
+                normal_range=row.get('normal_range', ''),
+                result_status=status,
+                remarks=row.get('remarks', ''),
+                test_date=today,
+            ))
+
+        LabResult.objects.bulk_create(classify(results), batch_size=CHUNK_SIZE)
+        now = timezone.now()
+        for booking in completed.values():
+            booking.status = 'Completed'
+            booking.updated_at = now
+        TestBooking.objects.bulk_update(completed.values(), ['status', 'updated_at'], batch_size=CHUNK_SIZE)
+    return len(results), errors
+
+
+def ingest_results(stream, tech_profile, on_error=None, chunk_size=CHUNK_SIZE):
+    """
+    Import the analyzer results in text ``stream`` for bookings of
+    ``tech_profile``'s lab and return an ``IngestReport``. ``on_error`` is
+    called with every ``IngestError`` as it is found.
+
+    Raises ``IngestFileError`` if the header is unusable or no doctor is
+    available to sign the results.
+    """
+    from .models import DoctorProfile, LabResult
+
+    doctor = DoctorProfile.objects.first()
+    if doctor is None:
+        raise IngestFileError("No doctor is available to sign the results.")
+    limits = {
+        field: LabResult._meta.get_field(field).max_length
+        for field in ('test_value', 'normal_range', 'result_status')
+    }
+
+    lines = created = error_count = 0
+    reported = []
+    for chunk in _chunks(_rows(stream), chunk_size):
+        chunk_created, errors = _ingest_chunk(chunk, tech_profile, doctor, limits)
+        lines += len(chunk)
+        created += chunk_created
+        error_count += len(errors)
+        for error in errors:
+            if on_error is not None:
+                on_error(error)
+            if len(reported) < MAX_REPORTED_ERRORS:
+                reported.append(error)
+    return IngestReport(lines=lines, created=created, errors=reported, error_count=error_count)
@@ -0,0 +1,140 @@
+"""
+Cached directory of doctors.
+
+The booking forms, the doctor search page, the specialization AJAX call
+and the front desk doctor list all need the same few columns of
+``DoctorProfile`` joined to ``User``, plus the distinct specializations.
+``get_directory()`` returns them from a process-local snapshot (see
+``core.snapshots``) that is invalidated from ``core/signals.py`` on
+``DoctorProfile`` / ``User`` writes.
+
+Each doctor is a plain dict, so templates and JSON share one shape:
+
+    {'id': 3, 'name': 'Asha Rao', 'specialization': 'Cardiology',
+     'department': 'Cardio', 'experience': 12, 'consultation_fee': '800.00',
+     'bio': '...', 'email': ..., 'license_number': ..., 'status': 'Active',
+     'is_active': True}
+
+The JSON served to the booking pages (``PUBLIC_FIELDS`` only) is
+serialised once per snapshot, together with an ETag, so unchanged
+responses are answered with 304 Not Modified.
+"""
+
+import hashlib
+import json
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .snapshots import VersionedSnapshot
+
+
+# Fields exposed to patients through the JSON endpoints
+PUBLIC_FIELDS = (
+    'id', 'name', 'specialization', 'department', 'experience', 'consultation_fee', 'bio',
+)
+
+
+def _etag(payload):
+    return '"%s"' % hashlib.sha256(payload).hexdigest()[:32]
+
+
+def _serialize(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+class DoctorDirectory:
+    def __init__(self, doctors):
+        # All doctors (any status), ordered by first name like the old views
+        self.doctors = doctors
+        self.by_id = {doctor['id']: doctor for doctor in doctors}
+        self.active = [doctor for doctor in doctors if doctor['status'] == 'Active']
+
+        self.by_specialization = {}
+        self.by_department = {}
+        for doctor in self.active:
+            self.by_specialization.setdefault(doctor['specialization'], []).append(doctor)
+            self.by_department.setdefault(doctor['department'], []).append(doctor)
+        self.specializations = sorted(self.by_specialization)
+        self.departments = sorted(self.by_department)
+
+        public = [{field: doctor[field] for field in PUBLIC_FIELDS} for doctor in self.active]
+        self.json = _serialize({
+            'doctors': public,
+            'specializations': self.specializations,
+            'departments': self.departments,
+        })
+        self.etag = _etag(self.json)
+
+        # Pre-serialized body and ETag of each specialization lookup
+        self.specialization_json = {}
+        for specialization in self.specializations:
+            body = _serialize({'doctors': [
+                doctor for doctor in public if doctor['specialization'] == specialization
+            ]})
+            self.specialization_json[specialization] = (body, _etag(body))
+        empty = _serialize({'doctors': []})
+        self.empty_json = (empty, _etag(empty))
+
+    def for_specialization(self, specialization):
+        """(body, etag) of the doctors-by-specialization JSON."""
+        return self.specialization_json.get(specialization, self.empty_json)
+
+    def choices(self):
+        """(id, label) pairs of active doctors for form fields."""
+        return [
+            (doctor['id'], f"Dr. {doctor['name']} ({doctor['specialization']})")
+            for doctor in self.active
+        ]
+
+
+def load_directory():
+    from .models import DoctorProfile
+
+    rows = DoctorProfile.objects.order_by('user__first_name', 'id').values_list(
+        'id', 'user__first_name', 'user__last_name', 'user__username', 'user__email',
+        'user__is_active', 'specialization', 'department', 'experience',
+        'consultation_fee', 'bio', 'license_number', 'status',
+    )
+    doctors = []
+    for (pk, first_name, last_name, username, email, is_active, specialization,
+         department, experience, fee, bio, license_number, status) in rows:
+        doctors.append({
+            'id': pk,
+            'name': f"{first_name} {last_name}".strip() or username,
+            'specialization': specialization,
+            'department': department,
+            'experience': experience,
+            'consultation_fee': str(fee),
+            'bio': bio or '',
+            'email': email,
+            'license_number': license_number,
+            'status': status,
+            'is_active': is_active,
+        })
+    return DoctorDirectory(doctors)
+
+
+_directory = VersionedSnapshot('doctor_directory', load_directory, 'DOCTOR_DIRECTORY_MAX_AGE')
+
+
+def directory_json_response(request, body, etag):
+    """
+    Serve pre-serialized directory JSON, or 304 if the browser already
+    has this version. Browsers must revalidate, so changes show up at once.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_directory():
+    """Current doctor directory snapshot."""
+    return _directory.get()
+
+
+def invalidate_directory():
+    _directory.invalidate()
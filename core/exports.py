@@ -0,0 +1,142 @@
+"""
+Streaming CSV / NDJSON export of list-view querysets.
+
+A list view builds its filtered queryset as usual and, when the request
+carries ``?export=csv`` (or ``?export=ndjson``), hands it to
+``export_response`` together with a column spec instead of rendering the
+template. Rows are pulled with ``values_list(...).iterator()`` so no model
+instances are built and memory stays flat regardless of table size.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() just returns the value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def get_export_format(request):
+    """Return the requested export format, or None for a normal page view."""
+    fmt = request.GET.get('export', '').strip().lower()
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+def _projected_rows(queryset, columns):
+    fields = [field for _, field in columns]
+    # Drop select_related/prefetch so the projection is the only join source
+    queryset = queryset.select_related(None).prefetch_related(None)
+    return queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_csv(queryset, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in _projected_rows(queryset, columns):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset, columns):
+    headers = [header for header, _ in columns]
+    for row in _projected_rows(queryset, columns):
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_response(queryset, columns, basename, fmt='csv'):
+    """
+    Stream ``queryset`` as a file download.
+
+    ``columns`` is a list of ``(header, field_path)`` pairs, where
+    ``field_path`` is anything ``values_list`` accepts (e.g.
+    ``'patient__full_name'``).
+    """
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+
+    rows = stream_csv(queryset, columns) if fmt == 'csv' else stream_ndjson(queryset, columns)
+
+    filename = f"{basename}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Column specs shared by the list views that support export
+
+PAYMENT_EXPORT_COLUMNS = [
+    ('Transaction ID', 'transaction_id'),
+    ('Patient', 'patient__full_name'),
+    ('Phone', 'patient__phone'),
+    ('Amount', 'amount'),
+    ('Method', 'payment_method'),
+    ('Status', 'payment_status'),
+    ('Payment Date', 'payment_date'),
+    ('Appointment ID', 'appointment_id'),
+    ('Test Booking ID', 'test_booking_id'),
+]
+
+APPOINTMENT_EXPORT_COLUMNS = [
+    ('Appointment ID', 'id'),
+    ('Patient', 'patient__full_name'),
+    ('Phone', 'patient__phone'),
+    ('Doctor First Name', 'doctor__user__first_name'),
+    ('Doctor Last Name', 'doctor__user__last_name'),
+    ('Specialization', 'doctor__specialization'),
+    ('Date', 'appointment_date'),
+    ('Time', 'appointment_time'),
+    ('Reason', 'reason'),
+    ('Status', 'status'),
+    ('Created At', 'created_at'),
+]
+
+TEST_BOOKING_EXPORT_COLUMNS = [
+    ('Booking ID', 'id'),
+    ('Patient', 'patient__full_name'),
+    ('Phone', 'patient__phone'),
+    ('Test', 'test__test_name'),
+    ('Test Code', 'test__test_code'),
+    ('Lab', 'lab__name'),
+    ('Booking Date', 'booking_date'),
+    ('Status', 'status'),
+    ('Created At', 'created_at'),
+]
+
+PRESCRIPTION_EXPORT_COLUMNS = [
+    ('Prescription ID', 'id'),
+    ('Appointment ID', 'appointment_id'),
+    ('Patient', 'patient__full_name'),
+    ('Medicine', 'medicine_name'),
+    ('Dosage', 'dosage'),
+    ('Frequency', 'frequency'),
+    ('Duration', 'duration'),
+    ('Instructions', 'instructions'),
+    ('Status', 'status'),
+    ('Created At', 'created_at'),
+]
+
+LAB_RESULT_EXPORT_COLUMNS = [
+    ('Result ID', 'id'),
+    ('Test Name', 'test_name'),
+    ('Value', 'test_value'),
+    ('Normal Range', 'normal_range'),
+    ('Status', 'result_status'),
+    ('Test Date', 'test_date'),
+    ('Doctor First Name', 'doctor__user__first_name'),
+    ('Doctor Last Name', 'doctor__user__last_name'),
+    ('Remarks', 'remarks'),
+]
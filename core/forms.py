@@ -82,6 +82,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Appointment, DoctorProfile
+from .doctor_directory import get_directory
 
 
 class RescheduleAppointmentForm(forms.ModelForm):
@@ -141,6 +142,10 @@ class RescheduleAppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
+        # Render the options from the cached directory; the queryset is
+        # only queried to validate the submitted doctor
+        self.fields['doctor'].choices = get_directory().choices()
+        
         # If we have an instance, set the current doctor as selected
         if self.instance and self.instance.pk:
             self.fields['doctor'].initial = self.instance.doctor
@@ -0,0 +1,321 @@
+"""
+Global search across patients, appointments, lab bookings, payments and
+prescriptions.
+
+Each searchable row has one denormalized ``SearchDocument`` keyed by
+(entity type, id). It holds a display title / detail line and a text
+vector with everything staff search by: transaction id, appointment
+token, patient name and phone, test name and medicine name. Documents are
+rewritten from signals (see ``core/signals.py``) whenever the row, or the
+patient whose name and phone it copies, is saved.
+
+The text is indexed like the patient search (``core.patient_search``) and
+uses the same ``PATIENT_SEARCH_BACKEND``:
+
+* ``sqlite_fts5``   - external-content FTS5 table ``core_search_fts``, kept
+                      in sync by triggers on ``core_searchdocument``
+* ``postgres_trgm`` - pg_trgm GIN index on ``core_searchdocument.text``
+* ``basic``         - icontains on the text column
+
+``search()`` returns the best hits of every entity type, grouped and
+ranked, from a single query.
+"""
+
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+
+from .patient_search import SQLiteFTSBackend, get_backend as get_patient_backend, phone_tokens, query_terms
+
+
+FTS_TABLE = 'core_search_fts'
+
+# Hits returned per entity type
+GROUP_SIZE = 5
+
+ENTITY_LABELS = {
+    'patient': 'Patients',
+    'appointment': 'Appointments',
+    'lab_booking': 'Lab Bookings',
+    'payment': 'Payments',
+    'prescription': 'Prescriptions',
+}
+
+# Multiplies a hit's relevance, so e.g. the patient record itself comes
+# before the many rows that mention the patient's name
+ENTITY_WEIGHTS = {
+    'patient': 3.0,
+    'appointment': 1.5,
+    'lab_booking': 1.2,
+    'payment': 1.2,
+    'prescription': 1.0,
+}
+
+ENTITY_URLS = {
+    'patient': ('frontdesk_patients_detail', 'entity_id'),
+    'appointment': ('frontdesk_appointment_detail', 'entity_id'),
+    'lab_booking': ('frontdesk_lab_test_confirmation', 'entity_id'),
+    'payment': ('frontdesk_payment_detail', 'entity_id'),
+    'prescription': ('frontdesk_patients_detail', 'patient_id'),
+}
+
+
+def _text(*parts):
+    return ' '.join(str(part) for part in parts if part).lower()
+
+
+def _patient_text(patient):
+    return _text(patient.full_name, phone_tokens(patient.phone))
+
+
+# ===== DOCUMENT BUILDERS =====
+# Each takes a queryset of its model and yields SearchDocument field dicts.
+# They only use model fields, so migrations can run them on historical models.
+
+def patient_documents(queryset):
+    for patient in queryset.select_related('user').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'patient',
+            'entity_id': patient.id,
+            'patient_id': patient.id,
+            'title': patient.full_name,
+            'detail': patient.phone,
+            'text': _text(_patient_text(patient), patient.email or patient.user.email),
+            'sort_date': None,
+        }
+
+
+def appointment_documents(queryset):
+    # The token printed at booking: day and month plus the appointment's
+    # position among that day's appointments (see views.generate_token)
+    day_position = Subquery(
+        queryset.model.objects
+        .filter(appointment_date=OuterRef('appointment_date'), id__lte=OuterRef('id'))
+        .values('appointment_date')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    appointments = queryset.select_related('patient').annotate(day_position=day_position)
+    for appointment in appointments.iterator(chunk_size=2000):
+        token = f"{appointment.appointment_date:%d%m}-{appointment.day_position or 0:03d}"
+        yield {
+            'entity_type': 'appointment',
+            'entity_id': appointment.id,
+            'patient_id': appointment.patient_id,
+            'title': f"{appointment.patient.full_name} · Token {token}",
+            'detail': f"{appointment.appointment_date:%d %b %Y} {appointment.appointment_time:%H:%M}",
+            'text': _text(token, appointment.id, _patient_text(appointment.patient)),
+            'sort_date': appointment.created_at,
+        }
+
+
+def lab_booking_documents(queryset):
+    for booking in queryset.select_related('patient', 'test', 'lab').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'lab_booking',
+            'entity_id': booking.id,
+            'patient_id': booking.patient_id,
+            'title': f"{booking.test.test_name} · {booking.patient.full_name}",
+            'detail': f"{booking.lab.name} · {booking.booking_date:%d %b %Y}",
+            'text': _text(
+                booking.id, booking.test.test_name, booking.test.test_code, booking.lab.name,
+                _patient_text(booking.patient),
+            ),
+            'sort_date': booking.created_at,
+        }
+
+
+def payment_documents(queryset):
+    for payment in queryset.select_related('patient').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'payment',
+            'entity_id': payment.id,
+            'patient_id': payment.patient_id,
+            'title': f"{payment.transaction_id or payment.id} · {payment.patient.full_name}",
+            'detail': f"₹{payment.amount} · {payment.payment_method} · {payment.payment_date:%d %b %Y}",
+            'text': _text(payment.transaction_id, payment.id, _patient_text(payment.patient)),
+            'sort_date': payment.payment_date,
+        }
+
+
+def prescription_documents(queryset):
+    for prescription in queryset.select_related('patient').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'prescription',
+            'entity_id': prescription.id,
+            'patient_id': prescription.patient_id,
+            'title': f"{prescription.medicine_name} · {prescription.patient.full_name}",
+            'detail': f"{prescription.dosage} · {prescription.frequency} · {prescription.created_at:%d %b %Y}",
+            'text': _text(prescription.medicine_name, _patient_text(prescription.patient)),
+            'sort_date': prescription.created_at,
+        }
+
+
+BUILDERS = {
+    'PatientProfile': patient_documents,
+    'Appointment': appointment_documents,
+    'TestBooking': lab_booking_documents,
+    'Payment': payment_documents,
+    'Prescription': prescription_documents,
+}
+
+ENTITY_TYPES = {
+    'PatientProfile': 'patient',
+    'Appointment': 'appointment',
+    'TestBooking': 'lab_booking',
+    'Payment': 'payment',
+    'Prescription': 'prescription',
+}
+
+# Reverse accessors from PatientProfile to documents that copy its name and phone
+PATIENT_RELATED = ('appointment_set', 'testbooking_set', 'payments', 'prescription_set')
+
+
+def write_documents(documents, document_model=None):
+    """Insert or replace documents (dicts from the builders)."""
+    if document_model is None:
+        from .models import SearchDocument as document_model
+
+    batch = []
+    for document in documents:
+        batch.append(document_model(**document))
+        if len(batch) >= 2000:
+            _upsert(document_model, batch)
+            batch = []
+    _upsert(document_model, batch)
+
+
+def _upsert(document_model, batch):
+    if batch:
+        document_model.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['entity_type', 'entity_id'],
+            update_fields=['patient_id', 'title', 'detail', 'text', 'sort_date'],
+        )
+
+
+def index_queryset(queryset):
+    """(Re)index every row of a queryset of one of the searchable models."""
+    write_documents(BUILDERS[queryset.model.__name__](queryset))
+
+
+def index_patient_related(patient):
+    """Reindex the documents that copy ``patient``'s name and phone."""
+    for accessor in PATIENT_RELATED:
+        index_queryset(getattr(patient, accessor).all())
+
+
+def remove_documents(model, ids):
+    from .models import SearchDocument
+
+    SearchDocument.objects.filter(
+        entity_type=ENTITY_TYPES[model.__name__], entity_id__in=ids,
+    ).delete()
+
+
+def rebuild():
+    from . import models
+
+    models.SearchDocument.objects.all().delete()
+    for model_name, builder in BUILDERS.items():
+        write_documents(builder(getattr(models, model_name).objects.all()))
+
+
+# ===== QUERYING =====
+
+_COLUMNS = 'entity_type, entity_id, patient_id, title, detail'
+
+_WEIGHT_SQL = 'CASE entity_type %s END' % ' '.join(
+    f"WHEN '{entity_type}' THEN {weight}" for entity_type, weight in ENTITY_WEIGHTS.items()
+)
+
+
+def _sqlite_hits(query, group_size):
+    expression = SQLiteFTSBackend.match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {_COLUMNS} FROM ("
+            f"  SELECT *, ROW_NUMBER() OVER ("
+            f"    PARTITION BY entity_type ORDER BY score, sort_date DESC"
+            f"  ) AS position FROM ("
+            f"    SELECT d.*, bm25({FTS_TABLE}) * {_WEIGHT_SQL} AS score"
+            f"    FROM {FTS_TABLE} JOIN core_searchdocument d ON d.id = {FTS_TABLE}.rowid"
+            f"    WHERE {FTS_TABLE} MATCH %s"
+            f"  )"
+            f") WHERE position <= %s ORDER BY score",
+            [expression, group_size],
+        )
+        return cursor.fetchall()
+
+
+def _postgres_hits(query, group_size):
+    terms = query_terms(query)
+    if not terms:
+        return []
+    where = ' AND '.join(['text ILIKE %s'] * len(terms))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {_COLUMNS} FROM ("
+            f"  SELECT *, ROW_NUMBER() OVER ("
+            f"    PARTITION BY entity_type ORDER BY score DESC, sort_date DESC NULLS LAST"
+            f"  ) AS position FROM ("
+            f"    SELECT *, word_similarity(%s, text) * {_WEIGHT_SQL} AS score"
+            f"    FROM core_searchdocument WHERE {where}"
+            f"  ) matches"
+            f") hits WHERE position <= %s ORDER BY score DESC",
+            [' '.join(terms), *[f'%{term}%' for term in terms], group_size],
+        )
+        return cursor.fetchall()
+
+
+def _basic_hits(query, group_size):
+    from .models import SearchDocument
+
+    terms = query_terms(query)
+    if not terms:
+        return []
+    condition = Q()
+    for term in terms:
+        condition &= Q(text__icontains=term)
+    hits = (
+        SearchDocument.objects.filter(condition)
+        .annotate(position=Window(
+            RowNumber(), partition_by=F('entity_type'),
+            order_by=F('sort_date').desc(nulls_last=True),
+        ))
+        .filter(position__lte=group_size)
+        .order_by('position')
+    )
+    rows = hits.values_list('entity_type', 'entity_id', 'patient_id', 'title', 'detail')
+    return sorted(rows, key=lambda row: -ENTITY_WEIGHTS[row[0]])
+
+
+HIT_QUERIES = {
+    'sqlite_fts5': _sqlite_hits,
+    'postgres_trgm': _postgres_hits,
+    'basic': _basic_hits,
+}
+
+
+def search(query, group_size=GROUP_SIZE):
+    """
+    Hits for ``query`` grouped by entity type, best group first:
+    ``[{'type', 'label', 'results': [{'id', 'patient_id', 'title', 'detail', 'url'}]}]``
+    """
+    hits = HIT_QUERIES[get_patient_backend().name](query, group_size)
+    groups = {}
+    for entity_type, entity_id, patient_id, title, detail in hits:
+        url_name, url_key = ENTITY_URLS[entity_type]
+        url_id = entity_id if url_key == 'entity_id' else patient_id
+        groups.setdefault(entity_type, []).append({
+            'id': entity_id, 'patient_id': patient_id, 'title': title, 'detail': detail,
+            'url': reverse(url_name, args=[url_id]) if url_id else None,
+        })
+    return [
+        {'type': entity_type, 'label': ENTITY_LABELS[entity_type], 'results': results}
+        for entity_type, results in groups.items()
+    ]
@@ -0,0 +1,145 @@
+"""
+Lab work queue.
+
+Every test booking is due ``DiagnosticTest.result_duration`` after it was
+booked (``TestBooking.due_at``, set on save; durations such as
+``24 hours``, ``2-3 days`` or ``45 min`` are parsed by ``turnaround()``,
+and anything unreadable counts as ``LAB_DEFAULT_TURNAROUND_HOURS``). The
+queue of a lab is its Booked tests, most urgent first, read through the
+``(lab, status, due_at)`` index.
+
+``claim_next()`` hands a technician the next tests due and marks them In
+Progress for them. It locks the rows it picks with ``SKIP LOCKED`` where
+the database supports it, so technicians claiming at the same time get
+different tests instead of waiting on each other. A claim that is not
+finished within ``LAB_CLAIM_TIMEOUT_MINUTES`` goes back to the queue.
+"""
+
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+QUEUE_STATUS = 'Booked'
+CLAIMED_STATUS = 'In Progress'
+
+# Most tests a technician can claim at once
+MAX_CLAIM = 50
+
+_UNITS = {
+    'm': timedelta(minutes=1), 'min': timedelta(minutes=1), 'mins': timedelta(minutes=1),
+    'minute': timedelta(minutes=1), 'minutes': timedelta(minutes=1),
+    'h': timedelta(hours=1), 'hr': timedelta(hours=1), 'hrs': timedelta(hours=1),
+    'hour': timedelta(hours=1), 'hours': timedelta(hours=1),
+    'd': timedelta(days=1), 'day': timedelta(days=1), 'days': timedelta(days=1),
+    'w': timedelta(weeks=1), 'wk': timedelta(weeks=1), 'wks': timedelta(weeks=1),
+    'week': timedelta(weeks=1), 'weeks': timedelta(weeks=1),
+}
+
+_DURATION = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(?:(?:-|–|to)\s*(\d+(?:\.\d+)?)\s*)?([a-z]+)',
+    re.IGNORECASE,
+)
+
+
+def default_turnaround():
+    return timedelta(hours=getattr(settings, 'LAB_DEFAULT_TURNAROUND_HOURS', 24))
+
+
+def parse_duration(text):
+    """
+    The ``timedelta`` of a free-text duration (the upper end of a range
+    such as ``2-3 days``), or None if it cannot be read.
+    """
+    match = _DURATION.search(text or '')
+    if not match:
+        return None
+    unit = _UNITS.get(match.group(3).lower())
+    if unit is None:
+        return None
+    return unit * float(match.group(2) or match.group(1))
+
+
+def turnaround(result_duration):
+    return parse_duration(result_duration) or default_turnaround()
+
+
+def claim_timeout():
+    return timedelta(minutes=getattr(settings, 'LAB_CLAIM_TIMEOUT_MINUTES', 120))
+
+
+def _claimable(now):
+    # Waiting, or claimed so long ago that the claim has lapsed
+    return Q(status=QUEUE_STATUS) | Q(status=CLAIMED_STATUS, claimed_at__lt=now - claim_timeout())
+
+
+def queue(lab, now=None):
+    """The tests of ``lab`` that can be claimed, most urgent first."""
+    from .models import TestBooking
+
+    return TestBooking.objects.filter(_claimable(now or timezone.now()), lab=lab).order_by('due_at', 'id')
+
+
+def next_due(lab, limit=10):
+    """The next ``limit`` tests due in ``lab``, without claiming them."""
+    return list(queue(lab).select_related('patient', 'test')[:limit])
+
+
+def claim_next(tech_profile, count=1):
+    """
+    Claim the next ``count`` tests due in the technician's lab and return
+    them (fewer if the queue runs short), most urgent first.
+    """
+    from .models import TestBooking
+
+    count = max(1, min(count, MAX_CLAIM))
+    now = timezone.now()
+
+    def claim():
+        candidates = queue(tech_profile.lab, now)
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True, of=('self',))
+        ids = list(candidates.values_list('id', flat=True)[:count])
+        # Still claimable: without row locks another claim may have taken
+        # some of them in the meantime
+        TestBooking.objects.filter(_claimable(now), id__in=ids).update(
+            status=CLAIMED_STATUS, claimed_by=tech_profile, claimed_at=now, updated_at=now,
+        )
+        return ids
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = claim()
+    else:
+        # No row locks to hold (SQLite): a read-then-write transaction would
+        # only make concurrent claims fail with "database is locked", and
+        # the conditional update alone keeps claims apart
+        ids = claim()
+    return list(
+        TestBooking.objects.filter(id__in=ids, claimed_by=tech_profile, claimed_at=now)
+        .select_related('patient', 'test').order_by('due_at', 'id')
+    )
+
+
+def release(tech_profile, booking_ids):
+    """Put the technician's unfinished claims back in the queue; returns how many."""
+    from .models import TestBooking
+
+    return TestBooking.objects.filter(
+        id__in=booking_ids, claimed_by=tech_profile, status=CLAIMED_STATUS,
+    ).update(status=QUEUE_STATUS, claimed_by=None, claimed_at=None, updated_at=timezone.now())
+
+
+def refresh_due_at(test):
+    """Recompute the due times of the open bookings of ``test`` after its duration changed."""
+    from django.db.models import F
+
+    from .models import TestBooking
+
+    return TestBooking.objects.filter(
+        test=test, status__in=['Pending Payment', QUEUE_STATUS, CLAIMED_STATUS],
+    ).update(due_at=F('created_at') + turnaround(test.result_duration))
@@ -0,0 +1,141 @@
+"""
+Result entry for lab technicians.
+
+The results page is a grid: one row per booking with a result value and a
+status. ``entries_from_post()`` reads the rows of a submitted grid and
+``save_results()`` saves them as a batch. Every row is checked in memory
+against the locked bookings first (only Booked and In Progress bookings
+take entries); a grid with any invalid row saves
+nothing and reports the errors by booking id. A valid grid is written in
+one transaction with one ``bulk_create`` for the ``LabResult`` rows
+(typed and flagged by ``core.lab_values.classify()``) and one
+``bulk_update`` for the booking statuses, however many rows it has.
+
+Saving a single row (the per-row Save button) is a batch of one.
+"""
+
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lab_queue import CLAIMED_STATUS, QUEUE_STATUS
+from .lab_values import classify
+
+
+# Statuses of the bookings that take results (queued or claimed from the
+# lab work queue); unpaid, cancelled and completed tests are not edited
+# from the grid
+OPEN_STATUSES = (QUEUE_STATUS, CLAIMED_STATUS)
+
+# Statuses a technician can set from the grid
+ENTRY_STATUSES = OPEN_STATUSES + ('Completed',)
+
+ResultEntry = namedtuple('ResultEntry', 'booking_id value status')
+
+# bookings: the bookings updated; results: the LabResult rows created;
+# errors: {booking_id: message}, with None for errors not tied to a row
+ResultBatch = namedtuple('ResultBatch', 'bookings results errors')
+
+
+def entries_from_post(data, booking_ids=None):
+    """
+    The ``ResultEntry`` rows of a submitted results grid (``result_<id>``
+    and ``status_<id>`` fields), only those in ``booking_ids`` if given.
+    """
+    entries = {}
+    for key in data:
+        if not key.startswith('status_'):
+            continue
+        try:
+            booking_id = int(key[len('status_'):])
+        except ValueError:
+            continue
+        if booking_ids is not None and booking_id not in booking_ids:
+            continue
+        entries[booking_id] = ResultEntry(
+            booking_id=booking_id,
+            value=data.get(f'result_{booking_id}', '').strip(),
+            status=data.get(key, ''),
+        )
+    return entries
+
+
+def _check(entry, booking, max_length):
+    if booking is None:
+        return "Booking not found."
+    if booking.status == 'Completed':
+        return "A result was already submitted for this test."
+    if booking.status not in OPEN_STATUSES:
+        return f"Results cannot be entered for a {booking.status.lower()} test."
+    if entry.status not in ENTRY_STATUSES:
+        return "Choose a valid status."
+    if entry.value and entry.status != 'Completed':
+        return "Mark the test as completed to save its result."
+    if len(entry.value) > max_length:
+        return f"Results are at most {max_length} characters."
+    return None
+
+
+def save_results(tech_profile, entries):
+    """
+    Save the ``entries`` (``{booking_id: ResultEntry}``) of bookings in the
+    technician's lab and return a ``ResultBatch``. Rows that change
+    nothing (same status, no value) are skipped.
+    """
+    from .models import DoctorProfile, LabResult, TestBooking
+
+    max_length = LabResult._meta.get_field('test_value').max_length
+    with transaction.atomic():
+        bookings = {
+            booking.id: booking
+            for booking in TestBooking.objects.select_for_update(of=('self',)).filter(
+                lab=tech_profile.lab, id__in=list(entries),
+            ).select_related('patient', 'test')
+        }
+
+        errors = {}
+        changed = []
+        for booking_id, entry in entries.items():
+            booking = bookings.get(booking_id)
+            error = _check(entry, booking, max_length)
+            if error:
+                errors[booking_id] = error
+            elif entry.value or entry.status != booking.status:
+                changed.append((booking, entry))
+
+        with_results = [(booking, entry) for booking, entry in changed if entry.value]
+        doctor = DoctorProfile.objects.first() if with_results else None
+        if with_results and doctor is None:
+            errors[None] = "No doctor is available to sign the results."
+        if errors:
+            return ResultBatch(bookings=[], results=[], errors=errors)
+
+        today = timezone.localdate()
+        results = LabResult.objects.bulk_create(classify([
+            LabResult(
+                patient=booking.patient,
+                doctor=doctor,
+                lab_technician=tech_profile,
+                test_name=booking.test.test_name,
+                test_code=booking.test.test_code or '',
+                test_value=entry.value,
+                normal_range='',
+                # Until a reference range flags it Normal or Abnormal
+                result_status='Pending',
+                remarks='',
+                test_date=today,
+            )
+            for booking, entry in with_results
+        ]), batch_size=500)
+
+        now = timezone.now()
+        for booking, entry in changed:
+            booking.status = entry.status
+            booking.updated_at = now
+        # The search documents of a booking do not include its status, so
+        # skipping post_save leaves nothing to reindex
+        TestBooking.objects.bulk_update(
+            [booking for booking, _ in changed], ['status', 'updated_at'], batch_size=500,
+        )
+    return ResultBatch(bookings=[booking for booking, _ in changed], results=results, errors={})
@@ -0,0 +1,105 @@
+"""
+Lab result time series for trend charts.
+
+``patient_series()`` returns a patient's numeric results grouped by test
+(the test code, or the test name for results without one) as parallel
+``dates`` / ``values`` arrays, oldest first. It reads the results in
+``(patient, test_code, test_date)`` order, which the
+``core_labresult_trend_idx`` index serves directly.
+
+With ``max_points`` a long series is downsampled with Largest Triangle
+Three Buckets (LTTB): the first and last readings are kept, and from each
+bucket in between the reading that forms the largest triangle with the
+previous pick and the next bucket's average. That keeps the peaks and dips
+a clinician looks for while a chart of a chronic patient's hundreds of
+readings gets only ``max_points``.
+"""
+
+MIN_POINTS = 3
+
+
+def lttb_indices(xs, ys, threshold):
+    """Indices of the ``threshold`` points of ``(xs, ys)`` that LTTB keeps."""
+    count = len(xs)
+    if threshold >= count or threshold < MIN_POINTS:
+        return list(range(count))
+
+    bucket_size = (count - 2) / (threshold - 2)
+    picked = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket (the last point for the last bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        span = next_end - next_start
+        average_x = sum(xs[next_start:next_end]) / span
+        average_y = sum(ys[next_start:next_end]) / span
+
+        previous_x, previous_y = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs(
+                (previous_x - average_x) * (ys[index] - previous_y)
+                - (previous_x - xs[index]) * (average_y - previous_y)
+            )
+            if area > best_area:
+                best, best_area = index, area
+        picked.append(best)
+        previous = best
+    picked.append(count - 1)
+    return picked
+
+
+def _series(key, rows, max_points):
+    test_code, test_name = rows[-1][0], rows[-1][1]
+    dates = [row[2] for row in rows]
+    values = [row[3] for row in rows]
+    if max_points:
+        keep = lttb_indices([date.toordinal() for date in dates], values, max_points)
+        dates = [dates[index] for index in keep]
+        values = [values[index] for index in keep]
+    unit, low, high = rows[-1][4:7]
+    return {
+        'key': key,
+        'test_code': test_code,
+        'test_name': test_name,
+        # From the latest reading
+        'unit': unit,
+        'reference_low': low,
+        'reference_high': high,
+        'count': len(rows),
+        'dates': [date.isoformat() for date in dates],
+        'values': values,
+    }
+
+
+def patient_series(patient, tests=None, start=None, end=None, max_points=None):
+    """
+    ``[{'key', 'test_code', 'test_name', 'unit', 'reference_low',
+    'reference_high', 'count', 'dates', 'values'}, ...]`` of the numeric
+    results of ``patient``, one entry per test, optionally only for the
+    ``tests`` (codes or names) and dates ``start`` to ``end``. ``count`` is
+    the number of readings before downsampling to ``max_points``.
+    """
+    from django.db.models import Q
+
+    from .models import LabResult
+
+    results = LabResult.objects.filter(patient=patient, numeric_value__isnull=False)
+    if tests:
+        results = results.filter(Q(test_code__in=tests) | Q(test_code='', test_name__in=tests))
+    if start:
+        results = results.filter(test_date__gte=start)
+    if end:
+        results = results.filter(test_date__lte=end)
+    rows = results.order_by('test_code', 'test_date', 'id').values_list(
+        'test_code', 'test_name', 'test_date', 'numeric_value', 'unit', 'reference_low', 'reference_high',
+    )
+
+    grouped = {}
+    for row in rows.iterator(chunk_size=2000):
+        grouped.setdefault(row[0] or row[1], []).append(row)
+    return [_series(key, grouped[key], max_points) for key in sorted(grouped, key=str.lower)]
@@ -0,0 +1,219 @@
+"""
+Typed lab result values and abnormal flags.
+
+``LabResult.test_value`` and ``normal_range`` stay the free text that was
+entered or imported; ``classify()`` fills the typed columns next to them:
+
+* ``numeric_value`` / ``unit`` - parsed from ``test_value`` (``5.4 mmol/L``,
+  ``<0.1``); left empty for values such as ``Positive``
+* ``reference_low`` / ``reference_high`` - parsed from ``normal_range``
+  (``4.0-5.6``, ``< 200``, ``>= 40``), or else taken from the
+  ``TestReferenceRange`` of the result's ``test_code`` when the units agree
+* ``flag`` - Low / Normal / High, and ``result_status`` becomes Normal or
+  Abnormal accordingly
+
+Flags are computed for a whole batch of results at once, with NumPy array
+comparisons when NumPy is installed and a plain loop otherwise.
+``backfill()`` (the ``backfill_lab_values`` command) classifies existing
+results in chunks.
+"""
+
+import math
+import re
+
+from django.db import transaction
+
+try:
+    import numpy as np
+except ImportError:  # optional; flags are then computed in a Python loop
+    np = None
+
+
+FLAG_LOW = 'Low'
+FLAG_NORMAL = 'Normal'
+FLAG_HIGH = 'High'
+
+# Flag of each code computed by compute_flags()
+_FLAGS = ('', FLAG_LOW, FLAG_NORMAL, FLAG_HIGH)
+if np is not None:
+    _FLAGS = np.array(_FLAGS, dtype=object)
+
+# LabResult.result_status for each flag
+RESULT_STATUS = {
+    FLAG_LOW: 'Abnormal',
+    FLAG_NORMAL: 'Normal',
+    FLAG_HIGH: 'Abnormal',
+}
+
+TYPED_FIELDS = ['test_code', 'numeric_value', 'unit', 'reference_low', 'reference_high', 'flag', 'result_status']
+
+_NUMBER = r'[-+]?(?:\d+(?:[.,]\d+)?|[.,]\d+)'
+_VALUE = re.compile(rf'^(?:[<>]=?|[≤≥])?\s*({_NUMBER})\s*((?![eE][-+]?\d)[A-Za-zµμ%/].*)?$')
+_BETWEEN = re.compile(rf'^({_NUMBER})\s*(?:-|–|—|to)\s*({_NUMBER})\s*(.*)$', re.IGNORECASE)
+_BELOW = re.compile(rf'^(?:<=?|≤|up\s+to|below)\s*({_NUMBER})\s*(.*)$', re.IGNORECASE)
+_ABOVE = re.compile(rf'^(?:>=?|≥|above)\s*({_NUMBER})\s*(.*)$', re.IGNORECASE)
+
+
+def _number(text):
+    return float(text.replace(',', '.'))
+
+
+def _unit(text, max_length=20):
+    return (text or '').strip()[:max_length]
+
+
+def parse_value(text):
+    """``(number, unit)`` of a free-text result; number is None if not numeric."""
+    match = _VALUE.match((text or '').strip())
+    if not match:
+        return None, ''
+    return _number(match.group(1)), _unit(match.group(2))
+
+
+def parse_range(text):
+    """``(low, high, unit)`` of a free-text normal range; missing bounds are None."""
+    text = (text or '').strip()
+    match = _BETWEEN.match(text)
+    if match:
+        return _number(match.group(1)), _number(match.group(2)), _unit(match.group(3))
+    match = _BELOW.match(text)
+    if match:
+        return None, _number(match.group(1)), _unit(match.group(2))
+    match = _ABOVE.match(text)
+    if match:
+        return _number(match.group(1)), None, _unit(match.group(2))
+    return None, None, ''
+
+
+def compute_flags(values, lows, highs):
+    """
+    The flag of each value against its bounds, or '' where the value is
+    missing or both bounds are. Missing numbers are NaN.
+    """
+    if np is not None:
+        value, low, high = (np.fromiter(column, dtype=float, count=len(column)) for column in (values, lows, highs))
+        known = ~np.isnan(value) & ~(np.isnan(low) & np.isnan(high))
+        codes = np.zeros(len(value), dtype=np.int8)
+        codes[known] = 2
+        # Comparisons with NaN (no bound) are False
+        codes[known & (value < low)] = 1
+        codes[known & (value > high)] = 3
+        return _FLAGS[codes].tolist()
+
+    flags = []
+    for value, low, high in zip(values, lows, highs):
+        if math.isnan(value) or (math.isnan(low) and math.isnan(high)):
+            flags.append('')
+        elif value < low:
+            flags.append(FLAG_LOW)
+        elif value > high:
+            flags.append(FLAG_HIGH)
+        else:
+            flags.append(FLAG_NORMAL)
+    return flags
+
+
+def _format_bound(value):
+    return f'{value:g}'
+
+
+def format_range(low, high, unit=''):
+    if low is not None and high is not None:
+        text = f'{_format_bound(low)}-{_format_bound(high)}'
+    elif high is not None:
+        text = f'< {_format_bound(high)}'
+    elif low is not None:
+        text = f'> {_format_bound(low)}'
+    else:
+        return ''
+    return f'{text} {unit}'.strip()
+
+
+def _or_nan(number):
+    return math.nan if number is None else number
+
+
+def _units_agree(unit, reference_unit):
+    return not unit or not reference_unit or unit.lower() == reference_unit.lower()
+
+
+def classify(results):
+    """
+    Fill the typed columns and flag of ``results`` (LabResult instances,
+    saved or not) in place, with one query for their reference ranges.
+    Results whose flag cannot be computed keep their ``result_status``.
+    """
+    from .models import TestReferenceRange
+
+    results = list(results)
+    codes = {result.test_code for result in results if result.test_code}
+    references = TestReferenceRange.objects.filter(test_code__in=codes).in_bulk(field_name='test_code') if codes else {}
+
+    values, lows, highs = [], [], []
+    for result in results:
+        value, unit = parse_value(result.test_value)
+        low, high, range_unit = parse_range(result.normal_range)
+        unit = unit or range_unit
+        reference = references.get(result.test_code)
+        if low is None and high is None and reference is not None and _units_agree(unit, reference.unit):
+            low, high = reference.low, reference.high
+            unit = unit or reference.unit
+            if not result.normal_range:
+                result.normal_range = format_range(low, high, reference.unit)
+
+        result.numeric_value = value
+        result.unit = unit
+        result.reference_low = low
+        result.reference_high = high
+        values.append(_or_nan(value))
+        lows.append(_or_nan(low))
+        highs.append(_or_nan(high))
+
+    for result, flag in zip(results, compute_flags(values, lows, highs)):
+        result.flag = flag
+        if flag:
+            result.result_status = RESULT_STATUS[flag]
+    return results
+
+
+def test_codes_by_name():
+    """``{test name: test code}`` of the diagnostic tests that have a code."""
+    from .models import DiagnosticTest
+
+    return dict(
+        DiagnosticTest.objects.exclude(test_code__isnull=True).exclude(test_code='')
+        .order_by('-id').values_list('test_name', 'test_code')
+    )
+
+
+def backfill(chunk_size=2000, recompute=False, on_chunk=None):
+    """
+    Classify existing results ``chunk_size`` at a time, in id order, and
+    return how many were updated. Only results never classified (no test
+    code and no typed value) are touched unless ``recompute``. Results
+    without a test code get the code of the diagnostic test of that name.
+    ``on_chunk(count, last_id)`` is called after each chunk.
+    """
+    from .models import LabResult
+
+    codes = test_codes_by_name()
+    results = LabResult.objects.order_by('id')
+    if not recompute:
+        results = results.filter(test_code='', numeric_value__isnull=True)
+
+    updated = 0
+    last_id = 0
+    while True:
+        chunk = list(results.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        for result in chunk:
+            result.test_code = result.test_code or codes.get(result.test_name, '')
+        classify(chunk)
+        with transaction.atomic():
+            LabResult.objects.bulk_update(chunk, TYPED_FIELDS + ['normal_range'], batch_size=chunk_size)
+        updated += len(chunk)
+        last_id = chunk[-1].id
+        if on_chunk is not None:
+            on_chunk(updated, last_id)
+    return updated
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.lab_values import backfill, np
+
+
+class Command(BaseCommand):
+    help = (
+        "Parse the free-text value and normal range of existing lab results "
+        "into their numeric, unit and reference columns and compute their "
+        "Low / Normal / High flags, a chunk at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--recompute', action='store_true', help="Reclassify results that were classified already")
+
+    def handle(self, *args, **options):
+        if np is None:
+            self.stdout.write("NumPy is not installed; computing flags without it")
+
+        def progress(count, last_id):
+            self.stdout.write(f"{count} result(s) classified (up to id {last_id})")
+
+        count = backfill(options['chunk_size'], options['recompute'], on_chunk=progress)
+        self.stdout.write(f"Done: {count} result(s) classified")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.receipts import backfill_receipts
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and store the receipts of Paid payments that have none, such "
+        "as payments marked Paid before receipts were stored, a chunk at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        def progress(count, last_id):
+            self.stdout.write(f"{count} receipt(s) stored (up to payment id {last_id})")
+
+        count = backfill_receipts(options['chunk_size'], on_chunk=progress)
+        self.stdout.write(f"Done: {count} receipt(s) stored")
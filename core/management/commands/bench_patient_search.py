@@ -0,0 +1,100 @@
+import random
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.patient_search import SQLiteFTSBackend, phone_tokens
+
+
+FIRST_NAMES = [
+    'Aarav', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Meera', 'Nikhil',
+    'Priya', 'Rahul', 'Ravi', 'Rohan', 'Saanvi', 'Sneha', 'Tara', 'Vikram',
+]
+LAST_NAMES = [
+    'Bose', 'Das', 'Gupta', 'Iyer', 'Joshi', 'Kumar', 'Menon', 'Nair',
+    'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh', 'Thomas', 'Verma',
+]
+
+QUERIES = ['ravi', 'priya sharma', 'nai', '98450', 'user12345', 'vikram rao 9']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old icontains patient search (LIKE '%q%' over "
+        "core_patientprofile joined to auth_user) with the FTS5 index, on a "
+        "synthetic in-memory SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def _populate(self, db, count, seed):
+        rng = random.Random(seed)
+        db.execute("CREATE TABLE auth_user (id INTEGER PRIMARY KEY, email TEXT)")
+        db.execute(
+            "CREATE TABLE core_patientprofile ("
+            "id INTEGER PRIMARY KEY, user_id INTEGER, full_name TEXT, phone TEXT)"
+        )
+        db.execute(
+            "CREATE VIRTUAL TABLE core_patient_fts USING fts5("
+            "name, phone, email, tokenize='unicode61', prefix='2 3')"
+        )
+
+        batch = []
+        for pk in range(1, count + 1):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            phone = f"+91 9{rng.randrange(10 ** 8, 10 ** 9)}"
+            batch.append((pk, name, phone, f"user{pk}@example.com"))
+            if len(batch) >= 50_000 or pk == count:
+                db.executemany("INSERT INTO auth_user VALUES (?, ?)", [(r[0], r[3]) for r in batch])
+                db.executemany("INSERT INTO core_patientprofile VALUES (?, ?, ?, ?)",
+                               [(r[0], r[0], r[1], r[2]) for r in batch])
+                db.executemany("INSERT INTO core_patient_fts (rowid, name, phone, email) VALUES (?, ?, ?, ?)",
+                               [(r[0], r[1], phone_tokens(r[2]), r[3]) for r in batch])
+                batch = []
+        db.commit()
+
+    @staticmethod
+    def _like_search(db, query):
+        where, params = [], []
+        for term in query.split():
+            where.append("(p.full_name LIKE ? OR p.phone LIKE ? OR u.email LIKE ?)")
+            params += [f'%{term}%'] * 3
+        return db.execute(
+            "SELECT p.id FROM core_patientprofile p JOIN auth_user u ON u.id = p.user_id "
+            f"WHERE {' AND '.join(where)} ORDER BY p.full_name LIMIT 10",
+            params,
+        ).fetchall()
+
+    @staticmethod
+    def _fts_search(db, query):
+        return db.execute(
+            "SELECT rowid FROM core_patient_fts WHERE core_patient_fts MATCH ? "
+            "ORDER BY bm25(core_patient_fts, ?, ?, ?) LIMIT 10",
+            [SQLiteFTSBackend.match_expression(query), *SQLiteFTSBackend.WEIGHTS],
+        ).fetchall()
+
+    def _time(self, search, db, query, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            search(db, query)
+        return (time.perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        db = sqlite3.connect(':memory:')
+        start = time.perf_counter()
+        self._populate(db, options['patients'], options['seed'])
+        self.stdout.write(
+            f"Built {options['patients']} patients in {time.perf_counter() - start:.1f}s"
+        )
+
+        repeat = options['repeat']
+        self.stdout.write(f"{'query':<16}{'icontains ms':>14}{'fts5 ms':>10}")
+        for query in QUERIES:
+            like_ms = self._time(self._like_search, db, query, repeat)
+            fts_ms = self._time(self._fts_search, db, query, repeat)
+            self.stdout.write(f"{query:<16}{like_ms:>14.2f}{fts_ms:>10.2f}")
+        db.close()
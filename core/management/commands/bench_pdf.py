@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import pdf_reports
+
+
+SAMPLE_SPEC = {
+    'title': 'LAB RESULT REPORT',
+    'sections': [
+        {'table': {
+            'rows': [
+                ['Patient Name:', 'Sample Patient'],
+                ['Gender:', 'Female'],
+                ['Date of Birth:', '1980-04-12'],
+                ['Phone:', '+91 98765 43210'],
+                ['Test Date:', '19-10-2026'],
+            ],
+            'col_widths': [2, 4],
+            'style': 'info',
+        }},
+        {'heading': 'TEST RESULTS', 'table': {
+            'rows': [['Test Name', 'Result Value', 'Normal Range', 'Status']]
+            + [['HbA1c', '6.4', '4.0-5.6', 'Abnormal']] * 5,
+            'col_widths': [2, 1.5, 1.5, 1],
+            'style': 'data',
+            'highlight': [{'cell': [3, 1], 'color': '#f59e0b'}],
+        }},
+        {'heading': 'REMARKS', 'paragraphs': ['Repeat test in three months.']},
+        {'heading': 'AUTHORIZED BY', 'table': {
+            'rows': [['Doctor:', 'Dr. Sample Doctor'], ['Lab Technician:', 'Sample Tech']],
+            'col_widths': [2, 4],
+            'style': 'plain',
+        }},
+    ],
+}
+
+
+def _reset_style_caches():
+    pdf_reports.get_paragraph_styles.cache_clear()
+    pdf_reports.get_table_styles.cache_clear()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-document CPU time of PDF rendering with styles rebuilt "
+        "for every document (the old per-view behaviour) versus the shared, "
+        "prebuilt styles in core.pdf_reports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=300)
+
+    def _time(self, count, before_each=None, work=None):
+        start = time.process_time()
+        for _ in range(count):
+            if before_each:
+                before_each()
+            work()
+        return (time.process_time() - start) / count * 1000
+
+    def handle(self, *args, **options):
+        count = options['documents']
+
+        # Warm up imports, fonts and caches
+        pdf_reports.render_report(SAMPLE_SPEC)
+
+        def build_styles():
+            pdf_reports.get_paragraph_styles()
+            pdf_reports.get_table_styles()
+
+        styles_cold = self._time(count, _reset_style_caches, build_styles)
+        styles_warm = self._time(count, None, build_styles)
+        render_cold = self._time(count, _reset_style_caches, lambda: pdf_reports.render_report(SAMPLE_SPEC))
+        render_warm = self._time(count, None, lambda: pdf_reports.render_report(SAMPLE_SPEC))
+
+        self.stdout.write(f"Documents rendered per case: {count}")
+        self.stdout.write(f"Style setup, rebuilt per document: {styles_cold:.3f} ms")
+        self.stdout.write(f"Style setup, prebuilt:             {styles_warm:.3f} ms")
+        self.stdout.write(f"Full render, rebuilt styles:       {render_cold:.3f} ms/doc")
+        self.stdout.write(f"Full render, prebuilt styles:      {render_warm:.3f} ms/doc")
+        saved = render_cold - render_warm
+        self.stdout.write(self.style.SUCCESS(
+            f"CPU saved per document: {saved:.3f} ms ({saved / render_cold * 100:.1f}%)"
+        ))
@@ -0,0 +1,112 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from core import render_pool
+from core.pdf_reports import render_report
+
+
+def _burst_spec(rows):
+    return {
+        'title': 'Lab Report - Benchmark',
+        'sections': [{'heading': 'Test Results', 'table': {
+            'rows': [['Patient', 'Test Name', 'Result Status', 'Date']]
+            + [[f'Patient {i}', 'Complete Blood Count', 'Normal', '19-10-2026'] for i in range(rows)],
+            'col_widths': [1.5, 2, 1, 1.5],
+            'style': 'data',
+            'repeat_rows': 1,
+        }}],
+    }
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure page-view latency while a burst of concurrent PDF renders "
+        "runs in the same process, rendering inline on request threads versus "
+        "in the render process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--downloads', type=int, default=50)
+        parser.add_argument('--rows', type=int, default=400, help="Table rows per PDF")
+        parser.add_argument('--url', default='/', help="Page used as the 'normal' request")
+
+    def _measure(self, url, render, downloads, spec):
+        client = Client()
+        latencies = []
+        failures = []
+        stop = threading.Event()
+
+        def page_views():
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        def download():
+            try:
+                render(spec)
+            except render_pool.RenderUnavailable:
+                failures.append(1)
+
+        viewer = threading.Thread(target=page_views)
+        viewer.start()
+        time.sleep(0.2)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=download) for _ in range(downloads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        burst_seconds = time.perf_counter() - started
+
+        stop.set()
+        viewer.join()
+        return latencies, burst_seconds, len(failures)
+
+    def _report(self, label, latencies, burst_seconds, rejected):
+        self.stdout.write(
+            f"{label:<24} page views={len(latencies):<5} "
+            f"p50={statistics.median(latencies):7.1f} ms  "
+            f"p99={_percentile(latencies, 99):7.1f} ms  "
+            f"burst={burst_seconds:5.1f} s  rejected={rejected}"
+        )
+
+    def handle(self, *args, **options):
+        # The test client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+            self._run(options)
+
+    def _run(self, options):
+        downloads = options['downloads']
+        spec = _burst_spec(options['rows'])
+        url = options['url']
+
+        Client().get(url)  # warm up templates
+        render_report(spec)
+
+        baseline, _, _ = self._measure(url, lambda s: None, 0, spec)
+        self._report('No burst', baseline, 0, 0)
+
+        inline = self._measure(url, render_report, downloads, spec)
+        self._report('Burst, inline render', *inline)
+
+        # Let the whole burst queue up so nothing is rejected; the normal
+        # limit exists to shed load, not to shape this measurement.
+        with override_settings(RENDER_POOL_MAX_PENDING=downloads):
+            render_pool.shutdown_pool()
+            render_pool.render_pdf(spec)  # start the worker processes
+            pooled = self._measure(url, render_pool.render_pdf, downloads, spec)
+            render_pool.shutdown_pool()
+        self._report('Burst, process pool', *pooled)
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.patient_dedup import LIKELY, duplicate_clusters
+
+
+class Command(BaseCommand):
+    help = (
+        "Score existing patients that share a blocking key (phone, email "
+        "local part, or date of birth + name Soundex) and list the clusters "
+        "that are probably the same person."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-score', type=float, default=LIKELY)
+        parser.add_argument('--json', action='store_true', help="Write the clusters as JSON")
+
+    def handle(self, *args, **options):
+        clusters = duplicate_clusters(options['min_score'])
+
+        if options['json']:
+            self.stdout.write(json.dumps([
+                {
+                    'score': score,
+                    'patients': [
+                        {'id': row['id'], 'name': row['full_name'], 'phone': row['phone'],
+                         'dob': row['dob'].isoformat() if row['dob'] else None}
+                        for row in members
+                    ],
+                }
+                for score, members in clusters
+            ], indent=2))
+            return
+
+        for score, members in clusters:
+            self.stdout.write(f"score {score:.2f}")
+            for row in members:
+                self.stdout.write(
+                    f"  #{row['id']:<8} {row['full_name']:<30} {row['phone']:<16} {row['dob'] or ''}"
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(clusters)} duplicate cluster(s), "
+            f"{sum(len(members) for _, members in clusters)} patients"
+        ))
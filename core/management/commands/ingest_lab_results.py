@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.analyzer_ingest import IngestFileError, ingest_results, text_stream
+from core.models import LabTechnicianProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a lab analyzer result file (CSV or tab/semicolon/pipe "
+        "delimited, with a header line) as lab results of the technician's "
+        "lab. Lines that cannot be imported are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Result file, or - for standard input")
+        parser.add_argument('--technician', required=True, help="Username of the lab technician importing the file")
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        try:
+            tech_profile = LabTechnicianProfile.objects.select_related('lab').get(
+                user__username=options['technician'],
+            )
+        except LabTechnicianProfile.DoesNotExist:
+            raise CommandError(f"No lab technician {options['technician']!r}.")
+        if tech_profile.lab is None:
+            raise CommandError("The technician has no lab assigned.")
+
+        def report(error):
+            self.stderr.write(f"line {error.line}: {error.message}")
+
+        try:
+            binary = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+            with text_stream(binary, options['encoding']) as stream:
+                result = ingest_results(stream, tech_profile, on_error=report)
+        except IngestFileError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        self.stdout.write(
+            f"Read {result.lines} line(s): {result.created} result(s) imported, "
+            f"{result.error_count} line(s) skipped"
+        )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.webhook_inbox import process_inbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the payment gateway webhooks waiting in the inbox, oldest "
+        "first. Runs until stopped, polling for new events, unless --once "
+        "is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the inbox and exit")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls of an empty inbox")
+
+    def handle(self, *args, **options):
+        while True:
+            count = process_inbox()
+            if count:
+                self.stdout.write(f"Processed {count} webhook event(s)")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.global_search import rebuild
+from core.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the global search documents from patients, appointments, lab "
+        "bookings, payments and prescriptions (after bulk imports or updates)."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Global search rebuilt ({SearchDocument.objects.count()} documents)."
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.patient_search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the patient search index from PatientProfile (after bulk imports or updates)."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Patient search index rebuilt ({backend.name})."))
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_patientprofile_blood_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labresult',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='testbooking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
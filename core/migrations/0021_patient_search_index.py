@@ -0,0 +1,73 @@
+# Generated by Django 6.0 on 2026-10-19 14:10
+
+import re
+
+from django.db import migrations
+
+
+def _phone_tokens(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    tokens = [digits] if digits else []
+    if len(digits) > 10:
+        tokens.append(digits[-10:])
+    return ' '.join(tokens)
+
+
+def _rows(apps):
+    PatientProfile = apps.get_model('core', 'PatientProfile')
+    for pk, name, phone, email, user_email in PatientProfile.objects.values_list(
+        'id', 'full_name', 'phone', 'email', 'user__email'
+    ).iterator():
+        emails = ' '.join(sorted({e for e in (email, user_email) if e}))
+        yield pk, name or '', _phone_tokens(phone), emails
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS core_patient_fts USING fts5("
+                "name, phone, email, tokenize='unicode61', prefix='2 3')"
+            )
+            cursor.executemany(
+                "INSERT INTO core_patient_fts (rowid, name, phone, email) VALUES (%s, %s, %s, %s)",
+                list(_rows(apps)),
+            )
+        elif vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS core_patient_search ("
+                "patient_id integer PRIMARY KEY REFERENCES core_patientprofile (id) "
+                "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document text NOT NULL)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS core_patient_search_trgm "
+                "ON core_patient_search USING gin (document gin_trgm_ops)"
+            )
+            cursor.executemany(
+                "INSERT INTO core_patient_search (patient_id, document) VALUES (%s, %s)",
+                [(pk, ' '.join(filter(None, (name, phone, email))).lower())
+                 for pk, name, phone, email in _rows(apps)],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute("DROP TABLE IF EXISTS core_patient_fts")
+        elif vendor == 'postgresql':
+            cursor.execute("DROP TABLE IF EXISTS core_patient_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_testbooking_labresult_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
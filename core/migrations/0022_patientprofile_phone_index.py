@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-19 13:54
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A copy of the helpers of core.phones as of this migration, so later
+# changes to that module do not change what the migration does
+
+def normalize_phone(phone):
+    phone = (phone or '').strip()
+    digits = re.sub(r'\D', '', phone)
+    if not digits:
+        return ''
+    if phone.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) <= 10:
+        return '+' + getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '91') + digits
+    return '+' + digits
+
+
+def reversed_digits(phone_e164):
+    return phone_e164.lstrip('+')[::-1]
+
+
+def backfill_phone_index(apps, schema_editor):
+    PatientProfile = apps.get_model('core', 'PatientProfile')
+    batch = []
+    for patient in PatientProfile.objects.only('id', 'phone').iterator(chunk_size=2000):
+        patient.phone_e164 = normalize_phone(patient.phone)
+        patient.phone_reversed = reversed_digits(patient.phone_e164)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            PatientProfile.objects.bulk_update(batch, ['phone_e164', 'phone_reversed'])
+            batch = []
+    PatientProfile.objects.bulk_update(batch, ['phone_e164', 'phone_reversed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_patient_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientprofile',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='phone_reversed',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(backfill_phone_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-19 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_patientprofile_phone_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['-appointment_date', '-appointment_time', '-id'], name='core_appt_date_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(fields=['full_name', 'id'], name='core_patient_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-payment_date', '-id'], name='core_payment_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['doctor', '-created_at', '-id'], name='core_rx_doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(fields=['-created_at', '-id'], name='core_booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(fields=['lab', '-created_at', '-id'], name='core_booking_lab_created_idx'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 6.0 on 2026-10-19 14:03
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A copy of the key helpers of core.patient_dedup as of this migration, so
+# later changes to that module do not change what the migration does
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def soundex(word):
+    word = ''.join(ch for ch in word.lower() if 'a' <= ch <= 'z')
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for ch in word[1:]:
+        digit = SOUNDEX_CODES.get(ch, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_soundex(full_name):
+    words = [word.lower() for word in re.findall(r'[^\W\d_]+', full_name or '', re.UNICODE)]
+    if not words:
+        return ''
+    codes = {soundex(words[0]), soundex(words[-1])}
+    return ' '.join(sorted(code for code in codes if code))
+
+
+def email_local(email):
+    local, at, _ = (email or '').strip().lower().partition('@')
+    if not at:
+        return ''
+    return local.split('+', 1)[0].replace('.', '')[:64]
+
+
+def backfill_dedup_keys(apps, schema_editor):
+    PatientProfile = apps.get_model('core', 'PatientProfile')
+    batch = []
+    patients = PatientProfile.objects.only('id', 'full_name', 'email', 'user__email').select_related('user')
+    for patient in patients.iterator(chunk_size=2000):
+        patient.name_soundex = name_soundex(patient.full_name)
+        patient.email_local = email_local(patient.email or patient.user.email)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            PatientProfile.objects.bulk_update(batch, ['name_soundex', 'email_local'])
+            batch = []
+    PatientProfile.objects.bulk_update(batch, ['name_soundex', 'email_local'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientprofile',
+            name='email_local',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='name_soundex',
+            field=models.CharField(blank=True, editable=False, max_length=9),
+        ),
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(fields=['dob', 'name_soundex'], name='core_patient_dob_name_idx'),
+        ),
+        migrations.RunPython(backfill_dedup_keys, migrations.RunPython.noop),
+    ]
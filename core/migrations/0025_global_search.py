@@ -0,0 +1,195 @@
+# Generated by Django 6.0 on 2026-10-19 14:06
+
+import re
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+# A copy of the document builders of core.global_search as of this
+# migration, so later changes to that module do not change what the
+# migration does
+
+def phone_tokens(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    tokens = [digits] if digits else []
+    if len(digits) > 10:
+        tokens.append(digits[-10:])
+    return ' '.join(tokens)
+
+
+def _text(*parts):
+    return ' '.join(str(part) for part in parts if part).lower()
+
+
+def _patient_text(patient):
+    return _text(patient.full_name, phone_tokens(patient.phone))
+
+
+def patient_documents(queryset):
+    for patient in queryset.select_related('user').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'patient',
+            'entity_id': patient.id,
+            'patient_id': patient.id,
+            'title': patient.full_name,
+            'detail': patient.phone,
+            'text': _text(_patient_text(patient), patient.email or patient.user.email),
+            'sort_date': None,
+        }
+
+
+def appointment_documents(queryset):
+    day_position = Subquery(
+        queryset.model.objects
+        .filter(appointment_date=OuterRef('appointment_date'), id__lte=OuterRef('id'))
+        .values('appointment_date')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    appointments = queryset.select_related('patient').annotate(day_position=day_position)
+    for appointment in appointments.iterator(chunk_size=2000):
+        token = f"{appointment.appointment_date:%d%m}-{appointment.day_position or 0:03d}"
+        yield {
+            'entity_type': 'appointment',
+            'entity_id': appointment.id,
+            'patient_id': appointment.patient_id,
+            'title': f"{appointment.patient.full_name} · Token {token}",
+            'detail': f"{appointment.appointment_date:%d %b %Y} {appointment.appointment_time:%H:%M}",
+            'text': _text(token, appointment.id, _patient_text(appointment.patient)),
+            'sort_date': appointment.created_at,
+        }
+
+
+def lab_booking_documents(queryset):
+    for booking in queryset.select_related('patient', 'test', 'lab').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'lab_booking',
+            'entity_id': booking.id,
+            'patient_id': booking.patient_id,
+            'title': f"{booking.test.test_name} · {booking.patient.full_name}",
+            'detail': f"{booking.lab.name} · {booking.booking_date:%d %b %Y}",
+            'text': _text(
+                booking.id, booking.test.test_name, booking.test.test_code, booking.lab.name,
+                _patient_text(booking.patient),
+            ),
+            'sort_date': booking.created_at,
+        }
+
+
+def payment_documents(queryset):
+    for payment in queryset.select_related('patient').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'payment',
+            'entity_id': payment.id,
+            'patient_id': payment.patient_id,
+            'title': f"{payment.transaction_id or payment.id} · {payment.patient.full_name}",
+            'detail': f"₹{payment.amount} · {payment.payment_method} · {payment.payment_date:%d %b %Y}",
+            'text': _text(payment.transaction_id, payment.id, _patient_text(payment.patient)),
+            'sort_date': payment.payment_date,
+        }
+
+
+def prescription_documents(queryset):
+    for prescription in queryset.select_related('patient').iterator(chunk_size=2000):
+        yield {
+            'entity_type': 'prescription',
+            'entity_id': prescription.id,
+            'patient_id': prescription.patient_id,
+            'title': f"{prescription.medicine_name} · {prescription.patient.full_name}",
+            'detail': f"{prescription.dosage} · {prescription.frequency} · {prescription.created_at:%d %b %Y}",
+            'text': _text(prescription.medicine_name, _patient_text(prescription.patient)),
+            'sort_date': prescription.created_at,
+        }
+
+
+BUILDERS = {
+    'PatientProfile': patient_documents,
+    'Appointment': appointment_documents,
+    'TestBooking': lab_booking_documents,
+    'Payment': payment_documents,
+    'Prescription': prescription_documents,
+}
+
+
+def write_documents(documents, SearchDocument):
+    batch = []
+    for document in documents:
+        batch.append(SearchDocument(**document))
+        if len(batch) >= 2000:
+            SearchDocument.objects.bulk_create(batch)
+            batch = []
+    SearchDocument.objects.bulk_create(batch)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS core_search_fts USING fts5("
+                "text, content='core_searchdocument', content_rowid='id', "
+                "tokenize='unicode61', prefix='2 3')"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS core_searchdocument_ai AFTER INSERT ON core_searchdocument BEGIN "
+                "INSERT INTO core_search_fts (rowid, text) VALUES (new.id, new.text); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS core_searchdocument_ad AFTER DELETE ON core_searchdocument BEGIN "
+                "INSERT INTO core_search_fts (core_search_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+            )
+            cursor.execute(
+                "CREATE TRIGGER IF NOT EXISTS core_searchdocument_au AFTER UPDATE ON core_searchdocument BEGIN "
+                "INSERT INTO core_search_fts (core_search_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+                "INSERT INTO core_search_fts (rowid, text) VALUES (new.id, new.text); END"
+            )
+        elif vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS core_searchdocument_text_trgm "
+                "ON core_searchdocument USING gin (text gin_trgm_ops)"
+            )
+
+    SearchDocument = apps.get_model('core', 'SearchDocument')
+    for model_name, builder in BUILDERS.items():
+        model = apps.get_model('core', model_name)
+        write_documents(builder(model.objects.all()), SearchDocument)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            for trigger in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS core_searchdocument_{trigger}")
+            cursor.execute("DROP TABLE IF EXISTS core_search_fts")
+        elif vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS core_searchdocument_text_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_patient_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('patient', 'Patient'), ('appointment', 'Appointment'), ('lab_booking', 'Lab Booking'), ('payment', 'Payment'), ('prescription', 'Prescription')], max_length=20)),
+                ('entity_id', models.PositiveIntegerField()),
+                ('patient_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('title', models.CharField(max_length=255)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('text', models.TextField()),
+                ('sort_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entity_type', 'entity_id'), name='core_searchdoc_entity_uniq')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPaymentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('paid_count', models.PositiveIntegerField(default=0)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('pending_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('failed_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-19 15:40
+
+import secrets
+import time
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# A copy of the id format of core.transaction_ids as of this migration, so
+# later changes to that module do not change what the migration does: TXN
+# and 16 Crockford base32 characters of 48 bits of milliseconds, 20 bits of
+# process id and 12 bits of sequence
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+NODE_BITS = 20
+SEQUENCE_BITS = 12
+
+
+def encode(value):
+    chars = []
+    for _ in range(16):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return 'TXN' + ''.join(reversed(chars))
+
+
+def transaction_ids():
+    """Yield increasing ids for this migration run."""
+    node = secrets.randbits(NODE_BITS)
+    last_ms = 0
+    sequence = 0
+    while True:
+        now = time.time_ns() // 1_000_000
+        if now > last_ms:
+            last_ms, sequence = now, 0
+        elif sequence < (1 << SEQUENCE_BITS) - 1:
+            sequence += 1
+        else:
+            # Out of ids for this millisecond
+            continue
+        yield encode((last_ms << (NODE_BITS + SEQUENCE_BITS)) | (node << SEQUENCE_BITS) | sequence)
+
+
+def reissue_duplicate_transaction_ids(apps, schema_editor):
+    # The old random ids were not unique: give every payment but the first
+    # of a duplicated (or blank) id a new one before adding the index
+    Payment = apps.get_model('core', 'Payment')
+    Payment.objects.filter(transaction_id='').update(transaction_id=None)
+    duplicated = (
+        Payment.objects.exclude(transaction_id=None)
+        .values('transaction_id').annotate(count=Count('id')).filter(count__gt=1)
+        .values_list('transaction_id', flat=True)
+    )
+    new_ids = transaction_ids()
+    for transaction_id in list(duplicated):
+        for payment in Payment.objects.filter(transaction_id=transaction_id).order_by('id')[1:]:
+            payment.transaction_id = next(new_ids)
+            payment.save(update_fields=['transaction_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_payment_gateway_webhooks'),
+    ]
+
+    operations = [
+        migrations.RunPython(reissue_duplicate_transaction_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_payment_receipts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestReferenceRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=50, unique=True)),
+                ('unit', models.CharField(blank=True, max_length=20)),
+                ('low', models.FloatField(blank=True, null=True)),
+                ('high', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='flag',
+            field=models.CharField(blank=True, choices=[('Low', 'Low'), ('Normal', 'Normal'), ('High', 'High')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='reference_high',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='reference_low',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='test_code',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='unit',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(fields=['test_code', 'numeric_value'], name='core_labresult_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(fields=['patient', 'test_code', 'test_date'], name='core_labresult_trend_idx'),
+        ),
+    ]
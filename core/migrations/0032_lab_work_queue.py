@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-19 16:20
+
+import re
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+# A copy of core.lab_queue.turnaround() as of this migration, so later
+# changes to that module do not change what the migration does
+UNITS = {
+    'm': timedelta(minutes=1), 'min': timedelta(minutes=1), 'mins': timedelta(minutes=1),
+    'minute': timedelta(minutes=1), 'minutes': timedelta(minutes=1),
+    'h': timedelta(hours=1), 'hr': timedelta(hours=1), 'hrs': timedelta(hours=1),
+    'hour': timedelta(hours=1), 'hours': timedelta(hours=1),
+    'd': timedelta(days=1), 'day': timedelta(days=1), 'days': timedelta(days=1),
+    'w': timedelta(weeks=1), 'wk': timedelta(weeks=1), 'wks': timedelta(weeks=1),
+    'week': timedelta(weeks=1), 'weeks': timedelta(weeks=1),
+}
+
+DURATION = re.compile(r'(\d+(?:\.\d+)?)\s*(?:(?:-|–|to)\s*(\d+(?:\.\d+)?)\s*)?([a-z]+)', re.IGNORECASE)
+
+
+def turnaround(result_duration):
+    match = DURATION.search(result_duration or '')
+    unit = UNITS.get(match.group(3).lower()) if match else None
+    duration = unit * float(match.group(2) or match.group(1)) if unit is not None else None
+    return duration or timedelta(hours=getattr(settings, 'LAB_DEFAULT_TURNAROUND_HOURS', 24))
+
+
+def set_due_at(apps, schema_editor):
+    # One update per test, from its booking time and result duration
+    DiagnosticTest = apps.get_model('core', 'DiagnosticTest')
+    TestBooking = apps.get_model('core', 'TestBooking')
+    for test_id, result_duration in DiagnosticTest.objects.values_list('id', 'result_duration'):
+        TestBooking.objects.filter(test_id=test_id, due_at=None).update(
+            due_at=F('created_at') + turnaround(result_duration),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_lab_result_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbooking',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testbooking',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_bookings', to='core.labtechnicianprofile'),
+        ),
+        migrations.AddField(
+            model_name='testbooking',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(fields=['lab', 'status', 'due_at'], name='core_booking_queue_idx'),
+        ),
+        migrations.RunPython(set_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_lab_work_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testbooking',
+            name='status',
+            field=models.CharField(choices=[('Pending Payment', 'Pending Payment'), ('Booked', 'Booked'), ('In Progress', 'In Progress'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], default='Pending Payment', max_length=20),
+        ),
+    ]
@@ -4,6 +4,11 @@ from django.db import models
 from django.db import models
 from django.contrib.auth.models import User
 
+from .lab_queue import CLAIMED_STATUS, QUEUE_STATUS, turnaround
+from .patient_dedup import email_local, name_soundex
+from .phones import normalize_phone, reversed_digits
+from .transaction_ids import new_transaction_id
+
 # Create your models here.
 
 
@@ -15,6 +20,12 @@ class PatientProfile(models.Model):
     gender = models.CharField(max_length=10, blank=True)
     dob = models.DateField(null=True, blank=True)
     phone = models.CharField(max_length=15)
+    # Derived from phone on save (see core/phones.py), for caller lookup
+    phone_e164 = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
+    phone_reversed = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
+    # Duplicate detection blocking keys (see core/patient_dedup.py)
+    name_soundex = models.CharField(max_length=9, blank=True, editable=False)
+    email_local = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
     address = models.TextField(blank=True)
     status = models.CharField(max_length=20, default="Active")
     BLOOD_GROUP_CHOICES = [
@@ -30,6 +41,14 @@ class PatientProfile(models.Model):
         blank=True
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the patient lists
+            models.Index(fields=['full_name', 'id'], name='core_patient_name_id_idx'),
+            # Duplicate detection block: date of birth + name Soundex
+            models.Index(fields=['dob', 'name_soundex'], name='core_patient_dob_name_idx'),
+        ]
+
 
     @property
     def age(self):
@@ -42,6 +61,32 @@ class PatientProfile(models.Model):
             - ((today.month, today.day) < (self.dob.month, self.dob.day))
         )
     
+    def save(self, *args, **kwargs):
+        self.phone_e164 = normalize_phone(self.phone)
+        self.phone_reversed = reversed_digits(self.phone_e164)
+        self.name_soundex = name_soundex(self.full_name)
+        self.email_local = email_local(self.email or (self.user.email if self.user_id else ''))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'phone' in update_fields:
+                update_fields |= {'phone_e164', 'phone_reversed'}
+            if 'full_name' in update_fields:
+                update_fields.add('name_soundex')
+            if 'email' in update_fields:
+                update_fields.add('email_local')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored name and phone, so a save can tell whether the search
+        # documents copying them are stale (see index_search_document in signals)
+        if 'full_name' in field_names and 'phone' in field_names:
+            instance._saved_search_fields = (instance.full_name, instance.phone)
+        return instance
+
     def __str__(self):
         return self.full_name
 
@@ -114,6 +159,14 @@ class Appointment(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-appointment_date', '-appointment_time', '-id'],
+                name='core_appt_date_time_id_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.patient.full_name} - Dr. {self.doctor.user.get_full_name()} ({self.status})"
 
@@ -136,6 +189,11 @@ class Prescription(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Active')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', '-created_at', '-id'], name='core_rx_doctor_created_idx'),
+        ]
+
 #Labs
 class Lab(models.Model):
     STATUS_CHOICES = (
@@ -225,13 +283,24 @@ class DiagnosticTest(models.Model):
     def __str__(self):
         return f"{self.test_name} ({self.lab.name})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored duration, so a save can tell whether it changed (see
+        # refresh_booking_due_times in signals)
+        if 'result_duration' in field_names:
+            instance._saved_result_duration = instance.result_duration
+        return instance
+
 
 #Test Booking
 class TestBooking(models.Model):
 
     STATUS_CHOICES = [
         ('Pending Payment', 'Pending Payment'),
-        ('Booked', 'Booked'),
+        (QUEUE_STATUS, 'Booked'),
+        # Claimed by a technician from the lab work queue
+        (CLAIMED_STATUS, 'In Progress'),
         ('Completed', 'Completed'),
         ('Cancelled', 'Cancelled'),
     ]
@@ -250,6 +319,30 @@ class TestBooking(models.Model):
     result_file = models.FileField(upload_to='test_results/', null=True, blank=True)
     result_notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Lab work queue (see core/lab_queue.py)
+    due_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.ForeignKey(
+        LabTechnicianProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_bookings',
+    )
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='core_booking_created_idx'),
+            models.Index(fields=['lab', '-created_at', '-id'], name='core_booking_lab_created_idx'),
+            models.Index(fields=['lab', 'status', 'due_at'], name='core_booking_queue_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.due_at is None:
+            booked_at = self.created_at or timezone.now()
+            self.due_at = booked_at + turnaround(self.test.result_duration)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'due_at'}
+        super().save(*args, **kwargs)
 
 
 #Lab Results
@@ -264,11 +357,32 @@ class LabResult(models.Model):
     remarks = models.TextField()
     test_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Typed copy of the free-text value and range, filled by core/lab_values.py
+    FLAG_CHOICES = [
+        ('Low', 'Low'),
+        ('Normal', 'Normal'),
+        ('High', 'High'),
+    ]
+
+    test_code = models.CharField(max_length=50, blank=True)
+    numeric_value = models.FloatField(null=True, blank=True)
+    unit = models.CharField(max_length=20, blank=True)
+    reference_low = models.FloatField(null=True, blank=True)
+    reference_high = models.FloatField(null=True, blank=True)
+    # Blank when the value is not numeric or there is no reference range
+    flag = models.CharField(max_length=10, choices=FLAG_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['test_code', 'numeric_value'], name='core_labresult_value_idx'),
+            models.Index(fields=['patient', 'test_code', 'test_date'], name='core_labresult_trend_idx'),
+        ]
 
 
 from django.db import models
 from django.core.exceptions import ValidationError
-import uuid
 
 
 class Payment(models.Model):
@@ -324,12 +438,37 @@ class Payment(models.Model):
 
     payment_date = models.DateTimeField(auto_now_add=True)
 
+    # Time-ordered, see core/transaction_ids.py
     transaction_id = models.CharField(
         max_length=100,
+        unique=True,
         blank=True,
         null=True
     )
 
+    # Key of the form submission that paid it (see core/payments.py)
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    # The payment gateway's id for the charge under way (see core/payment_gateway.py)
+    gateway_reference = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-payment_date', '-id'], name='core_payment_date_id_idx'),
+        ]
+
     def clean(self):
         if not self.appointment and not self.test_booking:
             raise ValidationError(
@@ -343,15 +482,12 @@ class Payment(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.transaction_id:
-            self.transaction_id = str(uuid.uuid4()).replace('-', '').upper()[:12]
+            self.transaction_id = new_transaction_id()
 
         super().save(*args, **kwargs)
 
-        # 🔥 Auto update appointment status when payment is paid
-        if self.appointment and self.payment_status == "Paid":
-            if self.appointment.status == "Pending Payment":
-                self.appointment.status = "Scheduled"
-                self.appointment.save()
+        # Confirming the appointment / test booking paid for is done by
+        # core.payments.finalize_payment, once, in the same transaction
 
 
 
@@ -726,3 +862,114 @@ class DoctorAvailability(models.Model):
 
     def __str__(self):
         return f"{self.doctor} Availability"
+
+
+#Global Search
+class SearchDocument(models.Model):
+    """One searchable row, maintained by core/global_search.py"""
+
+    ENTITY_TYPES = [
+        ('patient', 'Patient'),
+        ('appointment', 'Appointment'),
+        ('lab_booking', 'Lab Booking'),
+        ('payment', 'Payment'),
+        ('prescription', 'Prescription'),
+    ]
+
+    entity_type = models.CharField(max_length=20, choices=ENTITY_TYPES)
+    entity_id = models.PositiveIntegerField()
+    patient_id = models.PositiveIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=255)
+    detail = models.CharField(max_length=255, blank=True)
+    # Lower-cased words to match: ids, tokens, names, phone digits, test and medicine names
+    text = models.TextField()
+    sort_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entity_type', 'entity_id'], name='core_searchdoc_entity_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type} #{self.entity_id}: {self.title}"
+
+
+#Payment Statistics
+class DailyPaymentSummary(models.Model):
+    """Payment counts and totals of one closed day, maintained by core/payment_stats.py"""
+
+    day = models.DateField(unique=True)
+    paid_count = models.PositiveIntegerField(default=0)
+    paid_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    pending_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    failed_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"Payments on {self.day}"
+
+
+#Payment Gateway Webhooks
+class WebhookEvent(models.Model):
+    """A webhook delivery from a payment gateway, applied by core/webhook_inbox.py"""
+
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processed', 'Processed'),
+        ('Failed', 'Failed'),
+    ]
+
+    gateway = models.CharField(max_length=30)
+    event_id = models.CharField(max_length=100)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    # Not processed before this time (retry backoff)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'event_id'], name='core_webhook_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='core_webhook_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.gateway} {self.event_type} {self.event_id}"
+
+
+#Payment Receipts
+class PaymentReceipt(models.Model):
+    """Receipt of a paid payment, rendered once by core/receipts.py"""
+
+    payment = models.OneToOneField('Payment', on_delete=models.CASCADE, related_name='receipt')
+    transaction_id = models.CharField(max_length=100, unique=True)
+    html = models.TextField()
+    issued_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Receipt {self.transaction_id}"
+
+
+#Lab Reference Ranges
+class TestReferenceRange(models.Model):
+    """Reference range of a test, for results that do not carry their own"""
+
+    test_code = models.CharField(max_length=50, unique=True)
+    unit = models.CharField(max_length=20, blank=True)
+    low = models.FloatField(null=True, blank=True)
+    high = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.test_code}: {self.low}-{self.high} {self.unit}".strip()
@@ -0,0 +1,138 @@
+"""
+Keyset (seek) pagination for the list views.
+
+Offset pagination (``LIMIT 50 OFFSET 5000``) still reads and discards
+every earlier row, so late pages get slower as tables grow. Here a page
+is instead addressed by the ordering key of its last (or first) row:
+
+    WHERE (payment_date, id) < (<last payment_date>, <last id>)
+    ORDER BY payment_date DESC, id DESC LIMIT 51
+
+which an index on the ordering columns answers in the same time for any
+page. The key travels in the query string as an opaque cursor
+(``?after=...`` for the next page, ``?before=...`` for the previous one),
+so links stay valid while rows are added.
+
+The ordering must end in a unique column (normally ``id`` / ``-id``) and
+its columns must be non-nullable.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _parse_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    """Key values of a cursor, or None if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(fields, values)
+        ]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def seek_filter(fields, values, forward):
+    """Rows strictly after (``forward``) or before the given key."""
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending == forward else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for (earlier, _), value in zip(fields[:index], values):
+            step &= Q(**{earlier: value})
+        condition |= step
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, fields, params, has_next, has_previous):
+        self.object_list = object_list
+        self.fields = fields
+        self.params = params
+        # Without rows there is no key to seek from
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, name) for name, _ in self.fields])
+
+    def _query(self, key, obj):
+        params = self.params.copy()
+        params[key] = self._cursor(obj)
+        return params.urlencode()
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_query(self):
+        """Query string of the next page (other filters kept)."""
+        return self._query('after', self.object_list[-1]) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.object_list[0]) if self.has_previous else ''
+
+
+def keyset_paginate(request, queryset, ordering, per_page=None):
+    """
+    Return one ``KeysetPage`` of ``queryset`` ordered by ``ordering``
+    (e.g. ``('-payment_date', '-id')``), positioned by the ``after`` /
+    ``before`` cursor in ``request.GET``.
+    """
+    per_page = per_page or getattr(settings, 'KEYSET_PAGE_SIZE', 50)
+    fields = _parse_ordering(ordering)
+
+    params = request.GET.copy()
+    after = params.pop('after', [None])[-1]
+    before = params.pop('before', [None])[-1]
+    cursor, forward = (after, True) if after else (before, False)
+
+    values = decode_cursor(cursor, queryset.model, fields) if cursor else None
+    if values is None:
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        return KeysetPage(rows[:per_page], fields, params, len(rows) > per_page, False)
+
+    if forward:
+        rows = list(queryset.filter(seek_filter(fields, values, True)).order_by(*ordering)[:per_page + 1])
+        return KeysetPage(rows[:per_page], fields, params, len(rows) > per_page, True)
+
+    reverse_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+    rows = list(queryset.filter(seek_filter(fields, values, False)).order_by(*reverse_ordering)[:per_page + 1])
+    page_rows = rows[:per_page][::-1]
+    return KeysetPage(page_rows, fields, params, True, len(rows) > per_page)
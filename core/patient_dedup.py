@@ -0,0 +1,255 @@
+"""
+Duplicate patient detection.
+
+Comparing a new registration with every patient is not feasible, so
+patients are grouped into blocks by cheap keys stored as indexed columns
+on ``PatientProfile`` and only patients sharing a block are compared:
+
+* ``phone_e164``                 - the normalized phone number (core/phones.py)
+* ``dob`` + ``name_soundex``     - date of birth plus the Soundex codes of
+                                   the first and last name, in either order
+* ``email_local``                - the part of the email before the ``@``,
+                                   lower-cased, without dots or ``+tags``
+
+Candidates from any block are then scored from 0 to 1 on name
+similarity and the agreeing / conflicting keys. ``find_duplicates()``
+answers the registration forms while the receptionist types;
+``duplicate_clusters()`` scores the existing registry for the
+``find_duplicate_patients`` management command.
+"""
+
+import re
+from collections import namedtuple
+from difflib import SequenceMatcher
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_date
+
+
+# Scores at or above POSSIBLE are shown as possible duplicates; at or above
+# LIKELY the front desk must confirm before registering a new patient
+POSSIBLE = 0.4
+LIKELY = 0.6
+
+# Candidates scored per lookup, and the largest block compared pairwise by
+# the batch job (bigger blocks are placeholder values such as a clinic phone)
+MAX_CANDIDATES = 50
+MAX_BLOCK_SIZE = 200
+
+BLOCKING_KEYS = ('phone_e164', 'email_local', ('dob', 'name_soundex'))
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+_NAME_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+Match = namedtuple('Match', 'id name phone score reasons')
+
+
+def soundex(word):
+    """American Soundex code of ``word`` ('Robert' -> 'R163')."""
+    word = ''.join(ch for ch in word.lower() if 'a' <= ch <= 'z')
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = _SOUNDEX_CODES.get(word[0], '')
+    for ch in word[1:]:
+        digit = _SOUNDEX_CODES.get(ch, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'h' and 'w' do not separate letters with the same code
+        if ch not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_words(full_name):
+    return [word.lower() for word in _NAME_RE.findall(full_name or '')]
+
+
+def name_soundex(full_name):
+    """Soundex of the first and last name, sorted so word order does not matter."""
+    words = name_words(full_name)
+    if not words:
+        return ''
+    codes = {soundex(words[0]), soundex(words[-1])}
+    return ' '.join(sorted(code for code in codes if code))
+
+
+def email_local(email):
+    """Comparable local part of an email address, or ''."""
+    local, at, _ = (email or '').strip().lower().partition('@')
+    if not at:
+        return ''
+    return local.split('+', 1)[0].replace('.', '')[:64]
+
+
+def name_similarity(a, b):
+    a, b = ' '.join(sorted(name_words(a))), ' '.join(sorted(name_words(b)))
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score_pair(a, b):
+    """
+    (score, reasons) for two patients given as dicts with ``full_name``,
+    ``phone_e164``, ``email_local`` and ``dob``.
+    """
+    reasons = []
+    score = 0.4 * name_similarity(a['full_name'], b['full_name'])
+    if a['phone_e164'] and a['phone_e164'] == b['phone_e164']:
+        score += 0.3
+        reasons.append('phone')
+    if a['email_local'] and a['email_local'] == b['email_local']:
+        score += 0.2
+        reasons.append('email')
+    if a['dob'] and b['dob']:
+        if a['dob'] == b['dob']:
+            score += 0.1
+            reasons.append('date of birth')
+        else:
+            # Different people sharing a family phone or email
+            score -= 0.2
+    if score >= 0.3:
+        reasons.insert(0, 'name')
+    return round(max(0.0, min(score, 1.0)), 2), reasons
+
+
+def blocking_keys(full_name='', phone='', email='', dob=None):
+    """The blocking key values of a (possibly unsaved) patient."""
+    from .phones import normalize_phone
+
+    if isinstance(dob, str):
+        try:
+            dob = parse_date(dob)
+        except ValueError:
+            dob = None
+    return {
+        'full_name': full_name or '',
+        'phone_e164': normalize_phone(phone),
+        'email_local': email_local(email),
+        'dob': dob,
+        'name_soundex': name_soundex(full_name),
+    }
+
+
+_FIELDS = ('id', 'full_name', 'phone', 'phone_e164', 'email_local', 'dob', 'name_soundex')
+
+
+def find_duplicates(full_name='', phone='', email='', dob=None, exclude_id=None, limit=5):
+    """
+    Existing patients that may be the patient described, best first, as
+    ``Match`` tuples scoring at least ``POSSIBLE``.
+    """
+    from .models import PatientProfile
+
+    keys = blocking_keys(full_name, phone, email, dob)
+    block = Q()
+    if keys['phone_e164']:
+        block |= Q(phone_e164=keys['phone_e164'])
+    if keys['email_local']:
+        block |= Q(email_local=keys['email_local'])
+    if keys['dob'] and keys['name_soundex']:
+        block |= Q(dob=keys['dob'], name_soundex=keys['name_soundex'])
+    if not block:
+        return []
+
+    candidates = PatientProfile.objects.filter(block)
+    if exclude_id is not None:
+        candidates = candidates.exclude(id=exclude_id)
+
+    matches = []
+    for row in candidates.values(*_FIELDS)[:MAX_CANDIDATES]:
+        score, reasons = score_pair(keys, row)
+        if score >= POSSIBLE:
+            matches.append(Match(row['id'], row['full_name'], row['phone'], score, reasons))
+    matches.sort(key=lambda match: (-match.score, match.name))
+    return matches[:limit]
+
+
+def likely_duplicates(*args, **kwargs):
+    return [match for match in find_duplicates(*args, **kwargs) if match.score >= LIKELY]
+
+
+def duplicate_warning(matches):
+    """Message text listing ``matches`` (phone numbers masked)."""
+    from .patient_typeahead import mask_phone
+
+    found = ', '.join(f"{match.name} ({mask_phone(match.phone)})" for match in matches)
+    return f"This patient may already be registered: {found}."
+
+
+def _blocks(key):
+    """Yield the rows of every block of ``key`` holding more than one patient."""
+    from .models import PatientProfile
+
+    fields = key if isinstance(key, tuple) else (key,)
+    same_block = PatientProfile.objects.filter(
+        **{field: OuterRef(field) for field in fields}
+    ).exclude(id=OuterRef('id'))
+    rows = PatientProfile.objects.filter(Exists(same_block))
+    for field in fields:
+        rows = rows.exclude(**{f'{field}__isnull': True})
+        if field != 'dob':
+            rows = rows.exclude(**{field: ''})
+
+    for _, members in groupby(
+        rows.order_by(*fields, 'id').values(*_FIELDS).iterator(chunk_size=2000),
+        key=itemgetter(*fields),
+    ):
+        members = list(members)
+        if len(members) <= MAX_BLOCK_SIZE:
+            yield members
+
+
+def duplicate_clusters(min_score=LIKELY):
+    """
+    Groups of existing patients that are probably the same person, as
+    ``(best pair score, [patient rows])`` sorted by score. Pairs sharing a
+    block and scoring at least ``min_score`` are joined transitively.
+    """
+    parent = {}
+    rows_by_id = {}
+    best = {}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for key in BLOCKING_KEYS:
+        for members in _blocks(key):
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    score, _ = score_pair(a, b)
+                    if score < min_score:
+                        continue
+                    for row in (a, b):
+                        rows_by_id[row['id']] = row
+                        parent.setdefault(row['id'], row['id'])
+                    root_a, root_b = find(a['id']), find(b['id'])
+                    root = min(root_a, root_b)
+                    parent[root_a] = parent[root_b] = root
+                    best[root] = max(score, best.get(root_a, 0), best.get(root_b, 0))
+
+    clusters = {}
+    for pk in parent:
+        clusters.setdefault(find(pk), []).append(rows_by_id[pk])
+    result = [
+        (best[root], sorted(members, key=lambda row: row['id']))
+        for root, members in clusters.items()
+    ]
+    result.sort(key=lambda cluster: (-cluster[0], cluster[1][0]['id']))
+    return result
@@ -0,0 +1,262 @@
+"""
+Patient search index over name, phone and email.
+
+Searching ``PatientProfile`` with ``icontains`` on three columns (one of
+them in ``auth_user``) is a full scan plus a join on every keystroke. This
+module keeps a dedicated index instead, updated from signals (see
+``core/signals.py``):
+
+* ``sqlite_fts5``   - FTS5 virtual table ``core_patient_fts`` with prefix
+                      indexes, ranked by bm25
+* ``postgres_trgm`` - table ``core_patient_search`` with a pg_trgm GIN
+                      index, ranked by word similarity
+* ``basic``         - no index, the old icontains filter (other databases)
+
+``PATIENT_SEARCH_BACKEND`` picks one; the default ``'auto'`` follows the
+database vendor. Every term in the query must match the start of a word
+in the name, email or phone number (phone numbers are indexed as digits,
+both in full and without the country code).
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'core_patient_fts'
+TRGM_TABLE = 'core_patient_search'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def query_terms(query):
+    return [term.lower() for term in _TERM_RE.findall(query or '')]
+
+
+def phone_tokens(phone):
+    """Digits of a phone number, in full and as the last 10 digits."""
+    digits = re.sub(r'\D', '', phone or '')
+    tokens = [digits] if digits else []
+    if len(digits) > 10:
+        tokens.append(digits[-10:])
+    return ' '.join(tokens)
+
+
+def patient_rows(queryset):
+    """(id, name, phone, email) rows to index for a PatientProfile queryset."""
+    for patient_id, name, phone, email, user_email in queryset.values_list(
+        'id', 'full_name', 'phone', 'email', 'user__email'
+    ).iterator(chunk_size=2000):
+        emails = ' '.join(sorted({e for e in (email, user_email) if e}))
+        yield patient_id, name or '', phone_tokens(phone), emails
+
+
+def _active_only_sql(patient_id_column):
+    """(join, where) SQL fragments keeping only active patients."""
+    from .models import PatientProfile
+    table = connection.ops.quote_name(PatientProfile._meta.db_table)
+    return (
+        f" JOIN {table} ON {table}.id = {patient_id_column}",
+        f" AND {table}.status = 'Active'",
+    )
+
+
+class BasicBackend:
+    name = 'basic'
+
+    def filter(self, queryset, query):
+        q = Q()
+        for term in query_terms(query):
+            q &= (
+                Q(full_name__icontains=term)
+                | Q(phone__icontains=term)
+                | Q(user__email__icontains=term)
+            )
+        return queryset.filter(q)
+
+    def search_ids(self, query, limit=10, active_only=False):
+        from .models import PatientProfile
+        qs = self.filter(PatientProfile.objects.order_by('full_name'), query)
+        if active_only:
+            qs = qs.filter(status='Active')
+        return list(qs.values_list('id', flat=True)[:limit])
+
+    def index(self, rows):
+        pass
+
+    def remove(self, patient_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSBackend(BasicBackend):
+    name = 'sqlite_fts5'
+
+    # Column weights for bm25(): name, phone, email
+    WEIGHTS = (10.0, 5.0, 1.0)
+
+    @staticmethod
+    def match_expression(query):
+        terms = query_terms(query)
+        if not terms:
+            return None
+        # A one-character prefix matches a large part of the index (every
+        # phone number starts with 9); leave it out unless it is all we have
+        terms = [term for term in terms if len(term) > 1] or terms
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+        ))
+
+    def search_ids(self, query, limit=10, active_only=False):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+        join, where = _active_only_sql(f'{FTS_TABLE}.rowid') if active_only else ('', '')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE}{join} WHERE {FTS_TABLE} MATCH %s{where} "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s",
+                [expression, *self.WEIGHTS, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, phone, email) VALUES (%s, %s, %s, %s)", rows
+            )
+
+    def remove(self, patient_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in patient_ids]
+            )
+
+    def rebuild(self):
+        from .models import PatientProfile
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        batch = []
+        for row in patient_rows(PatientProfile.objects.all()):
+            batch.append(row)
+            if len(batch) >= 2000:
+                self.index(batch)
+                batch = []
+        self.index(batch)
+
+
+class PostgresTrigramBackend(BasicBackend):
+    name = 'postgres_trgm'
+
+    @staticmethod
+    def _where(terms):
+        sql = ' AND '.join(['document ILIKE %s'] * len(terms))
+        return sql, [f'%{term}%' for term in terms]
+
+    def filter(self, queryset, query):
+        terms = query_terms(query)
+        if not terms:
+            return queryset
+        where, params = self._where(terms)
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT patient_id FROM {TRGM_TABLE} WHERE {where}", params
+        ))
+
+    def search_ids(self, query, limit=10, active_only=False):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        where, params = self._where(terms)
+        join, active = _active_only_sql(f'{TRGM_TABLE}.patient_id') if active_only else ('', '')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {TRGM_TABLE}.patient_id FROM {TRGM_TABLE}{join} WHERE {where}{active} "
+                f"ORDER BY word_similarity(%s, document) DESC, {TRGM_TABLE}.patient_id LIMIT %s",
+                [*params, ' '.join(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, rows):
+        rows = [(pk, ' '.join(filter(None, (name, phone, email))).lower()) for pk, name, phone, email in rows]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TRGM_TABLE} (patient_id, document) VALUES (%s, %s) "
+                f"ON CONFLICT (patient_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, patient_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TRGM_TABLE} WHERE patient_id = ANY(%s)", [list(patient_ids)])
+
+    def rebuild(self):
+        from .models import PatientProfile
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {TRGM_TABLE}")
+        batch = []
+        for row in patient_rows(PatientProfile.objects.all()):
+            batch.append(row)
+            if len(batch) >= 2000:
+                self.index(batch)
+                batch = []
+        self.index(batch)
+
+
+BACKENDS = {
+    BasicBackend.name: BasicBackend,
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+    PostgresTrigramBackend.name: PostgresTrigramBackend,
+}
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend.name,
+    'postgresql': PostgresTrigramBackend.name,
+}
+
+
+def get_backend():
+    name = getattr(settings, 'PATIENT_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = VENDOR_BACKENDS.get(connection.vendor, BasicBackend.name)
+    return BACKENDS[name]()
+
+
+def search_patients(queryset, query):
+    """Filter a PatientProfile queryset to patients matching ``query``."""
+    return get_backend().filter(queryset, query)
+
+
+def search_patient_ids(query, limit=10, active_only=False):
+    """Best matching patient ids for ``query``, best first."""
+    return get_backend().search_ids(query, limit, active_only)
+
+
+def index_patients(queryset):
+    get_backend().index(patient_rows(queryset))
+
+
+def remove_patients(patient_ids):
+    get_backend().remove(patient_ids)
+
+
+def rebuild_index():
+    get_backend().rebuild()
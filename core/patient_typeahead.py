@@ -0,0 +1,94 @@
+"""
+Patient typeahead for the booking pages.
+
+The appointment and lab test booking pages used to embed every patient in
+the page. They now ask ``frontdesk_patient_typeahead`` for the ten best
+matches of what has been typed so far, answered from the patient search
+index (``core.patient_search``).
+
+While a name is being typed the same few prefixes are requested over and
+over ("ra", "rav", "ravi"), so results are cached for
+``PATIENT_TYPEAHEAD_CACHE_TTL`` seconds under the normalized query. A
+generation counter in the cache is part of every key and is bumped on
+patient writes (see ``core/signals.py``), so a newly registered patient can
+be booked right away.
+
+Results are compact and only show the last digits of the phone number:
+
+    [{'id': 7, 'name': 'Ravi Kumar', 'phone': '••••••3210'}, ...]
+"""
+
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .patient_search import query_terms, search_patient_ids
+
+
+GENERATION_KEY = 'patient_typeahead:generation'
+
+MIN_QUERY_LENGTH = 2
+MAX_RESULTS = 10
+
+
+def mask_phone(phone, visible=4):
+    """Phone number with all but the last ``visible`` digits hidden."""
+    digits = re.sub(r'\D', '', phone or '')
+    if not digits:
+        return ''
+    return '•' * max(len(digits) - visible, 0) + digits[-visible:]
+
+
+def normalize_query(query):
+    return ' '.join(query_terms(query))
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 1
+        cache.add(GENERATION_KEY, generation, timeout=None)
+    return generation
+
+
+def _cache_key(query, active_only):
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return f'patient_typeahead:{_generation()}:{int(active_only)}:{digest}'
+
+
+def _lookup(query, active_only):
+    from .models import PatientProfile
+
+    # Inactive patients are left out by the search itself, before the limit
+    ids = search_patient_ids(query, limit=MAX_RESULTS, active_only=active_only)
+    if not ids:
+        return []
+    rows = PatientProfile.objects.filter(id__in=ids)
+    by_id = {pk: (name, phone) for pk, name, phone in rows.values_list('id', 'full_name', 'phone')}
+    return [
+        {'id': pk, 'name': by_id[pk][0], 'phone': mask_phone(by_id[pk][1])}
+        for pk in ids if pk in by_id
+    ]
+
+
+def patient_typeahead(query, active_only=False):
+    """Up to ``MAX_RESULTS`` patients matching ``query``, best first."""
+    query = normalize_query(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    key = _cache_key(query, active_only)
+    results = cache.get(key)
+    if results is None:
+        results = _lookup(query, active_only)
+        cache.set(key, results, getattr(settings, 'PATIENT_TYPEAHEAD_CACHE_TTL', 30))
+    return results
+
+
+def invalidate_typeahead():
+    """Start a new generation of cached results after a patient write."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
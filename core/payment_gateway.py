@@ -0,0 +1,224 @@
+"""
+Payment gateways for the patient payment page.
+
+``start_payment()`` hands a pending payment to the gateway named by the
+``PAYMENT_GATEWAY`` setting and returns straight away. Gateways that
+confirm asynchronously report back through the webhook endpoint
+(``payment_webhook``), which only records the delivery in the
+``WebhookEvent`` inbox; the ``process_webhooks`` worker then applies it
+(see ``core/webhook_inbox.py``) and the payment page polls the payment's
+status until it is Paid or Failed.
+
+Gateways:
+
+* ``direct``    - confirms in the request, as before there was a gateway
+                  (the default; needs no worker)
+* ``simulator`` - local stand-in for a real gateway. It sends a signed
+                  ``charge.succeeded`` / ``charge.failed`` webhook after
+                  ``PAYMENT_SIMULATOR_DELAY`` seconds, fails a
+                  ``PAYMENT_SIMULATOR_FAILURE_RATE`` share of charges and
+                  delivers a ``PAYMENT_SIMULATOR_DUPLICATE_RATE`` share of
+                  webhooks twice.
+
+Methods a gateway does not handle (cash, with the simulator) are left
+Pending for the front desk to collect.
+
+With a webhook gateway, ``manage.py process_webhooks`` has to run next to
+the web server: without it, online payments are never confirmed and stay
+Pending.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .payments import PaymentError, finalize_payment
+
+
+logger = logging.getLogger(__name__)
+
+# reference: the gateway's id for the charge; confirmed: paid already;
+# events: webhooks the gateway will send (simulator only)
+Charge = namedtuple('Charge', 'payment reference confirmed events')
+
+ONLINE_METHODS = ('UPI', 'Card', 'NetBanking')
+
+
+class WebhookError(Exception):
+    """A webhook delivery that cannot be accepted (bad signature or body)."""
+
+
+def _secret():
+    return getattr(settings, 'PAYMENT_WEBHOOK_SECRET', None) or settings.SECRET_KEY
+
+
+def sign(body):
+    return hmac.new(_secret().encode(), body, hashlib.sha256).hexdigest()
+
+
+class DirectGateway:
+    name = 'direct'
+    methods = ONLINE_METHODS + ('Cash',)
+
+    def charge(self, payment, payment_method, idempotency_key, webhook_url=None):
+        payment, _ = finalize_payment(payment.id, payment_method, idempotency_key=idempotency_key)
+        return Charge(payment, reference=None, confirmed=True, events=[])
+
+    def parse_webhook(self, request):
+        raise WebhookError("The direct gateway does not send webhooks.")
+
+
+class SimulatorGateway:
+    name = 'simulator'
+    methods = ONLINE_METHODS
+    signature_header = 'HTTP_X_SIMULATOR_SIGNATURE'
+
+    def _setting(self, name, default):
+        return getattr(settings, f'PAYMENT_SIMULATOR_{name}', default)
+
+    def events_for(self, payment, reference, payment_method):
+        """The webhook bodies the simulator sends for a charge."""
+        failed = random.random() < self._setting('FAILURE_RATE', 0.0)
+        event = {
+            'id': f"evt_{uuid.uuid4().hex}",
+            'type': 'charge.failed' if failed else 'charge.succeeded',
+            'created': timezone.now().isoformat(),
+            'data': {
+                'reference': reference,
+                'payment_id': payment.id,
+                'payment_method': payment_method,
+                'amount': str(payment.amount),
+                'failure_reason': 'Declined by issuer (simulated)' if failed else '',
+            },
+        }
+        body = json.dumps(event).encode()
+        copies = 2 if random.random() < self._setting('DUPLICATE_RATE', 0.0) else 1
+        return [body] * copies
+
+    def charge(self, payment, payment_method, idempotency_key, webhook_url=None):
+        reference = f"sim_{uuid.uuid4().hex[:20]}"
+        events = self.events_for(payment, reference, payment_method)
+        if webhook_url:
+            # Sent once the transaction that recorded the reference commits
+            transaction.on_commit(lambda: self.deliver_later(webhook_url, events))
+        return Charge(payment, reference=reference, confirmed=False, events=events)
+
+    def deliver_later(self, url, events):
+        delay = self._setting('DELAY', 2.0)
+        timer = threading.Timer(delay, self.deliver, args=(url, events))
+        timer.daemon = True
+        timer.start()
+
+    def deliver(self, url, events, retries=3):
+        for body in events:
+            for attempt in range(retries):
+                request = urllib.request.Request(url, data=body, method='POST', headers={
+                    'Content-Type': 'application/json',
+                    'X-Simulator-Signature': sign(body),
+                })
+                try:
+                    with urllib.request.urlopen(request, timeout=10):
+                        break
+                except OSError as e:
+                    logger.warning("Simulated webhook to %s failed (attempt %d): %s", url, attempt + 1, e)
+                    time.sleep(2 ** attempt)
+
+    def parse_webhook(self, request):
+        signature = request.META.get(self.signature_header, '')
+        if not hmac.compare_digest(signature, sign(request.body)):
+            raise WebhookError("Invalid webhook signature.")
+        try:
+            event = json.loads(request.body)
+            return event['id'], event['type'], event['data']
+        except (ValueError, KeyError, TypeError):
+            raise WebhookError("Malformed webhook body.")
+
+
+GATEWAYS = {
+    DirectGateway.name: DirectGateway,
+    SimulatorGateway.name: SimulatorGateway,
+}
+
+
+def get_gateway(name=None):
+    return GATEWAYS[name or getattr(settings, 'PAYMENT_GATEWAY', DirectGateway.name)]()
+
+
+def start_payment(payment_id, payment_method, idempotency_key=None, patient=None, webhook_url=None):
+    """
+    Start paying payment ``payment_id`` by ``payment_method`` and return a
+    ``Charge``. A resubmitted form (same idempotency key) gets the charge
+    already under way instead of a second one.
+    """
+    from .models import Payment
+
+    idempotency_key = idempotency_key or None
+    gateway = get_gateway()
+    with transaction.atomic():
+        payments = Payment.objects.select_for_update(of=('self',))
+        if patient is not None:
+            payments = payments.filter(patient=patient)
+        payment = payments.get(id=payment_id)
+
+        if payment.payment_status == 'Paid':
+            return Charge(payment, payment.gateway_reference, confirmed=True, events=[])
+
+        if payment_method not in gateway.methods:
+            # Paid at the counter (see core.payments.settle_cash_payments)
+            payment.payment_method = payment_method
+            payment.payment_status = 'Pending'
+            payment.save(update_fields=['payment_method', 'payment_status'])
+            return Charge(payment, reference=None, confirmed=False, events=[])
+
+        if idempotency_key and payment.idempotency_key == idempotency_key and payment.gateway_reference:
+            return Charge(payment, payment.gateway_reference, confirmed=False, events=[])
+
+        if gateway.name == DirectGateway.name:
+            return gateway.charge(payment, payment_method, idempotency_key)
+
+        if idempotency_key and Payment.objects.filter(
+            idempotency_key=idempotency_key
+        ).exclude(id=payment.id).exists():
+            raise PaymentError("This payment request was already used for another payment.")
+
+        charge = gateway.charge(payment, payment_method, idempotency_key, webhook_url)
+        payment.payment_method = payment_method
+        payment.payment_status = 'Pending'
+        payment.gateway_reference = charge.reference
+        payment.idempotency_key = idempotency_key
+        payment.save(update_fields=['payment_method', 'payment_status', 'gateway_reference', 'idempotency_key'])
+    return charge
+
+
+def apply_event(event_type, data):
+    """Apply a gateway event recorded in the webhook inbox."""
+    from .models import Payment
+
+    if event_type == 'charge.succeeded':
+        # Even a charge that a later attempt replaced took the money, so
+        # the payment is finalized whichever reference succeeded
+        idempotency_key = Payment.objects.filter(
+            id=data['payment_id'],
+        ).values_list('idempotency_key', flat=True).get()
+        finalize_payment(data['payment_id'], data['payment_method'], idempotency_key=idempotency_key)
+    elif event_type == 'charge.failed':
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update(of=('self',)).filter(
+                gateway_reference=data['reference'], payment_status='Pending',
+            ).first()
+            # A later charge of the same payment may have replaced this one
+            if payment is not None:
+                payment.payment_status = 'Failed'
+                payment.save(update_fields=['payment_status'])
+    # Other event types are acknowledged and ignored
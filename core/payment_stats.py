@@ -0,0 +1,148 @@
+"""
+Payment counts and totals by status.
+
+``status_totals(queryset)`` computes the count and total of every payment
+status of a queryset with one conditional aggregation.
+
+``overall_totals()`` gives the same numbers for the whole payment table
+without scanning it: days before today are read from ``DailyPaymentSummary``
+rows (one per closed day) and only today's payments are aggregated live.
+Closed days after the last summary are summarized on first use, and a
+summarized day is recomputed whenever one of its payments is saved or
+deleted (see ``core/signals.py``) or settled in bulk.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+# Payment.PAYMENT_STATUS values and their DailyPaymentSummary column prefixes
+STATUSES = {
+    'Paid': 'paid',
+    'Pending': 'pending',
+    'Failed': 'failed',
+}
+
+FIELDS = [f'{prefix}_{measure}' for prefix in STATUSES.values() for measure in ('count', 'total')]
+
+
+def _aggregates():
+    aggregates = {}
+    for status, prefix in STATUSES.items():
+        aggregates[f'{prefix}_count'] = Count('id', filter=Q(payment_status=status))
+        aggregates[f'{prefix}_total'] = Sum('amount', filter=Q(payment_status=status), default=Decimal('0'))
+    return aggregates
+
+
+def _with_totals(stats, status=None):
+    """Add the overall ``count`` and ``total``, keeping only ``status`` if given."""
+    for name, prefix in STATUSES.items():
+        if status and name != status:
+            stats[f'{prefix}_count'] = 0
+            stats[f'{prefix}_total'] = Decimal('0')
+    stats['count'] = sum(stats[f'{prefix}_count'] for prefix in STATUSES.values())
+    stats['total'] = sum((stats[f'{prefix}_total'] for prefix in STATUSES.values()), Decimal('0'))
+    return stats
+
+
+def status_totals(queryset):
+    """
+    ``{'paid_count', 'paid_total', 'pending_count', ..., 'count', 'total'}``
+    of a payment queryset, from one query.
+    """
+    return _with_totals(queryset.order_by().aggregate(**_aggregates()))
+
+
+def day_start(day):
+    """The first moment of ``day`` in the current time zone."""
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def _summaries(payments):
+    """Unsaved DailyPaymentSummary rows of ``payments``, by day."""
+    from .models import DailyPaymentSummary
+
+    rows = (
+        payments.annotate(day=TruncDate('payment_date'))
+        .values('day')
+        .annotate(**_aggregates())
+        .order_by()
+    )
+    return {row['day']: DailyPaymentSummary(**row) for row in rows}
+
+
+def _save(summaries):
+    from .models import DailyPaymentSummary
+
+    if summaries:
+        DailyPaymentSummary.objects.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['day'],
+            update_fields=FIELDS + ['updated_at'],
+        )
+
+
+def _backfill(last_day, today):
+    """Summarize the closed days after ``last_day`` (all of them if None)."""
+    from .models import DailyPaymentSummary, Payment
+
+    payments = Payment.objects.filter(payment_date__lt=day_start(today))
+    if last_day is not None:
+        payments = payments.filter(payment_date__gte=day_start(last_day + timedelta(days=1)))
+    summaries = _summaries(payments)
+    # Always store yesterday, so the next call knows those days are done
+    yesterday = today - timedelta(days=1)
+    summaries.setdefault(yesterday, DailyPaymentSummary(day=yesterday))
+    _save(list(summaries.values()))
+    return summaries.values()
+
+
+def refresh_days(days):
+    """Recompute the stored summaries of ``days`` after their payments changed."""
+    from .models import DailyPaymentSummary, Payment
+
+    today = timezone.localdate()
+    days = {day for day in days if day < today}
+    if not days:
+        return
+    stored = set(DailyPaymentSummary.objects.filter(day__in=days).values_list('day', flat=True))
+    if not stored:
+        # Days not summarized yet are picked up by the next backfill
+        return
+    condition = Q()
+    for day in stored:
+        condition |= Q(payment_date__gte=day_start(day), payment_date__lt=day_start(day + timedelta(days=1)))
+    summaries = _summaries(Payment.objects.filter(condition))
+    # A day whose payments were all deleted goes back to zero
+    _save([summaries.get(day) or DailyPaymentSummary(day=day) for day in stored])
+
+
+def overall_totals(status=None):
+    """
+    ``status_totals()`` of all payments (only those with ``status`` if
+    given), from the closed days' summaries plus today's payments.
+    """
+    from .models import DailyPaymentSummary, Payment
+
+    today = timezone.localdate()
+    closed = DailyPaymentSummary.objects.filter(day__lt=today).aggregate(
+        last_day=Max('day'), **{field: Sum(field, default=0) for field in FIELDS}
+    )
+    stats = {field: closed[field] for field in FIELDS}
+
+    if closed['last_day'] is None or closed['last_day'] < today - timedelta(days=1):
+        for summary in _backfill(closed['last_day'], today):
+            for field in FIELDS:
+                stats[field] += getattr(summary, field)
+
+    live = Payment.objects.filter(payment_date__gte=day_start(today)).aggregate(**_aggregates())
+    for field in FIELDS:
+        stats[field] += live[field]
+    return _with_totals(stats, status)
@@ -0,0 +1,160 @@
+"""
+Payment finalization.
+
+``finalize_payment()`` is the one place a pending payment becomes Paid.
+In a single transaction it locks the payment row (``select_for_update``),
+writes the payment once, promotes the linked appointment (Pending Payment
+-> Scheduled) or test booking (Pending Payment -> Booked) once, and after
+commit sends the ``payment_finalized`` signal once.
+
+Forms that pay carry an idempotency key, generated when the form is
+rendered and stored on the payment. A resubmitted form (double click,
+browser retry) waits for the first submit's lock, finds the payment
+already Paid and gets that result back with ``replayed=True`` and no
+further writes.
+
+``settle_cash_payments()`` is the shift-close counterpart for the front
+desk: it settles many pending cash payments at once with one locking
+select, one ``bulk_update`` and one set-based update each for the
+appointments and test bookings they pay for.
+"""
+
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .transaction_ids import new_transaction_id
+
+
+# Sent once per finalized payment, after commit, with ``payment``
+payment_finalized = Signal()
+
+# Sent once per cash settlement, after commit, with ``settlement``
+payments_settled = Signal()
+
+Finalization = namedtuple('Finalization', 'payment replayed')
+
+Settlement = namedtuple(
+    'Settlement',
+    'payments total appointments lab_bookings skipped settled_by settled_at',
+)
+
+
+class PaymentError(Exception):
+    """The payment cannot be finalized with the given request."""
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def finalize_payment(payment_id, payment_method, idempotency_key=None, patient=None):
+    """
+    Mark payment ``payment_id`` Paid by ``payment_method`` and confirm what
+    it pays for. With ``patient``, only that patient's payment is found.
+
+    Raises ``Payment.DoesNotExist`` for an unknown payment and
+    ``PaymentError`` if the idempotency key already belongs to another
+    payment.
+    """
+    from .models import Payment
+
+    idempotency_key = idempotency_key or None
+    with transaction.atomic():
+        payments = Payment.objects.select_for_update(of=('self',)).select_related('appointment', 'test_booking')
+        if patient is not None:
+            payments = payments.filter(patient=patient)
+        # Concurrent submits of the same payment queue up here
+        payment = payments.get(id=payment_id)
+
+        if payment.payment_status == 'Paid':
+            return Finalization(payment, replayed=True)
+
+        if idempotency_key and Payment.objects.filter(
+            idempotency_key=idempotency_key
+        ).exclude(id=payment.id).exists():
+            raise PaymentError("This payment request was already used for another payment.")
+
+        payment.payment_method = payment_method
+        payment.payment_status = 'Paid'
+        payment.transaction_id = new_transaction_id()
+        payment.idempotency_key = idempotency_key
+        payment.save(update_fields=['payment_method', 'payment_status', 'transaction_id', 'idempotency_key'])
+
+        appointment = payment.appointment
+        if appointment is not None and appointment.status == 'Pending Payment':
+            appointment.status = 'Scheduled'
+            appointment.save(update_fields=['status'])
+
+        booking = payment.test_booking
+        if booking is not None and booking.status == 'Pending Payment':
+            booking.status = 'Booked'
+            booking.save(update_fields=['status', 'updated_at'])
+
+        transaction.on_commit(lambda: payment_finalized.send(sender=Payment, payment=payment))
+    return Finalization(payment, replayed=False)
+
+
+def settle_cash_payments(payment_ids=None, day=None, settled_by=None):
+    """
+    Mark pending cash payments Paid in one transaction and confirm what
+    they pay for: the payments in ``payment_ids``, or with ``day`` every
+    pending cash payment taken that day.
+
+    Ids that are not pending cash payments are left alone and reported in
+    ``Settlement.skipped``.
+    """
+    from .global_search import index_queryset
+    from .models import Appointment, Payment, TestBooking
+    from .payment_stats import refresh_days
+
+    if payment_ids is None and day is None:
+        raise PaymentError("Choose the payments to settle.")
+
+    with transaction.atomic():
+        pending = Payment.objects.select_for_update(of=('self',)).filter(
+            payment_method='Cash', payment_status='Pending',
+        )
+        if payment_ids is not None:
+            pending = pending.filter(id__in=payment_ids)
+        if day is not None:
+            pending = pending.filter(payment_date__date=day)
+        payments = list(pending.select_related('patient').order_by('payment_date', 'id'))
+
+        requested = set(payment_ids) if payment_ids is not None else set()
+        skipped = sorted(requested - {payment.id for payment in payments})
+
+        for payment in payments:
+            payment.payment_status = 'Paid'
+            payment.transaction_id = new_transaction_id()
+        Payment.objects.bulk_update(payments, ['payment_status', 'transaction_id'], batch_size=500)
+
+        ids = [payment.id for payment in payments]
+        appointments = Appointment.objects.filter(
+            payments__id__in=ids, status='Pending Payment',
+        ).update(status='Scheduled')
+        lab_bookings = TestBooking.objects.filter(
+            payments__id__in=ids, status='Pending Payment',
+        ).update(status='Booked', updated_at=timezone.now())
+
+        # bulk_update sends no post_save, so refresh the search documents
+        # and the summaries of earlier days here
+        index_queryset(Payment.objects.filter(id__in=ids))
+        refresh_days({timezone.localdate(payment.payment_date) for payment in payments})
+
+        settlement = Settlement(
+            payments=payments,
+            total=sum((payment.amount for payment in payments), Decimal('0')),
+            appointments=appointments,
+            lab_bookings=lab_bookings,
+            skipped=skipped,
+            settled_by=settled_by,
+            settled_at=timezone.now(),
+        )
+        if payments:
+            transaction.on_commit(lambda: payments_settled.send(sender=Payment, settlement=settlement))
+    return settlement
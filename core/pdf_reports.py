@@ -0,0 +1,318 @@
+"""
+Shared PDF rendering for all downloadable reports.
+
+ReportLab is imported once here, and paragraph styles, table styles and
+page geometry are built once per process instead of on every request.
+Views describe a report as a plain, JSON-serialisable spec and hand it to
+``render_report``:
+
+    {
+        'title': 'LAB RESULT REPORT',
+        'subtitle': ['Period: 2026-01-01 to 2026-01-31'],      # optional
+        'sections': [
+            {
+                'heading': 'TEST RESULTS',                      # optional
+                'heading_style': 'heading',                     # or 'section'
+                'paragraphs': ['free text', ['Bold part', 'rest']],
+                'table': {
+                    'rows': [['Test', 'Value'], ['HbA1c', '6.1']],
+                    'col_widths': [2, 1.5],                     # inches
+                    'style': 'data',                            # see get_table_styles()
+                    'highlight': [{'cell': [1, 1], 'color': '#f59e0b'}],
+                },
+            },
+        ],
+    }
+
+Large tables are not inlined: the caller writes the body rows to a CSV
+file and passes ``'header'`` plus ``'rows_file'`` instead of ``'rows'``.
+The rows are then read back lazily and laid out as a series of tables of
+``'chunk_rows'`` rows each, every one starting with the header, so
+neither the spec nor the story ever holds the whole table in memory.
+
+A spec may also carry a ``'letterhead'`` (list of lines, e.g. the
+doctor's name and department). Sections with ``'letterhead': True`` start
+with it, and ``'page_break_before': True`` starts a section on a new page.
+
+Specs only contain strings and numbers (never model instances) so they
+can be cached, hashed or shipped to another process as-is.
+"""
+
+import csv
+from functools import lru_cache
+from io import BytesIO
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+
+
+PAGE_SIZES = {
+    'letter': letter,
+    'A4': A4,
+}
+
+PAGE_MARGINS = {
+    'topMargin': 0.5 * inch,
+    'bottomMargin': 0.5 * inch,
+}
+
+FOOTER_TEXT = "BetaCare Hospital Management"
+
+# Rows per table when a table is streamed from a rows file. Splitting a
+# Table across pages re-wraps the remainder each time, so many short
+# tables lay out in linear time where one huge table would not.
+DEFAULT_CHUNK_ROWS = 500
+
+GRID_COLOR = colors.HexColor('#cccccc')
+HEADER_COLOR = colors.HexColor('#667eea')
+
+
+@lru_cache(maxsize=1)
+def get_paragraph_styles():
+    """Paragraph styles used by every report (built once per process)."""
+    sample = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'ReportTitle',
+            parent=sample['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#1a1a1a'),
+            spaceAfter=10,
+            alignment=1,
+        ),
+        'section': ParagraphStyle(
+            'ReportSection',
+            parent=sample['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#2c3e50'),
+            spaceAfter=8,
+            spaceBefore=8,
+        ),
+        'letterhead': ParagraphStyle(
+            'ReportLetterhead',
+            parent=sample['Heading2'],
+            fontSize=15,
+            textColor=HEADER_COLOR,
+            spaceAfter=2,
+        ),
+        'heading': sample['Heading2'],
+        'normal': sample['Normal'],
+    }
+
+
+def _header_table_commands(header_bg, stripe, font_size=9):
+    return [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(header_bg)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), font_size),
+        ('GRID', (0, 0), (-1, -1), 1, GRID_COLOR),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor(stripe)]),
+    ]
+
+
+@lru_cache(maxsize=1)
+def get_table_styles():
+    """Named table styles (built once per process)."""
+    return {
+        # Two-column "Label: value" block under the title
+        'info': TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f4f8')),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, GRID_COLOR),
+        ]),
+        # Header row + striped body
+        'data': TableStyle(_header_table_commands('#667eea', '#f0f0f0')),
+        'summary': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), HEADER_COLOR),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, GRID_COLOR),
+        ]),
+        'plain': TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ]),
+        # Medical history sections
+        'allergies': TableStyle(_header_table_commands('#ffcccc', '#ffe6e6')),
+        'conditions': TableStyle(_header_table_commands('#cce5ff', '#e6f2ff')),
+        'medications': TableStyle(_header_table_commands('#ccffcc', '#e6ffe6')),
+    }
+
+
+@lru_cache(maxsize=1)
+def get_letterhead_style():
+    return TableStyle([
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ('LINEBELOW', (0, -1), (-1, -1), 1.5, HEADER_COLOR),
+    ])
+
+
+@lru_cache(maxsize=64)
+def _letterhead_markup(lines):
+    return tuple(escape(line) for line in lines)
+
+
+def get_letterhead(lines):
+    """
+    Letterhead block for a tuple of lines (first line in bold).
+
+    A new flowable every time: ReportLab keeps layout state on a flowable
+    while it wraps and draws it, so one instance must not be shared
+    between documents. Only the escaped lines and the styles are cached.
+    """
+    styles = get_paragraph_styles()
+    first, *rest = _letterhead_markup(lines)
+    rows = [[Paragraph(first, styles['letterhead'])]]
+    rows += [[Paragraph(line, styles['normal'])] for line in rest]
+    table = Table(rows, colWidths=[7 * inch])
+    table.setStyle(get_letterhead_style())
+    return table
+
+
+def _draw_footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.setFillColor(colors.grey)
+    canvas.drawString(doc.leftMargin, 0.3 * inch, FOOTER_TEXT)
+    canvas.drawRightString(
+        doc.pagesize[0] - doc.rightMargin, 0.3 * inch, f"Page {doc.page}"
+    )
+    canvas.restoreState()
+
+
+def _paragraph(item, style):
+    if isinstance(item, (list, tuple)):
+        bold, rest = item
+        return Paragraph(f"<b>{escape(str(bold))}</b> {escape(str(rest))}", style)
+    return Paragraph(escape(str(item)), style)
+
+
+def build_table(table_spec):
+    table_styles = get_table_styles()
+    col_widths = table_spec.get('col_widths')
+    if col_widths:
+        col_widths = [width * inch for width in col_widths]
+
+    rows = [['' if cell is None else str(cell) for cell in row] for row in table_spec['rows']]
+    table = Table(rows, colWidths=col_widths, repeatRows=table_spec.get('repeat_rows', 0))
+    table.setStyle(table_styles[table_spec.get('style', 'data')])
+
+    highlights = table_spec.get('highlight')
+    if highlights:
+        extra = []
+        for item in highlights:
+            cell = tuple(item['cell'])
+            extra.append(('TEXTCOLOR', cell, cell, colors.HexColor(item['color'])))
+            extra.append(('FONTNAME', cell, cell, 'Helvetica-Bold'))
+        table.setStyle(TableStyle(extra))
+
+    return table
+
+
+def iter_table_chunks(table_spec):
+    """Yield one table per ``chunk_rows`` rows of a CSV rows file."""
+    chunk_size = table_spec.get('chunk_rows', DEFAULT_CHUNK_ROWS)
+    with open(table_spec['rows_file'], newline='', encoding='utf-8') as rows_file:
+        rows = csv.reader(rows_file)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield build_table(dict(table_spec, rows=[table_spec['header']] + chunk, repeat_rows=1))
+
+
+def iter_flowables(spec):
+    """Turn a report spec into ReportLab flowables, lazily."""
+    styles = get_paragraph_styles()
+    letterhead = tuple(spec.get('letterhead', ()))
+
+    if spec.get('title'):
+        yield Paragraph(escape(spec['title']), styles['title'])
+    for line in spec.get('subtitle', []):
+        yield _paragraph(line, styles['normal'])
+    if spec.get('title') or spec.get('subtitle'):
+        yield Spacer(1, 12)
+
+    for section in spec.get('sections', []):
+        if section.get('page_break_before'):
+            yield PageBreak()
+        if section.get('letterhead') and letterhead:
+            yield get_letterhead(letterhead)
+            yield Spacer(1, 12)
+
+        if section.get('heading'):
+            yield Paragraph(escape(section['heading']), styles[section.get('heading_style', 'heading')])
+            yield Spacer(1, 6)
+
+        for item in section.get('paragraphs', []):
+            yield _paragraph(item, styles['normal'])
+            yield Spacer(1, 6)
+
+        table_spec = section.get('table')
+        if table_spec and 'rows_file' in table_spec:
+            yield from iter_table_chunks(table_spec)
+        elif table_spec:
+            yield build_table(table_spec)
+
+        yield Spacer(1, section.get('space_after', 16))
+
+
+class LazyStory(list):
+    """
+    Story list that pulls flowables from an iterator as the document
+    template consumes them, keeping only a few buffered at a time.
+
+    ``doc.build`` only ever looks at the front of the story (``len``,
+    ``[0]``, ``del [0]`` and inserts at the front), so reporting the
+    buffered length is enough for it to keep going until the source runs
+    dry.
+    """
+
+    def __init__(self, source, lookahead=8):
+        super().__init__()
+        self._source = iter(source)
+        self._lookahead = lookahead
+        self._fill()
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                list.append(self, next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+def render_report(spec):
+    """Render a report spec and return the PDF bytes."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=PAGE_SIZES[spec.get('pagesize', 'letter')],
+        title=spec.get('title', ''),
+        **PAGE_MARGINS
+    )
+    doc.build(LazyStory(iter_flowables(spec)), onFirstPage=_draw_footer, onLaterPages=_draw_footer)
+    return buffer.getvalue()
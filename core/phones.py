@@ -0,0 +1,79 @@
+"""
+Phone number normalisation for caller lookup.
+
+``PatientProfile.phone`` is free text ("+91 98765-43210", "098765 43210",
+"9876543210", ...). On save the model also stores:
+
+* ``phone_e164``     - the number as ``+<country code><number>``, for exact
+                       matches on a full number
+* ``phone_reversed`` - the same digits reversed, so "ends with 43210"
+                       becomes a prefix range that a B-tree index can serve
+
+Numbers without a country code get ``PHONE_DEFAULT_COUNTRY_CODE``.
+"""
+
+import re
+
+from django.conf import settings
+
+
+NATIONAL_NUMBER_LENGTH = 10
+
+# Fewer digits than this are too ambiguous for a suffix lookup
+MIN_SUFFIX_DIGITS = 4
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def default_country_code():
+    return getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '91')
+
+
+def normalize_phone(phone):
+    """Return ``phone`` in E.164 form, or '' if it has no usable digits."""
+    phone = (phone or '').strip()
+    digits = _NON_DIGITS.sub('', phone)
+    if not digits:
+        return ''
+
+    if phone.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+
+    # Drop the national trunk prefix ("098765 43210")
+    if len(digits) == NATIONAL_NUMBER_LENGTH + 1 and digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) <= NATIONAL_NUMBER_LENGTH:
+        return '+' + default_country_code() + digits
+    return '+' + digits
+
+
+def reversed_digits(phone_e164):
+    return phone_e164.lstrip('+')[::-1]
+
+
+def suffix_range(digits):
+    """
+    ``(low, high)`` bounds on ``phone_reversed`` for numbers ending in
+    ``digits``; use with ``__gte`` / ``__lt`` so the index is used.
+    """
+    low = digits[::-1]
+    return low, low + ':'  # ':' sorts right after '9'
+
+
+def caller_lookup_filter(raw):
+    """
+    Filter kwargs for a typed or caller-ID number, or None if it has too
+    few digits. A number with an explicit country code ("+44...") is
+    matched exactly; anything else by its last (up to 10) digits, so
+    "98765 43210", "098765-43210" and "43210" all find "+91 98765-43210".
+    """
+    raw = (raw or '').strip()
+    digits = _NON_DIGITS.sub('', raw)
+    if len(digits) < MIN_SUFFIX_DIGITS:
+        return None
+    if raw.startswith('+') or digits.startswith('00'):
+        return {'phone_e164': normalize_phone(raw)}
+    low, high = suffix_range(digits[-NATIONAL_NUMBER_LENGTH:])
+    return {'phone_reversed__gte': low, 'phone_reversed__lt': high}
@@ -0,0 +1,150 @@
+"""
+Pre-rendered payment receipts.
+
+A receipt does not change once its payment is Paid, so it is rendered
+once, from plain values, into a ``PaymentReceipt`` row keyed by the
+transaction id: when the payment is saved as Paid or settled in bulk (see
+``core/signals.py``). Payments marked Paid by queryset updates, or before
+receipts were stored, get theirs from ``backfill_receipts()`` (the
+``backfill_receipts`` management command) or on first view. Viewing or
+reprinting receipts then reads the stored HTML without joining patients,
+doctors and labs again. A payment that leaves Paid loses its receipt.
+"""
+
+from datetime import timedelta
+
+from django.template.loader import render_to_string
+
+from .payment_stats import day_start
+from .transaction_ids import issued_at as transaction_issued_at
+
+
+RECEIPT_TEMPLATE = 'core/receipts/payment_receipt.html'
+
+
+def receipt_payments(queryset):
+    return queryset.select_related(
+        'patient', 'appointment__doctor__user', 'test_booking__test', 'test_booking__lab',
+    )
+
+
+def receipt_context(payment):
+    """The values a receipt shows, with everything it needs already joined."""
+    context = {
+        'payment_id': payment.id,
+        'transaction_id': payment.transaction_id,
+        'payment_date': payment.payment_date,
+        'patient_name': payment.patient.full_name,
+        'patient_id': payment.patient.id,
+        'patient_phone': payment.patient.phone,
+        'payment_method': payment.payment_method,
+        'payment_status': payment.payment_status,
+        'amount': payment.amount,
+        'service': 'Payment',
+    }
+    if payment.appointment:
+        context.update({
+            'service': 'Medical Appointment',
+            'reference_label': 'Appointment ID',
+            'reference_id': payment.appointment.id,
+            'provider_label': 'Doctor',
+            'provider': payment.appointment.doctor.user.get_full_name() if payment.appointment.doctor else '',
+        })
+    elif payment.test_booking:
+        context.update({
+            'service': 'Diagnostic Test',
+            'reference_label': 'Test Booking ID',
+            'reference_id': payment.test_booking.id,
+            'item': payment.test_booking.test.test_name,
+            'provider_label': 'Lab',
+            'provider': payment.test_booking.lab.name,
+        })
+    return context
+
+
+def render_receipt(payment):
+    return render_to_string(RECEIPT_TEMPLATE, receipt_context(payment))
+
+
+def snapshot_receipts(payment_ids, missing_only=False):
+    """
+    Render and store the receipts of the Paid payments among
+    ``payment_ids``, only of those without one if ``missing_only``.
+    """
+    from .models import Payment, PaymentReceipt
+
+    payments = Payment.objects.filter(id__in=payment_ids, payment_status='Paid')
+    if missing_only:
+        payments = payments.filter(receipt__isnull=True)
+    payments = receipt_payments(payments)
+    receipts = [
+        PaymentReceipt(
+            payment=payment,
+            transaction_id=payment.transaction_id,
+            html=render_receipt(payment),
+            issued_at=transaction_issued_at(payment.transaction_id) or payment.payment_date,
+        )
+        for payment in payments.iterator(chunk_size=500)
+    ]
+    if receipts:
+        PaymentReceipt.objects.bulk_create(
+            receipts,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['payment'],
+            update_fields=['transaction_id', 'html', 'issued_at'],
+        )
+    return receipts
+
+
+def receipt_html(payment_id):
+    """
+    The stored receipt of a Paid payment (stored first if missing), or
+    the receipt rendered live for a payment that is not Paid yet.
+    Raises ``Payment.DoesNotExist`` for an unknown payment.
+    """
+    from .models import Payment, PaymentReceipt
+
+    html = PaymentReceipt.objects.filter(payment_id=payment_id).values_list('html', flat=True).first()
+    if html is not None:
+        return html
+    snapshots = snapshot_receipts([payment_id])
+    if snapshots:
+        return snapshots[0].html
+    return render_receipt(receipt_payments(Payment.objects).get(id=payment_id))
+
+
+def backfill_receipts(chunk_size=500, on_chunk=None):
+    """
+    Store the receipts of Paid payments that have none, ``chunk_size`` at
+    a time in id order, and return how many were stored.
+    ``on_chunk(count, last_id)`` is called after each chunk.
+    """
+    from .models import Payment
+
+    missing = Payment.objects.filter(payment_status='Paid', receipt__isnull=True).order_by('id')
+
+    stored = 0
+    last_id = 0
+    while True:
+        chunk = list(missing.filter(id__gt=last_id).values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            break
+        stored += len(snapshot_receipts(chunk))
+        last_id = chunk[-1]
+        if on_chunk is not None:
+            on_chunk(stored, last_id)
+    return stored
+
+
+def receipts_between(start, end):
+    """
+    Queryset of the stored receipts issued on the dates ``start`` to
+    ``end``, to be read a page at a time. Only receipts already stored
+    are included; nothing is rendered here.
+    """
+    from .models import PaymentReceipt
+
+    return PaymentReceipt.objects.filter(
+        issued_at__gte=day_start(start), issued_at__lt=day_start(end + timedelta(days=1)),
+    ).only('id', 'issued_at', 'html')
@@ -0,0 +1,104 @@
+"""
+Process pool for CPU-bound report rendering.
+
+ReportLab and openpyxl are pure Python, so rendering inside a WSGI thread
+holds the GIL and stalls every other request served by that worker. The
+download and export views instead build a plain spec (strings and numbers,
+never model instances) and hand it to ``render_pdf`` / ``render_xlsx``,
+which render it in a small, bounded ``ProcessPoolExecutor``.
+
+Settings:
+    RENDER_POOL_WORKERS      processes in the pool; 0 renders inline
+    RENDER_POOL_MAX_PENDING  renders queued or running before new ones
+                             are rejected with ``RenderQueueFull``
+    RENDER_POOL_TIMEOUT      seconds to wait for a render before raising
+                             ``RenderTimeout``
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .pdf_reports import render_report
+from .xlsx_reports import render_workbook
+
+
+class RenderUnavailable(Exception):
+    """Base class for renders that could not be completed."""
+
+
+class RenderQueueFull(RenderUnavailable):
+    pass
+
+
+class RenderTimeout(RenderUnavailable):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def _get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_get_setting('RENDER_POOL_WORKERS', 2))
+            _slots = threading.BoundedSemaphore(_get_setting('RENDER_POOL_MAX_PENDING', 8))
+        return _executor, _slots
+
+
+def shutdown_pool():
+    """Stop the worker processes (they are restarted on the next render)."""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _slots = None
+
+
+def run_render(func, spec, timeout=None):
+    """Run ``func(spec)`` in the pool and return its result."""
+    if _get_setting('RENDER_POOL_WORKERS', 2) <= 0:
+        return func(spec)
+
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise RenderQueueFull("Too many reports are being generated, please retry shortly.")
+
+    try:
+        future = executor.submit(func, spec)
+    except BaseException:
+        slots.release()
+        raise
+    # Free the slot when the worker finishes, even if we stop waiting
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=timeout or _get_setting('RENDER_POOL_TIMEOUT', 30))
+    except FutureTimeoutError:
+        future.cancel()
+        raise RenderTimeout("Report generation timed out.")
+
+
+def render_pdf(spec, timeout=None):
+    return run_render(render_report, spec, timeout)
+
+
+def render_xlsx(spec, timeout=None):
+    return run_render(render_workbook, spec, timeout)
+
+
+def render_busy_response(exc):
+    """Plain 503 returned by views when a render is rejected or times out."""
+    response = HttpResponse(str(exc), status=503, content_type='text/plain')
+    response['Retry-After'] = '5'
+    return response
@@ -0,0 +1,103 @@
+"""
+Content-addressed cache for rendered PDF reports.
+
+A report is identified by its kind, a template version and a fingerprint
+of the rows it is built from (ids plus their last-modified timestamps).
+The rendered bytes are written once under ``MEDIA_ROOT/report_cache`` and
+every later download with the same fingerprint is served straight from
+disk, without touching ReportLab.
+
+Bump the entry in ``REPORT_TEMPLATE_VERSIONS`` whenever the layout of a
+report changes so previously cached files stop matching.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse
+
+
+REPORT_TEMPLATE_VERSIONS = {
+    'test_report': 2,
+    'lab_result': 2,
+    'medical_history': 3,
+}
+
+
+def report_cache_key(kind, fingerprint):
+    """Hash the report kind, its template version and the source fingerprint."""
+    payload = json.dumps(
+        [kind, REPORT_TEMPLATE_VERSIONS.get(kind, 1), fingerprint],
+        cls=DjangoJSONEncoder,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def report_cache_name(kind, key):
+    """Storage name of a cached artifact, relative to MEDIA_ROOT."""
+    cache_dir = getattr(settings, 'REPORT_CACHE_DIR', 'report_cache')
+    return f"{cache_dir}/{kind}/{key[:2]}/{key}.pdf"
+
+
+def get_or_render_report(kind, fingerprint, render):
+    """
+    Return ``(storage_name, absolute_path)`` of the cached report,
+    calling ``render()`` (which must return PDF bytes) only on a miss.
+    """
+    key = report_cache_key(kind, fingerprint)
+    name = report_cache_name(kind, key)
+    path = os.path.join(settings.MEDIA_ROOT, name)
+
+    if not os.path.exists(path):
+        pdf_bytes = render()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temp file and rename so concurrent readers never see
+        # a half-written PDF.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(pdf_bytes)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return name, path
+
+
+def cached_pdf_response(kind, fingerprint, render, filename):
+    """Serve a report from the cache (rendering it first if needed)."""
+    name, path = get_or_render_report(kind, fingerprint, render)
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=filename,
+        content_type='application/pdf',
+    )
+
+
+
+def write_back_result_file(booking, name):
+    """
+    Point ``booking.result_file`` at a cached report, unless the lab has
+    uploaded its own file. Uses ``update()`` so ``updated_at`` (part of the
+    cache fingerprint) is left untouched.
+    """
+    if not getattr(settings, 'REPORT_CACHE_WRITE_BACK', False):
+        return
+
+    current = booking.result_file.name if booking.result_file else ''
+    cache_dir = getattr(settings, 'REPORT_CACHE_DIR', 'report_cache')
+    if current == name or (current and not current.startswith(cache_dir + '/')):
+        return
+
+    type(booking).objects.filter(pk=booking.pk).update(result_file=name)
+    booking.result_file.name = name
@@ -0,0 +1,174 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .doctor_directory import invalidate_directory
+from .lab_queue import refresh_due_at
+from . import global_search
+from .models import (
+    Appointment, DiagnosticTest, DoctorProfile, Lab, PatientProfile, Payment, PaymentReceipt, Prescription,
+    TestBooking,
+)
+from .patient_dedup import email_local
+from .patient_search import index_patients, remove_patients
+from .patient_typeahead import invalidate_typeahead
+from .payment_stats import refresh_days
+from .payments import payments_settled
+from .receipts import snapshot_receipts
+from .test_catalogue import invalidate_catalogue
+
+
+# ===== PATIENT SEARCH INDEX =====
+
+@receiver(post_save, sender=PatientProfile)
+def index_patient_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_patients(PatientProfile.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=PatientProfile)
+def remove_patient_from_index(sender, instance, **kwargs):
+    remove_patients([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def reindex_patient_on_user_save(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Only the email is indexed from User; skip e.g. last_login updates
+    if raw or created or (update_fields is not None and 'email' not in update_fields):
+        return
+    index_patients(PatientProfile.objects.filter(user=instance))
+
+
+@receiver([post_save, post_delete], sender=PatientProfile)
+def invalidate_patient_typeahead(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(invalidate_typeahead)
+
+
+# ===== DUPLICATE DETECTION KEYS =====
+
+@receiver(post_save, sender=User)
+def update_patient_email_key(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or created or (update_fields is not None and 'email' not in update_fields):
+        return
+    # Patients without their own email are blocked by their login email
+    PatientProfile.objects.filter(user=instance).filter(
+        Q(email__isnull=True) | Q(email='')
+    ).update(email_local=email_local(instance.email))
+
+
+# ===== DIAGNOSTIC TEST CATALOGUE =====
+
+@receiver([post_save, post_delete], sender=DiagnosticTest)
+@receiver([post_save, post_delete], sender=Lab)
+def invalidate_test_catalogue(sender, **kwargs):
+    # After commit, so no process reloads the snapshot before the write is visible
+    transaction.on_commit(invalidate_catalogue)
+
+
+# ===== DOCTOR DIRECTORY =====
+
+@receiver([post_save, post_delete], sender=DoctorProfile)
+def invalidate_doctor_directory(sender, **kwargs):
+    transaction.on_commit(invalidate_directory)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_doctor_directory_on_user_change(sender, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the directory does not use
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(invalidate_directory)
+
+
+# ===== GLOBAL SEARCH DOCUMENTS =====
+
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_save, sender=Appointment)
+@receiver(post_save, sender=TestBooking)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Prescription)
+def index_search_document(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    global_search.index_queryset(sender.objects.filter(pk=instance.pk))
+    if sender is not PatientProfile or (
+        update_fields is not None and not {'full_name', 'phone'} & set(update_fields)
+    ):
+        return
+    # Other documents copy the patient's name and phone. Instances not loaded
+    # from the database have no saved values to compare
+    search_fields = (instance.full_name, instance.phone)
+    if not created and getattr(instance, '_saved_search_fields', None) != search_fields:
+        global_search.index_patient_related(instance)
+    instance._saved_search_fields = search_fields
+
+
+@receiver(post_save, sender=User)
+def reindex_patient_document_on_user_save(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or created or (update_fields is not None and 'email' not in update_fields):
+        return
+    global_search.index_queryset(PatientProfile.objects.filter(user=instance))
+
+
+@receiver(post_delete, sender=PatientProfile)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=TestBooking)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Prescription)
+def remove_search_document(sender, instance, **kwargs):
+    global_search.remove_documents(sender, [instance.pk])
+
+
+# ===== DAILY PAYMENT SUMMARIES =====
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_payment_summary(sender, instance, raw=False, **kwargs):
+    if raw or instance.payment_date is None:
+        return
+    day = timezone.localdate(instance.payment_date)
+    if day < timezone.localdate():
+        transaction.on_commit(lambda: refresh_days([day]))
+
+
+# ===== PAYMENT RECEIPTS =====
+
+@receiver(post_save, sender=Payment)
+def snapshot_paid_receipt(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Finalized payments and those created or edited as Paid by the staff pages
+    if raw or instance.payment_status != 'Paid':
+        return
+    if update_fields is None or 'payment_status' in update_fields:
+        transaction.on_commit(lambda: snapshot_receipts([instance.pk], missing_only=True))
+
+
+@receiver(payments_settled)
+def snapshot_settled_receipts(sender, settlement, **kwargs):
+    snapshot_receipts([payment.id for payment in settlement.payments])
+
+
+@receiver(post_save, sender=Payment)
+def void_receipt(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or created or instance.payment_status == 'Paid':
+        return
+    if update_fields is None or 'payment_status' in update_fields:
+        PaymentReceipt.objects.filter(payment=instance).delete()
+
+
+# ===== LAB WORK QUEUE =====
+
+@receiver(post_save, sender=DiagnosticTest)
+def refresh_booking_due_times(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'result_duration' not in update_fields):
+        return
+    # Instances not loaded from the database have no saved duration to compare
+    changed = getattr(instance, '_saved_result_duration', None) != instance.result_duration
+    if changed and not created:
+        refresh_due_at(instance)
+    instance._saved_result_duration = instance.result_duration
@@ -0,0 +1,61 @@
+"""
+Process-local snapshots of small, rarely changing tables.
+
+A ``VersionedSnapshot`` keeps the result of ``load()`` in process memory
+and reloads it when a version counter in the Django cache changes (bumped
+by ``invalidate()``, usually from a post_save / post_delete signal) or
+when it is older than the ``max_age_setting`` number of seconds. The age
+limit is the fallback for per-process cache backends such as the default
+``LocMemCache``, where other processes never see the bumped version.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class VersionedSnapshot:
+    def __init__(self, name, load, max_age_setting, default_max_age=300):
+        self.version_key = f'{name}:version'
+        self.load = load
+        self.max_age_setting = max_age_setting
+        self.default_max_age = default_max_age
+        # (version, loaded_at, value)
+        self._current = None
+        self._lock = threading.Lock()
+
+    def current_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = 1
+            cache.add(self.version_key, version, timeout=None)
+        return version
+
+    def _is_stale(self, current, version):
+        max_age = getattr(settings, self.max_age_setting, self.default_max_age)
+        return (
+            current is None
+            or current[0] != version
+            or time.monotonic() - current[1] > max_age
+        )
+
+    def get(self):
+        """The snapshot value, reloaded after writes or when stale."""
+        version = self.current_version()
+        current = self._current
+        if self._is_stale(current, version):
+            with self._lock:
+                current = self._current
+                if self._is_stale(current, version):
+                    current = self._current = (version, time.monotonic(), self.load())
+        return current[2]
+
+    def invalidate(self):
+        """Bump the version so every process reloads its snapshot."""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 2, timeout=None)
+        self._current = None
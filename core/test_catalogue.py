@@ -0,0 +1,128 @@
+"""
+Process-local snapshot of the diagnostic test catalogue.
+
+The catalogue (``DiagnosticTest`` joined to ``Lab``) is small and changes
+rarely, but the booking pages and the tests-by-lab AJAX call used to query
+it on every view and keystroke. ``get_catalogue()`` instead returns an
+immutable in-memory snapshot with:
+
+* a token index (lower-cased words of the test name, code, category and
+  lab name -> test ids) plus a sorted vocabulary for prefix lookups
+* facets: test ids per lab and per category
+
+The snapshot is a ``core.snapshots.VersionedSnapshot``, invalidated from
+``core/signals.py`` whenever a test or lab is written and otherwise
+reloaded every ``TEST_CATALOGUE_MAX_AGE`` seconds.
+"""
+
+import re
+from bisect import bisect_left
+from collections import namedtuple
+
+from .snapshots import VersionedSnapshot
+
+
+CatalogueLab = namedtuple('CatalogueLab', 'id name address phone status')
+
+CatalogueTest = namedtuple(
+    'CatalogueTest',
+    'id test_name test_code category price result_duration sample_type '
+    'is_active home_collection lab',
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token.lower() for token in _TOKEN_RE.findall(text or '')]
+
+
+class Catalogue:
+    def __init__(self, labs, tests):
+        self.labs = {lab.id: lab for lab in labs}
+        # Tests ordered by name; search results keep this order
+        self.tests = tuple(sorted(tests, key=lambda test: (test.test_name.lower(), test.id)))
+        self.by_id = {test.id: test for test in self.tests}
+        self._position = {test.id: position for position, test in enumerate(self.tests)}
+
+        self.token_index = {}
+        self.by_lab = {}
+        self.by_category = {}
+        for test in self.tests:
+            text = ' '.join([test.test_name, test.test_code or '', test.category, test.lab.name])
+            for token in tokenize(text):
+                self.token_index.setdefault(token, set()).add(test.id)
+            self.by_lab.setdefault(test.lab.id, set()).add(test.id)
+            self.by_category.setdefault(test.category, set()).add(test.id)
+        self.vocabulary = sorted(self.token_index)
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        start = bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            ids |= self.token_index[token]
+        return ids
+
+    def search(self, query='', lab_id=None, category=None, active_only=False):
+        """
+        Tests matching every word of ``query`` (as a word prefix) and the
+        optional lab / category facets, ordered by test name.
+        """
+        candidates = None
+
+        def narrow(ids):
+            nonlocal candidates
+            candidates = ids if candidates is None else candidates & ids
+
+        for term in tokenize(query):
+            narrow(self._prefix_ids(term))
+        if lab_id is not None:
+            narrow(self.by_lab.get(lab_id, set()))
+        if category:
+            narrow(self.by_category.get(category, set()))
+
+        if candidates is None:
+            tests = self.tests
+        else:
+            tests = [self.tests[position] for position in sorted(self._position[pk] for pk in candidates)]
+        if active_only:
+            tests = [test for test in tests if test.is_active]
+        return list(tests)
+
+    def active_labs(self):
+        return sorted(
+            (lab for lab in self.labs.values() if lab.status == 'Active'),
+            key=lambda lab: lab.name.lower(),
+        )
+
+
+def load_catalogue():
+    from .models import DiagnosticTest, Lab
+
+    labs = [
+        CatalogueLab(*row)
+        for row in Lab.objects.values_list('id', 'name', 'address', 'phone', 'status')
+    ]
+    labs_by_id = {lab.id: lab for lab in labs}
+    tests = [
+        CatalogueTest(*row[:-1], lab=labs_by_id[row[-1]])
+        for row in DiagnosticTest.objects.values_list(
+            'id', 'test_name', 'test_code', 'category', 'price', 'result_duration',
+            'sample_type', 'is_active', 'home_collection', 'lab_id',
+        )
+    ]
+    return Catalogue(labs, tests)
+
+
+_catalogue = VersionedSnapshot('test_catalogue', load_catalogue, 'TEST_CATALOGUE_MAX_AGE')
+
+
+def get_catalogue():
+    """Current catalogue snapshot."""
+    return _catalogue.get()
+
+
+def invalidate_catalogue():
+    _catalogue.invalidate()
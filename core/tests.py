@@ -1,3 +1,1451 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from unittest import mock
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Appointment, DailyPaymentSummary, DiagnosticTest, DoctorProfile, FrontDeskProfile, Lab, LabResult,
+    LabTechnicianProfile, MedicalCondition, PatientProfile, Payment, PaymentReceipt, Prescription, TestBooking,
+    TestReferenceRange, WebhookEvent,
+)
+from .doctor_directory import get_directory, invalidate_directory
+from .global_search import search as global_search
+from .pdf_reports import get_letterhead, render_report
+from .patient_dedup import likely_duplicates
+from .patient_search import search_patient_ids, search_patients
+from .patient_typeahead import MAX_RESULTS, invalidate_typeahead, patient_typeahead
+from . import render_pool
+from .phones import caller_lookup_filter, normalize_phone
+from .test_catalogue import get_catalogue, invalidate_catalogue
+from .payment_gateway import SimulatorGateway, sign, start_payment
+from .analyzer_ingest import IngestFileError, ingest_results
+from . import lab_values
+from .lab_queue import claim_next, next_due, parse_duration, release
+from .lab_results import ENTRY_STATUSES, ResultEntry, save_results
+from .lab_series import lttb_indices, patient_series
+from .lab_values import backfill, classify, compute_flags, parse_range, parse_value
+from .payment_stats import overall_totals, status_totals
+from .receipts import backfill_receipts, receipt_html, receipts_between
+from .transaction_ids import TransactionIdGenerator, id_bounds, issued_at
+from .webhook_inbox import process_inbox
+from .payments import PaymentError, finalize_payment, payment_finalized, settle_cash_payments
+
+
+def create_patient(username='patient'):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='secret123')
+    return PatientProfile.objects.create(user=user, full_name='Asha Rao', phone='9876543210')
+
+
+def create_appointment_payment(patient):
+    doctor_user = User.objects.create_user(
+        username=f'doctor-{User.objects.count()}', first_name='Vik', last_name='Shah',
+    )
+    doctor = DoctorProfile.objects.create(
+        user=doctor_user, department='Cardio', specialization='Cardiology', phone='9000000000',
+    )
+    appointment = Appointment.objects.create(
+        patient=patient, doctor=doctor,
+        appointment_date=date.today() + timedelta(days=1), appointment_time=time(10, 0),
+        reason='Checkup', status='Pending Payment',
+    )
+    payment = Payment.objects.create(
+        patient=patient, appointment=appointment, amount=500, payment_method='UPI',
+    )
+    return appointment, payment
+
+
+def create_frontdesk(username='frontdesk'):
+    user = User.objects.create_user(username=username, password='secret123')
+    return FrontDeskProfile.objects.create(user=user, phone='9000000001')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.other = create_patient('other')
+        self.other.full_name = 'Ravi Kumar'
+        self.other.save()
+        self.appointment, self.payment = create_appointment_payment(self.patient)
+        self.other_appointment, self.other_payment = create_appointment_payment(self.other)
+        Payment.objects.filter(id=self.payment.id).update(payment_status='Paid')
+
+        self.doctor = self.appointment.doctor
+        self.doctor.user.set_password('secret123')
+        self.doctor.user.save()
+        for appointment, medicine, status in (
+            (self.appointment, 'Salbutamol', 'Active'),
+            (self.appointment, 'Cetirizine', 'Completed'),
+            (self.other_appointment, 'Metformin', 'Active'),
+        ):
+            Prescription.objects.create(
+                appointment=appointment, patient=appointment.patient, doctor=appointment.doctor,
+                medicine_name=medicine, dosage='1', frequency='Daily', duration='5 days', instructions='-',
+                status=status,
+            )
+
+        lab = Lab.objects.create(name='Main Lab', address='1 Road', phone='1234567890')
+        test = DiagnosticTest.objects.create(
+            lab=lab, test_name='HbA1c', category='Blood', price=300, result_duration='1 day',
+        )
+        self.booked = TestBooking.objects.create(
+            patient=self.patient, test=test, lab=lab, booking_date=date.today(), status='Booked',
+        )
+        TestBooking.objects.create(patient=self.other, test=test, lab=lab, booking_date=date.today(), status='Cancelled')
+
+        tech = LabTechnicianProfile.objects.create(
+            user=User.objects.create_user(username='tech', password='secret123'), lab=lab, phone='1',
+        )
+        for patient, value, status in ((self.patient, '5.4', 'Normal'), (self.patient, '7.9', 'Abnormal'),
+                                       (self.other, '6.1', 'Normal')):
+            LabResult.objects.create(
+                patient=patient, doctor=self.doctor, lab_technician=tech, test_name='HbA1c', test_value=value,
+                normal_range='4.0-5.6', result_status=status, remarks='', test_date=date.today(),
+            )
+
+        User.objects.create_user(username='admin', password='secret123', is_staff=True)
+        create_frontdesk()
+
+    def export(self, username, name, **params):
+        self.client.login(username=username, password='secret123')
+        response = self.client.get(reverse(name), {'export': 'ndjson', **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_csv_has_a_header_row(self):
+        self.client.login(username='admin', password='secret123')
+        response = self.client.get(reverse('admin_payments'), {'export': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['Transaction ID', 'Patient'])
+        self.assertEqual(len(lines), 3)
+
+    def test_admin_payments_are_for_admins_only(self):
+        self.assertEqual(len(self.export('admin', 'admin_payments')), 2)
+        self.client.login(username='patient', password='secret123')
+        response = self.client.get(reverse('admin_payments'), {'export': 'ndjson'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_doctor_prescriptions(self):
+        rows = self.export(self.doctor.user.username, 'doctor_prescriptions', status='Active')
+        self.assertEqual([row['Medicine'] for row in rows], ['Salbutamol'])
+
+    def test_frontdesk_appointments(self):
+        rows = self.export('frontdesk', 'frontdesk_appointments', search='Ravi')
+        self.assertEqual([row['Appointment ID'] for row in rows], [self.other_appointment.id])
+
+    def test_frontdesk_payments(self):
+        rows = self.export('frontdesk', 'frontdesk_payments', status='Paid')
+        self.assertEqual([row['Patient'] for row in rows], ['Asha Rao'])
+
+        self.client.login(username='patient', password='secret123')
+        response = self.client.get(reverse('frontdesk_payments'), {'export': 'ndjson'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_patient_lab_results(self):
+        rows = self.export('patient', 'patient_lab_results', status='Normal')
+        self.assertEqual([row['Value'] for row in rows], ['5.4'])
+        self.assertEqual(len(self.export('other', 'patient_lab_results')), 1)
+
+    def test_frontdesk_lab_bookings(self):
+        rows = self.export('frontdesk', 'frontdesk_lab_bookings', status='Booked')
+        self.assertEqual([row['Booking ID'] for row in rows], [self.booked.id])
+
+
+class PdfReportTests(TestCase):
+    def test_letterhead_is_a_new_flowable_per_document(self):
+        lines = ('Dr. Vik Shah', 'Cardiology - Cardio')
+        self.assertIsNot(get_letterhead(lines), get_letterhead(lines))
+
+    def test_documents_with_a_letterhead_render_concurrently(self):
+        spec = {
+            'letterhead': ['Dr. Vik Shah', 'Cardiology - Cardio', 'Phone: 9000000000'],
+            'sections': [
+                {'letterhead': True, 'page_break_before': index > 0, 'paragraphs': [f'Patient {index}']}
+                for index in range(20)
+            ],
+        }
+        expected = render_report(spec)
+        outputs = []
+        threads = [threading.Thread(target=lambda: outputs.append(render_report(spec))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(outputs), 4)
+        for output in outputs:
+            self.assertTrue(output.startswith(b'%PDF'))
+            self.assertEqual(len(output), len(expected))
+
+
+@override_settings(RENDER_POOL_WORKERS=0)
+class MedicalHistoryReportTests(TestCase):
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.patient = create_patient()
+        self.condition = MedicalCondition.objects.create(
+            patient=self.patient, name='Asthma', diagnosis_date=date(2020, 1, 1),
+        )
+        self.client.login(username='patient', password='secret123')
+
+    def download(self):
+        response = self.client.get(reverse('download_medical_history'))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_repeat_download_is_served_from_cache(self):
+        first = self.download()
+        with mock.patch('core.views.render_pdf') as render_pdf:
+            self.assertEqual(self.download(), first)
+        render_pdf.assert_not_called()
+
+    def test_edited_condition_renders_a_new_report(self):
+        first = self.download()
+        # In place, as the medical history form does
+        MedicalCondition.objects.filter(id=self.condition.id).update(name='Chronic asthma')
+        self.assertNotEqual(self.download(), first)
+
+
+@override_settings(RENDER_POOL_WORKERS=2, RENDER_POOL_TIMEOUT=0.01)
+class RenderPoolTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        create_patient()
+        self.client.login(username='patient', password='secret123')
+        self.slots = threading.BoundedSemaphore(1)
+        self.executor = mock.Mock()
+        self.enterContext(mock.patch.object(render_pool, '_get_executor', return_value=(self.executor, self.slots)))
+
+    def download(self):
+        return self.client.get(reverse('download_medical_history'))
+
+    def test_full_queue_answers_503_with_retry_after(self):
+        self.slots.acquire()
+
+        response = self.download()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.executor.submit.assert_not_called()
+
+    def test_timed_out_render_answers_503_and_frees_its_slot(self):
+        self.executor.submit.return_value = Future()  # never completes
+
+        response = self.download()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(b'timed out', response.content)
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+    def test_finished_render_is_returned(self):
+        future = Future()
+        future.set_result(b'%PDF-1.4 stub')
+        self.executor.submit.return_value = future
+
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 stub')
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+
+@override_settings(RENDER_POOL_WORKERS=0)
+class PrescriptionBatchPrintTests(TestCase):
+    def setUp(self):
+        self.appointment, _ = create_appointment_payment(create_patient())
+        doctor_user = self.appointment.doctor.user
+        doctor_user.set_password('secret123')
+        doctor_user.save()
+        Prescription.objects.create(
+            appointment=self.appointment, patient=self.appointment.patient, doctor=self.appointment.doctor,
+            medicine_name='Salbutamol', dosage='100mcg', frequency='As needed', duration='30 days',
+            instructions='Inhale',
+        )
+        self.client.login(username=doctor_user.username, password='secret123')
+
+    def test_prints_one_appointment(self):
+        response = self.client.get(
+            reverse('doctor_prescriptions_batch_print'), {'appointment': self.appointment.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_invalid_appointment_is_rejected(self):
+        response = self.client.get(reverse('doctor_prescriptions_batch_print'), {'appointment': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.patient.phone = '+91 98765 43210'
+        self.patient.save()
+        other = create_patient('other')
+        other.full_name = 'Ravi Kumar'
+        other.phone = '9123456789'
+        other.save()
+        self.other = other
+
+    def test_index_follows_patient_changes(self):
+        self.assertEqual(search_patient_ids('asha'), [self.patient.id])
+
+        self.patient.full_name = 'Asha Menon'
+        self.patient.save()
+        self.assertEqual(search_patient_ids('menon'), [self.patient.id])
+        self.assertEqual(search_patient_ids('rao'), [])
+
+        self.patient.user.email = 'asha.menon@example.org'
+        self.patient.user.save()
+        self.assertEqual(search_patient_ids('example.org'), [self.patient.id])
+
+        patient_id = self.patient.id
+        self.patient.delete()
+        self.assertEqual(search_patient_ids('asha'), [])
+        self.assertNotIn(patient_id, search_patient_ids('example'))
+
+    def test_matches_word_prefixes_and_phone_digits(self):
+        self.assertEqual(search_patient_ids('as ra'), [self.patient.id])
+        self.assertEqual(search_patient_ids('919876543210'), [self.patient.id])
+        self.assertEqual(search_patient_ids('98765'), [self.patient.id])
+        self.assertEqual(search_patient_ids('!!'), [])
+
+    def test_backends_agree(self):
+        for backend in ('basic', 'auto'):
+            with self.subTest(backend=backend), override_settings(PATIENT_SEARCH_BACKEND=backend):
+                found = search_patients(PatientProfile.objects.all(), 'ravi kum')
+                self.assertEqual(list(found), [self.other])
+                self.assertEqual(search_patients(PatientProfile.objects.all(), '').count(), 2)
+
+
+class CallerLookupTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.patient.phone = '098765-43210'
+        self.patient.save()
+        self.appointment, _ = create_appointment_payment(self.patient)
+
+    def test_normalizes_phone_numbers(self):
+        self.assertEqual(self.patient.phone_e164, '+919876543210')
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), '+442079460958')
+        self.assertEqual(normalize_phone('0044 20 7946 0958'), '+442079460958')
+        self.assertEqual(normalize_phone('n/a'), '')
+        self.assertIsNone(caller_lookup_filter('210'))
+
+    def test_finds_caller_by_full_number_or_last_digits(self):
+        for phone in ('+91 98765 43210', '9876543210', '43210'):
+            with self.subTest(phone=phone):
+                self.assertEqual(
+                    list(PatientProfile.objects.filter(**caller_lookup_filter(phone))), [self.patient],
+                )
+        self.assertFalse(PatientProfile.objects.filter(**caller_lookup_filter('+44 98765 43210')).exists())
+
+    def test_lookup_returns_upcoming_appointments(self):
+        create_frontdesk()
+        self.client.login(username='frontdesk', password='secret123')
+        response = self.client.get(reverse('frontdesk_caller_lookup'), {'phone': '43210'})
+        self.assertEqual(response.status_code, 200)
+        [patient] = response.json()['patients']
+        self.assertEqual(patient['id'], self.patient.id)
+        self.assertEqual([a['id'] for a in patient['upcoming_appointments']], [self.appointment.id])
+
+    def test_patients_cannot_look_up_callers(self):
+        self.client.login(username='patient', password='secret123')
+        response = self.client.get(reverse('frontdesk_caller_lookup'), {'phone': '43210'})
+        self.assertEqual(response.status_code, 403)
+
+
+class TestCatalogueTests(TestCase):
+    def setUp(self):
+        self.lab = Lab.objects.create(name='Main Lab', address='1 Road', phone='1234567890')
+        self.glucose = DiagnosticTest.objects.create(
+            lab=self.lab, test_name='Fasting Glucose', category='Blood', price=150, result_duration='1 day',
+        )
+        invalidate_catalogue()
+
+    def test_search_matches_word_prefixes(self):
+        DiagnosticTest.objects.create(
+            lab=self.lab, test_name='Urine Routine', category='Urine', price=100, result_duration='1 day',
+        )
+        catalogue = get_catalogue()
+        self.assertEqual([test.id for test in catalogue.search('glu')], [self.glucose.id])
+        self.assertEqual([test.id for test in catalogue.search('fast blo')], [self.glucose.id])
+        self.assertEqual(catalogue.search('cose'), [])
+        self.assertEqual([test.test_name for test in catalogue.search('main')], ['Fasting Glucose', 'Urine Routine'])
+        self.assertEqual([test.test_name for test in catalogue.search(category='Urine')], ['Urine Routine'])
+
+    def test_snapshot_is_reused_until_a_test_is_written(self):
+        catalogue = get_catalogue()
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalogue(), catalogue)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.glucose.price = 200
+            self.glucose.save()
+        self.assertIsNot(get_catalogue(), catalogue)
+        self.assertEqual(get_catalogue().by_id[self.glucose.id].price, 200)
+
+    def test_reloads_when_another_process_bumps_the_version(self):
+        catalogue = get_catalogue()
+        DiagnosticTest.objects.filter(id=self.glucose.id).update(test_name='Random Glucose')
+        self.assertIs(get_catalogue(), catalogue)
+
+        cache.incr('test_catalogue:version')
+        self.assertEqual(get_catalogue().by_id[self.glucose.id].test_name, 'Random Glucose')
+
+
+class DoctorDirectoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='doctor', password='secret123', first_name='Vik', last_name='Shah',
+        )
+        self.doctor = DoctorProfile.objects.create(
+            user=self.user, department='Cardio', specialization='Cardiology', phone='9000000000',
+        )
+        invalidate_directory()
+        create_patient()
+        self.client.login(username='patient', password='secret123')
+
+    def get_directory_json(self, **headers):
+        return self.client.get(reverse('doctor_directory_json'), headers=headers)
+
+    def test_unchanged_directory_is_not_modified(self):
+        response = self.get_directory_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([doctor['name'] for doctor in response.json()['doctors']], ['Vik Shah'])
+
+        response = self.get_directory_json(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_doctor_edit_changes_the_etag(self):
+        etag = self.get_directory_json()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.consultation_fee = 900
+            self.doctor.save()
+
+        response = self.get_directory_json(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['doctors'][0]['consultation_fee'], '900.00')
+
+    def test_login_does_not_invalidate_the_directory(self):
+        directory = get_directory()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.login(username='doctor', password='secret123')
+        self.assertEqual(callbacks, [])
+        self.assertIs(get_directory(), directory)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_name = 'Shastri'
+            self.user.save()
+        self.assertEqual(get_directory().active[0]['name'], 'Vik Shastri')
+
+
+@override_settings(KEYSET_PAGE_SIZE=2)
+class FrontDeskListTests(TestCase):
+    def setUp(self):
+        lab = Lab.objects.create(name='Main Lab', address='1 Road', phone='1234567890')
+        test = DiagnosticTest.objects.create(
+            lab=lab, test_name='HbA1c', category='Blood', price=300, result_duration='1 day',
+        )
+        self.appointments = []
+        for index in range(3):
+            patient = create_patient(f'patient{index}')
+            self.appointments.append(create_appointment_payment(patient)[0])
+            TestBooking.objects.create(patient=patient, test=test, lab=lab, booking_date=date.today())
+        create_frontdesk()
+        self.client.login(username='frontdesk', password='secret123')
+
+    def test_totals_count_every_match_not_the_page(self):
+        pages = [
+            ('frontdesk_appointments', 'appointment_count', 'Total: 3'),
+            ('frontdesk_patients_list', 'patient_count', '3 found'),
+            ('frontdesk_lab_bookings', 'booking_count', '3'),
+        ]
+        for name, count, text in pages:
+            with self.subTest(page=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['page']), 2)
+                self.assertEqual(response.context[count], 3)
+                self.assertContains(response, text)
+
+    def test_pages_follow_the_cursor_both_ways(self):
+        first = self.client.get(reverse('frontdesk_appointments')).context['page']
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+
+        second = self.client.get(f"{reverse('frontdesk_appointments')}?{first.next_query}").context['page']
+        self.assertEqual(len(second), 1)
+        self.assertFalse(second.has_next)
+        seen = [a.id for a in first] + [a.id for a in second]
+        self.assertEqual(sorted(seen), sorted(a.id for a in self.appointments))
+
+        back = self.client.get(f"{reverse('frontdesk_appointments')}?{second.previous_query}").context['page']
+        self.assertEqual([a.id for a in back], [a.id for a in first])
+
+    def test_malformed_cursor_shows_the_first_page(self):
+        response = self.client.get(reverse('frontdesk_appointments'), {'after': 'not-a-cursor'})
+        self.assertEqual(len(response.context['page']), 2)
+
+
+class PatientTypeaheadTests(TestCase):
+    def setUp(self):
+        for index in range(MAX_RESULTS + 2):
+            user = User.objects.create_user(username=f'inactive{index}')
+            PatientProfile.objects.create(user=user, full_name='Ravi', phone='9123456789', status='Inactive')
+        self.active = create_patient()
+        self.active.full_name = 'Ravi Varma Iyer'
+        self.active.save()
+        invalidate_typeahead()
+
+    def test_active_patients_are_found_behind_inactive_matches(self):
+        for backend in ('basic', 'auto'):
+            with self.subTest(backend=backend), override_settings(PATIENT_SEARCH_BACKEND=backend):
+                invalidate_typeahead()
+                self.assertNotIn(self.active.id, search_patient_ids('ravi', limit=MAX_RESULTS))
+                self.assertEqual(
+                    patient_typeahead('ravi', active_only=True),
+                    [{'id': self.active.id, 'name': 'Ravi Varma Iyer', 'phone': '••••••3210'}],
+                )
+                self.assertEqual(len(patient_typeahead('ravi')), MAX_RESULTS)
+
+
+class PatientDedupTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.form = {
+            'first_name': 'Asha', 'last_name': 'Rao', 'email': 'asha.rao@example.com',
+            'phone': '+91 98765 43210', 'gender': 'Female', 'dob': '1990-01-01', 'address': '1 Road',
+        }
+
+    def test_scores_likely_duplicates(self):
+        [match] = likely_duplicates('Asha Rau', '098765 43210')
+        self.assertEqual(match.id, self.patient.id)
+        self.assertEqual(match.reasons, ['name', 'phone'])
+        self.assertEqual(likely_duplicates('Vik Shah', '9000000000'), [])
+
+    def test_front_desk_is_blocked_until_confirmed(self):
+        create_frontdesk()
+        self.client.login(username='frontdesk', password='secret123')
+
+        response = self.client.post(reverse('frontdesk_add_patient'), self.form)
+        self.assertRedirects(response, '/frontdesk/patients/?open_modal=1', fetch_redirect_response=False)
+        self.assertIn('may already be registered', str(list(get_messages(response.wsgi_request))[0]))
+        self.assertEqual(PatientProfile.objects.count(), 1)
+
+        response = self.client.post(reverse('frontdesk_add_patient'), {**self.form, 'confirm_new': '1'})
+        self.assertRedirects(response, reverse('frontdesk_patients_list'), fetch_redirect_response=False)
+        self.assertEqual(PatientProfile.objects.count(), 2)
+
+    def test_admin_is_only_warned(self):
+        User.objects.create_user(username='admin', password='secret123', is_staff=True)
+        self.client.login(username='admin', password='secret123')
+
+        response = self.client.post(reverse('admin_patient_add'), {**self.form, 'password': 'secret123'})
+        self.assertRedirects(response, reverse('admin_users'), fetch_redirect_response=False)
+        self.assertIn('may already be registered', str(list(get_messages(response.wsgi_request))[0]))
+        self.assertEqual(PatientProfile.objects.count(), 2)
+
+
+class GlobalSearchTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.appointments = [create_appointment_payment(self.patient)[0] for _ in range(3)]
+        appointment = self.appointments[0]
+        Prescription.objects.create(
+            appointment=appointment, patient=self.patient, doctor=appointment.doctor,
+            medicine_name='Metformin', dosage='1', frequency='Daily', duration='5 days', instructions='-',
+        )
+
+    def results(self, query, **kwargs):
+        return {group['type']: [hit['id'] for hit in group['results']] for group in global_search(query, **kwargs)}
+
+    def test_groups_are_ranked_and_capped_per_type(self):
+        for backend in ('basic', 'auto'):
+            with self.subTest(backend=backend), override_settings(PATIENT_SEARCH_BACKEND=backend):
+                groups = global_search('asha', group_size=2)
+                self.assertEqual(groups[0]['type'], 'patient')
+                self.assertEqual(
+                    groups[0]['results'][0]['url'], reverse('frontdesk_patients_detail', args=[self.patient.id]),
+                )
+                counts = {group['type']: len(group['results']) for group in groups}
+                self.assertEqual(counts, {'patient': 1, 'appointment': 2, 'payment': 2, 'prescription': 1})
+                self.assertEqual(list(self.results('metf')), ['prescription'])
+
+    def test_documents_follow_patient_edits(self):
+        self.patient.full_name = 'Asha Menon'
+        self.patient.save()
+        self.assertEqual(
+            sorted(self.results('menon')['appointment']), sorted(a.id for a in self.appointments),
+        )
+        self.assertEqual(self.results('rao'), {})
+
+        patient = PatientProfile.objects.get(id=self.patient.id)
+        with mock.patch('core.global_search.index_patient_related') as reindex_related:
+            patient.status = 'Inactive'
+            patient.save()
+            reindex_related.assert_not_called()
+            patient.phone = '9000000009'
+            patient.save()
+            reindex_related.assert_called_once_with(patient)
+
+    def test_deleted_rows_leave_the_index(self):
+        appointment = self.appointments[-1]
+        appointment.delete()
+        self.assertNotIn(appointment.id, self.results('asha')['appointment'])
+
+        self.patient.delete()
+        self.assertEqual(self.results('asha'), {})
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM core_search_fts WHERE core_search_fts MATCH 'asha*'")
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class EventRecorder:
+    def __init__(self):
+        self.payments = []
+
+    def __call__(self, sender, payment, **kwargs):
+        self.payments.append(payment.id)
+
+    def __enter__(self):
+        payment_finalized.connect(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        payment_finalized.disconnect(self)
+
+
+class FinalizePaymentTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.appointment, self.payment = create_appointment_payment(self.patient)
+
+    def test_marks_payment_paid_and_schedules_appointment(self):
+        with EventRecorder() as events, self.captureOnCommitCallbacks(execute=True):
+            payment, replayed = finalize_payment(self.payment.id, 'Card', idempotency_key='key-1')
+
+        self.assertFalse(replayed)
+        self.payment.refresh_from_db()
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'Paid')
+        self.assertEqual(self.payment.payment_method, 'Card')
+        self.assertEqual(self.payment.idempotency_key, 'key-1')
+        self.assertTrue(self.payment.transaction_id)
+        self.assertEqual(self.appointment.status, 'Scheduled')
+        self.assertEqual(events.payments, [self.payment.id])
+
+    def test_writes_each_row_once(self):
+        saved = []
+
+        def record(sender, instance, **kwargs):
+            saved.append(sender.__name__)
+
+        post_save.connect(record)
+        try:
+            finalize_payment(self.payment.id, 'Card')
+        finally:
+            post_save.disconnect(record)
+        self.assertEqual(sorted(saved), ['Appointment', 'Payment'])
+
+    def test_promotes_the_linked_test_booking(self):
+        lab = Lab.objects.create(name='Main Lab', address='1 Road', phone='1234567890')
+        test = DiagnosticTest.objects.create(
+            lab=lab, test_name='HbA1c', category='Blood', price=300, result_duration='1 day',
+        )
+        booking = TestBooking.objects.create(
+            patient=self.patient, test=test, lab=lab, booking_date=date.today(),
+        )
+        # Another pending booking of the same test must be left alone
+        other = TestBooking.objects.create(
+            patient=self.patient, test=test, lab=lab, booking_date=date.today(),
+        )
+        payment = Payment.objects.create(
+            patient=self.patient, test_booking=booking, amount=300, payment_method='UPI',
+        )
+
+        finalize_payment(payment.id, 'UPI')
+
+        booking.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(booking.status, 'Booked')
+        self.assertEqual(other.status, 'Pending Payment')
+
+    def test_duplicate_submit_is_replayed_without_writes(self):
+        with EventRecorder() as events, self.captureOnCommitCallbacks(execute=True):
+            first = finalize_payment(self.payment.id, 'Card', idempotency_key='key-1')
+        with EventRecorder() as events, self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(3):  # savepoint, locking select, release
+                second = finalize_payment(self.payment.id, 'Card', idempotency_key='key-1')
+
+        self.assertTrue(second.replayed)
+        self.assertEqual(second.payment.transaction_id, first.payment.transaction_id)
+        self.assertEqual(events.payments, [])
+
+    def test_key_of_another_payment_is_rejected(self):
+        _, other_payment = create_appointment_payment(self.patient)
+        finalize_payment(other_payment.id, 'Card', idempotency_key='key-1')
+
+        with self.assertRaises(PaymentError):
+            finalize_payment(self.payment.id, 'Card', idempotency_key='key-1')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'Pending')
+
+    def test_other_patients_payment_is_not_found(self):
+        with self.assertRaises(Payment.DoesNotExist):
+            finalize_payment(self.payment.id, 'Card', patient=create_patient('someone-else'))
+
+    @override_settings(PAYMENT_GATEWAY='direct')
+    def test_double_posted_form_pays_once(self):
+        self.client.login(username='patient', password='secret123')
+        url = reverse('process_payment', args=[self.payment.id])
+        data = {'payment_method': 'Card', 'idempotency_key': 'form-key'}
+
+        with EventRecorder() as events, self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(url, data)
+            second = self.client.post(url, data)
+
+        self.assertRedirects(first, reverse('patient_dashboard'), fetch_redirect_response=False)
+        self.assertRedirects(second, reverse('patient_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(events.payments, [self.payment.id])
+        self.assertEqual(Payment.objects.get(id=self.payment.id).payment_status, 'Paid')
+
+
+class SettleCashPaymentsTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.cash = []
+        for _ in range(3):
+            appointment, payment = create_appointment_payment(self.patient)
+            Payment.objects.filter(id=payment.id).update(payment_method='Cash')
+            self.cash.append((appointment, payment))
+
+    def test_settles_payments_and_schedules_appointments(self):
+        ids = [payment.id for _, payment in self.cash]
+        with self.assertNumQueries(8):  # savepoint, select, 3 updates, reindex select + upsert, release
+            settlement = settle_cash_payments(ids)
+
+        self.assertEqual(len(settlement.payments), 3)
+        self.assertEqual(settlement.total, 1500)
+        self.assertEqual(settlement.appointments, 3)
+        self.assertEqual(settlement.skipped, [])
+        self.assertEqual(
+            set(Payment.objects.filter(id__in=ids).values_list('payment_status', flat=True)), {'Paid'},
+        )
+        self.assertEqual(
+            set(Appointment.objects.filter(payments__id__in=ids).values_list('status', flat=True)), {'Scheduled'},
+        )
+
+    def test_skips_payments_that_are_not_pending_cash(self):
+        _, card = create_appointment_payment(self.patient)
+        _, settled = self.cash[0]
+        finalize_payment(settled.id, 'Cash')
+
+        settlement = settle_cash_payments([card.id, settled.id, self.cash[1][1].id])
+
+        self.assertEqual([payment.id for payment in settlement.payments], [self.cash[1][1].id])
+        self.assertEqual(settlement.skipped, sorted([card.id, settled.id]))
+        self.assertEqual(Payment.objects.get(id=card.id).payment_status, 'Pending')
+
+    def test_all_pending_cash_for_a_day(self):
+        settlement = settle_cash_payments(day=date.today())
+        self.assertEqual(len(settlement.payments), 3)
+        self.assertEqual(settle_cash_payments(day=date.today() - timedelta(days=1)).payments, [])
+
+
+class PaymentStatsTests(TestCase):
+    def setUp(self):
+        patient = create_patient()
+        self.payments = [create_appointment_payment(patient)[1] for _ in range(3)]
+        # Two payments taken on earlier days
+        for days_ago, payment in ((2, self.payments[0]), (5, self.payments[1])):
+            Payment.objects.filter(id=payment.id).update(payment_date=timezone.now() - timedelta(days=days_ago))
+        finalize_payment(self.payments[1].id, 'Card')
+
+    def test_status_totals(self):
+        stats = status_totals(Payment.objects.all())
+        self.assertEqual((stats['paid_count'], stats['paid_total']), (1, 500))
+        self.assertEqual((stats['pending_count'], stats['pending_total']), (2, 1000))
+        self.assertEqual((stats['count'], stats['total']), (3, 1500))
+
+    def test_closed_days_are_read_from_summaries(self):
+        self.assertEqual(overall_totals(), status_totals(Payment.objects.all()))
+        self.assertTrue(DailyPaymentSummary.objects.exists())
+
+        expected = status_totals(Payment.objects.all())
+        with self.assertNumQueries(2):  # summaries, today's payments
+            self.assertEqual(overall_totals(), expected)
+        self.assertEqual(overall_totals('Paid')['total'], 500)
+
+    def test_summary_follows_changes_to_closed_days(self):
+        overall_totals()
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_payment(self.payments[0].id, 'Cash')
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.get(id=self.payments[1].id).delete()
+
+        self.assertEqual(overall_totals(), status_totals(Payment.objects.all()))
+
+
+@override_settings(PAYMENT_GATEWAY='simulator', PAYMENT_SIMULATOR_FAILURE_RATE=0, PAYMENT_SIMULATOR_DUPLICATE_RATE=0)
+class SimulatorGatewayTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        self.appointment, self.payment = create_appointment_payment(self.patient)
+
+    def deliver(self, body, signature=None):
+        return self.client.post(
+            reverse('payment_webhook', args=['simulator']), body, content_type='application/json',
+            HTTP_X_SIMULATOR_SIGNATURE=signature or sign(body),
+        )
+
+    def test_payment_is_confirmed_by_the_webhook(self):
+        charge = start_payment(self.payment.id, 'Card', idempotency_key='key-1')
+        self.assertFalse(charge.confirmed)
+        self.assertEqual(Payment.objects.get(id=self.payment.id).payment_status, 'Pending')
+
+        self.assertEqual(self.deliver(charge.events[0]).status_code, 200)
+        self.assertEqual(process_inbox(), 1)
+
+        self.payment.refresh_from_db()
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'Paid')
+        self.assertEqual(self.payment.idempotency_key, 'key-1')
+        self.assertEqual(self.appointment.status, 'Scheduled')
+
+    def test_duplicate_deliveries_are_recorded_once(self):
+        with self.settings(PAYMENT_SIMULATOR_DUPLICATE_RATE=1):
+            charge = start_payment(self.payment.id, 'Card')
+        self.assertEqual(len(charge.events), 2)
+        for body in charge.events:
+            self.deliver(body)
+
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        with EventRecorder() as events, self.captureOnCommitCallbacks(execute=True):
+            process_inbox()
+        self.assertEqual(events.payments, [self.payment.id])
+
+    def test_failed_charge_marks_payment_failed(self):
+        with self.settings(PAYMENT_SIMULATOR_FAILURE_RATE=1):
+            charge = start_payment(self.payment.id, 'UPI')
+        self.deliver(charge.events[0])
+        process_inbox()
+
+        self.assertEqual(Payment.objects.get(id=self.payment.id).payment_status, 'Failed')
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, 'Pending Payment')
+
+    def test_resubmitted_form_reuses_the_charge(self):
+        first = start_payment(self.payment.id, 'Card', idempotency_key='key-1')
+        second = start_payment(self.payment.id, 'Card', idempotency_key='key-1')
+        self.assertEqual(second.reference, first.reference)
+        self.assertEqual(second.events, [])
+
+    def test_cash_is_left_for_the_counter(self):
+        charge = start_payment(self.payment.id, 'Cash')
+        self.assertIsNone(charge.reference)
+        payment = Payment.objects.get(id=self.payment.id)
+        self.assertEqual((payment.payment_method, payment.payment_status), ('Cash', 'Pending'))
+
+    def test_bad_signature_is_rejected(self):
+        charge = start_payment(self.payment.id, 'Card')
+        self.assertEqual(self.deliver(charge.events[0], signature='forged').status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_failing_event_is_retried_later(self):
+        body = SimulatorGateway().events_for(self.payment, 'sim_unknown', 'Card')[0]
+        # Points at a payment that does not exist
+        body = body.replace(f'"payment_id": {self.payment.id}'.encode(), b'"payment_id": 0')
+        self.deliver(body)
+        process_inbox()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('Pending', 1))
+        self.assertIn('DoesNotExist', event.last_error)
+        self.assertGreater(event.available_at, event.received_at)
+        self.assertEqual(process_inbox(), 0)  # not due yet
+
+    def test_payment_page_waits_for_confirmation(self):
+        self.client.login(username='patient', password='secret123')
+        response = self.client.post(
+            reverse('process_payment', args=[self.payment.id]), {'payment_method': 'Card'},
+        )
+        self.assertRedirects(response, reverse('payment_processing', args=[self.payment.id]))
+        status = self.client.get(reverse('payment_status_json', args=[self.payment.id])).json()
+        self.assertEqual(status, {'status': 'Pending', 'transaction_id': None})
+
+
+class TransactionIdTests(TestCase):
+    def test_ids_increase_with_issue_time(self):
+        generator = TransactionIdGenerator()
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+        issued = issued_at(ids[0])
+        now = datetime.now(dt_timezone.utc)
+        self.assertLess(abs(now - issued), timedelta(seconds=5))
+        low, high = id_bounds(now - timedelta(minutes=1), now + timedelta(minutes=1))
+        self.assertTrue(low <= ids[0] < high)
+
+    def test_clock_going_back_does_not_reorder_ids(self):
+        generator = TransactionIdGenerator()
+        clock = iter([2000, 2000, 1000, 3000])
+        generator._now_ms = lambda: next(clock)
+        ids = [generator.next_id() for _ in range(4)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_payments_get_unique_ids(self):
+        patient = create_patient()
+        payments = [create_appointment_payment(patient)[1] for _ in range(3)]
+        ids = [payment.transaction_id for payment in payments]
+        self.assertEqual(ids, sorted(set(ids)))
+
+
+class PaymentReceiptTests(TestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        _, self.payment = create_appointment_payment(self.patient)
+
+    def test_receipt_stored_when_payment_finalized(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_payment(self.payment.id, 'Card')
+
+        receipt = PaymentReceipt.objects.get(payment=self.payment)
+        self.payment.refresh_from_db()
+        self.assertEqual(receipt.transaction_id, self.payment.transaction_id)
+        self.assertIn(self.payment.transaction_id, receipt.html)
+        self.assertIn('Asha Rao', receipt.html)
+        with self.assertNumQueries(1):
+            self.assertEqual(receipt_html(self.payment.id), receipt.html)
+
+    def test_receipts_stored_when_cash_settled(self):
+        Payment.objects.filter(id=self.payment.id).update(payment_method='Cash')
+        with self.captureOnCommitCallbacks(execute=True):
+            settle_cash_payments([self.payment.id])
+        self.assertTrue(PaymentReceipt.objects.filter(payment=self.payment).exists())
+
+    def test_receipt_dropped_when_payment_leaves_paid(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_payment(self.payment.id, 'Card')
+        payment = Payment.objects.get(id=self.payment.id)
+        payment.payment_status = 'Failed'
+        payment.save()
+        self.assertFalse(PaymentReceipt.objects.filter(payment=payment).exists())
+
+    def test_receipt_stored_when_payment_saved_as_paid(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.payment_status = 'Paid'
+            self.payment.save()
+        self.assertTrue(PaymentReceipt.objects.filter(payment=self.payment).exists())
+
+    def test_backfill_stores_missing_receipts(self):
+        # Marked Paid by a queryset update, so no receipt yet
+        Payment.objects.filter(id=self.payment.id).update(payment_status='Paid', transaction_id='TXNLEGACY01')
+        today = timezone.localdate()
+        self.assertFalse(receipts_between(today, today).exists())
+
+        self.assertEqual(backfill_receipts(), 1)
+        self.assertEqual(backfill_receipts(), 0)
+
+        [receipt] = receipts_between(today, today)
+        self.assertIn('TXNLEGACY01', receipt.html)
+        self.assertFalse(receipts_between(today - timedelta(days=2), today - timedelta(days=1)).exists())
+
+    @mock.patch('core.views.RECEIPT_REPRINT_PAGE_SIZE', 1)
+    def test_reprint_page_reads_stored_receipts_a_page_at_a_time(self):
+        _, other = create_appointment_payment(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_payment(self.payment.id, 'Card')
+            finalize_payment(other.id, 'Card')
+        _, unpaid = create_appointment_payment(self.patient)
+        Payment.objects.filter(id=unpaid.id).update(payment_status='Paid')
+        create_frontdesk()
+        self.client.login(username='frontdesk', password='secret123')
+
+        receipts = PaymentReceipt.objects.order_by('issued_at', 'id')
+        first = self.client.get(reverse('payment_receipts_reprint'))
+        self.assertEqual(list(first.context['page']), [receipts[0]])
+        second = self.client.get(f"{reverse('payment_receipts_reprint')}?{first.context['page'].next_query}")
+        self.assertEqual(list(second.context['page']), [receipts[1]])
+        self.assertFalse(second.context['page'].has_next)
+        # Viewing stores nothing
+        self.assertFalse(PaymentReceipt.objects.filter(payment=unpaid).exists())
+
+def create_lab_bookings(count):
+    """A lab technician and ``count`` booked tests in their lab."""
+    patient = create_patient()
+    create_appointment_payment(patient)  # for its doctor
+    lab = Lab.objects.create(name='Main Lab', address='1 Road', phone='1234567890')
+    test = DiagnosticTest.objects.create(
+        lab=lab, test_name='HbA1c', category='Blood', price=300, result_duration='1 day',
+    )
+    tech = LabTechnicianProfile.objects.create(
+        user=User.objects.create_user(username='tech', password='secret123'), lab=lab, phone='1',
+    )
+    bookings = [
+        TestBooking.objects.create(patient=patient, test=test, lab=lab, booking_date=date.today(), status='Booked')
+        for _ in range(count)
+    ]
+    return tech, bookings
+
+
+class LabResultEntryTests(TestCase):
+    def setUp(self):
+        self.tech, self.bookings = create_lab_bookings(5)
+
+    def grid(self, value='5.4', status='Completed'):
+        return {booking.id: ResultEntry(booking.id, value, status) for booking in self.bookings}
+
+    def test_saves_grid_in_one_batch(self):
+        with self.assertNumQueries(6):  # savepoint, lock, doctor, insert, update, release
+            batch = save_results(self.tech, self.grid())
+
+        self.assertEqual(batch.errors, {})
+        self.assertEqual(len(batch.results), 5)
+        self.assertEqual(LabResult.objects.filter(lab_technician=self.tech, test_value='5.4').count(), 5)
+        self.assertEqual(
+            set(TestBooking.objects.filter(id__in=[b.id for b in self.bookings]).values_list('status', flat=True)),
+            {'Completed'},
+        )
+
+    def test_invalid_row_saves_nothing(self):
+        entries = self.grid()
+        first = self.bookings[0].id
+        entries[first] = ResultEntry(first, 'x' * 101, 'Completed')
+
+        batch = save_results(self.tech, entries)
+
+        self.assertEqual(list(batch.errors), [first])
+        self.assertFalse(LabResult.objects.exists())
+        self.assertFalse(TestBooking.objects.filter(status='Completed').exists())
+
+    def test_rejects_bookings_of_other_labs_and_completed_tests(self):
+        other_lab = Lab.objects.create(name='Other Lab', address='2 Road', phone='1234567891')
+        other = TestBooking.objects.create(
+            patient=self.bookings[0].patient, test=self.bookings[0].test, lab=other_lab,
+            booking_date=date.today(), status='Booked',
+        )
+        save_results(self.tech, self.grid())
+
+        batch = save_results(self.tech, {
+            self.bookings[0].id: ResultEntry(self.bookings[0].id, '6.0', 'Completed'),
+            other.id: ResultEntry(other.id, '6.0', 'Completed'),
+        })
+
+        self.assertEqual(set(batch.errors), {self.bookings[0].id, other.id})
+        self.assertEqual(LabResult.objects.count(), 5)
+
+    def test_results_page_saves_all_rows(self):
+        self.client.login(username='tech', password='secret123')
+        data = {'save_all': '1'}
+        for booking in self.bookings:
+            data[f'status_{booking.id}'] = 'Completed'
+            data[f'result_{booking.id}'] = '5.4'
+        data[f'status_{self.bookings[0].id}'] = 'Booked'
+        data[f'result_{self.bookings[0].id}'] = ''
+
+        response = self.client.post(reverse('lab_results'), data)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(LabResult.objects.count(), 4)
+        self.assertEqual(TestBooking.objects.get(id=self.bookings[0].id).status, 'Booked')
+
+    def test_unpaid_and_cancelled_bookings_are_left_alone(self):
+        cancelled, unpaid = self.bookings[:2]
+        TestBooking.objects.filter(id=cancelled.id).update(status='Cancelled')
+        TestBooking.objects.filter(id=unpaid.id).update(status='Pending Payment')
+
+        batch = save_results(self.tech, {
+            cancelled.id: ResultEntry(cancelled.id, '', 'Booked'),
+            unpaid.id: ResultEntry(unpaid.id, '', 'Booked'),
+        })
+
+        self.assertEqual(set(batch.errors), {cancelled.id, unpaid.id})
+        self.assertEqual(TestBooking.objects.get(id=cancelled.id).status, 'Cancelled')
+        self.assertEqual(TestBooking.objects.get(id=unpaid.id).status, 'Pending Payment')
+
+        self.client.login(username='tech', password='secret123')
+        response = self.client.get(reverse('lab_results'))
+        self.assertNotContains(response, f'name="status_{cancelled.id}"')
+        self.assertNotContains(response, f'name="status_{unpaid.id}"')
+        self.assertContains(response, f'name="status_{self.bookings[2].id}"')
+
+
+    def test_entry_statuses_are_booking_choices(self):
+        self.assertLessEqual(set(ENTRY_STATUSES), {value for value, _ in TestBooking.STATUS_CHOICES})
+        claimed = self.bookings[0]
+        claimed.status = 'In Progress'
+        claimed.full_clean()
+
+    def test_results_page_counts_bookings(self):
+        TestBooking.objects.filter(id=self.bookings[0].id).update(status='Completed')
+        TestBooking.objects.filter(id=self.bookings[1].id).update(status='In Progress')
+        TestBooking.objects.filter(id=self.bookings[2].id).update(status='Cancelled')
+
+        self.client.login(username='tech', password='secret123')
+        response = self.client.get(reverse('lab_results'))
+
+        self.assertEqual(
+            [response.context[key] for key in ('total_count', 'pending_count', 'completed_count')], [5, 3, 1],
+        )
+
+@override_settings(RENDER_POOL_WORKERS=0)
+class LabReportExportTests(TestCase):
+    def setUp(self):
+        self.tech, self.bookings = create_lab_bookings(3)
+        doctor = DoctorProfile.objects.get()
+        patient = self.bookings[0].patient
+        LabResult.objects.bulk_create([
+            LabResult(
+                patient=patient, doctor=doctor, lab_technician=self.tech, test_name='HbA1c', test_value='5.4',
+                normal_range='4.0-5.6', result_status='Abnormal' if index % 4 == 0 else 'Normal', remarks='',
+                test_date=date(2026, 3, 1) + timedelta(days=index % 28),
+            )
+            for index in range(120)
+        ] + [LabResult(
+            patient=patient, doctor=doctor, lab_technician=self.tech, test_name='HbA1c', test_value='5.4',
+            normal_range='', result_status='Normal', remarks='', test_date=date(2026, 5, 1),
+        )])
+        self.client.login(username='tech', password='secret123')
+
+    def export(self, fmt):
+        return self.client.get(reverse('export_lab_report'), {
+            'start_date': '2026-03-01', 'end_date': '2026-03-31', 'format': fmt,
+        })
+
+    def test_pdf_streams_every_result_through_a_temp_file(self):
+        seen = {}
+
+        def render(spec, timeout=None):
+            table = spec['sections'][2]['table']
+            with open(table['rows_file'], encoding='utf-8') as rows_file:
+                seen['rows'] = rows_file.read().splitlines()
+            seen['path'] = table['rows_file']
+            seen['summary'] = dict(spec['sections'][0]['table']['rows'][1:])
+            return b'%PDF-stub'
+
+        with mock.patch('core.views.render_pdf', side_effect=render):
+            response = self.export('pdf')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(seen['rows']), 120)
+        self.assertEqual(seen['rows'][0], 'Asha Rao,HbA1c,Abnormal,01-03-2026')
+        self.assertEqual(seen['summary']['Completed Tests'], 120)
+        self.assertEqual(seen['summary']['Abnormal Results'], 30)
+        self.assertFalse(os.path.exists(seen['path']))
+
+    def test_excel_has_the_same_rows_as_the_pdf(self):
+        import openpyxl
+
+        response = self.export('excel')
+
+        self.assertEqual(response.status_code, 200)
+        sheet = openpyxl.load_workbook(io.BytesIO(response.content)).active
+        rows = list(sheet.iter_rows(values_only=True))
+        header = rows.index(('Patient', 'Test Name', 'Result Status', 'Date'))
+        self.assertEqual(len(rows) - header - 1, 120)
+        self.assertIn(('Abnormal Results', 30, None, None), rows)
+
+
+class AnalyzerIngestTests(TestCase):
+    def setUp(self):
+        self.tech, self.bookings = create_lab_bookings(5)
+
+    def ingest(self, text, **kwargs):
+        return ingest_results(io.StringIO(text), self.tech, **kwargs)
+
+    def test_imports_lines_in_chunks(self):
+        lines = ''.join(f"LAB-{booking.id:06d}\t5.{i}\t4.0-5.6\tN\n" for i, booking in enumerate(self.bookings))
+        text = "Accession No\tResult\tReference Range\tFlag\n" + lines
+
+        # doctor, then per chunk: savepoint, lock, insert, update, release
+        with self.assertNumQueries(1 + 3 * 5):
+            report = self.ingest(text, chunk_size=2)
+
+        self.assertEqual((report.lines, report.created, report.error_count), (5, 5, 0))
+        result = LabResult.objects.order_by('id').first()
+        self.assertEqual((result.test_value, result.normal_range), ('5.0', '4.0-5.6'))
+        self.assertEqual((result.numeric_value, result.flag, result.result_status), (5.0, 'Normal', 'Normal'))
+        self.assertFalse(TestBooking.objects.exclude(status='Completed').exists())
+
+    def test_reports_bad_lines_and_keeps_going(self):
+        first, second = self.bookings[0].id, self.bookings[1].id
+        text = (
+            "booking_id,result\n"
+            f"{first},5.1\n"
+            "not-an-id,5.2\n"
+            "999999,5.3\n"
+            f"{first},5.4\n"
+            "\n"
+            f"{second},\n"
+            f"{self.bookings[2].id},5.5\n"
+        )
+        reported = []
+
+        report = self.ingest(text, on_error=reported.append)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual([error.line for error in report.errors], [3, 4, 5, 7])
+        self.assertEqual(reported, report.errors)
+        self.assertIn('already has a result', report.errors[2].message)
+
+    def test_rejects_file_without_required_columns(self):
+        with self.assertRaises(IngestFileError):
+            self.ingest("sample,reading\n1,5.0\n")
+
+    def test_skips_cancelled_and_unpaid_bookings(self):
+        cancelled, unpaid, booked = self.bookings[:3]
+        TestBooking.objects.filter(id=cancelled.id).update(status='Cancelled')
+        TestBooking.objects.filter(id=unpaid.id).update(status='Pending Payment')
+
+        report = self.ingest(f"booking_id,result\n{cancelled.id},5.1\n{unpaid.id},5.2\n{booked.id},5.3\n")
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual([error.line for error in report.errors], [2, 3])
+        self.assertEqual(TestBooking.objects.get(id=cancelled.id).status, 'Cancelled')
+        self.assertEqual(TestBooking.objects.get(id=unpaid.id).status, 'Pending Payment')
+        self.assertEqual(list(LabResult.objects.values_list('test_value', flat=True)), ['5.3'])
+
+
+class LabValueTests(TestCase):
+    def test_parses_free_text(self):
+        self.assertEqual(parse_value('5.4 mmol/L'), (5.4, 'mmol/L'))
+        self.assertEqual(parse_value('<0.1'), (0.1, ''))
+        self.assertEqual(parse_value('Positive'), (None, ''))
+        self.assertEqual(parse_range('4.0 - 5.6 mmol/L'), (4.0, 5.6, 'mmol/L'))
+        self.assertEqual(parse_range('< 200'), (None, 200.0, ''))
+        self.assertEqual(parse_range('>= 40'), (40.0, None, ''))
+        self.assertEqual(parse_range('Negative'), (None, None, ''))
+
+    def test_flags_with_and_without_numpy(self):
+        nan = float('nan')
+        columns = ([5.0, 3.0, 9.0, nan, 5.0, 7.0], [4.0, 4.0, 4.0, 4.0, nan, nan], [6.0, 6.0, 6.0, 6.0, nan, 6.5])
+        expected = ['Normal', 'Low', 'High', '', '', 'High']
+        if lab_values.np is not None:
+            self.assertEqual(compute_flags(*columns), expected)
+        with mock.patch.object(lab_values, 'np', None):
+            self.assertEqual(compute_flags(*columns), expected)
+
+    def test_classify_uses_reference_table_when_units_agree(self):
+        TestReferenceRange.objects.create(test_code='GLU', unit='mg/dL', low=70, high=100)
+        own_range = LabResult(test_code='GLU', test_value='250', normal_range='80-300', result_status='Pending')
+        from_table = LabResult(test_code='GLU', test_value='120 mg/dL', normal_range='', result_status='Pending')
+        other_unit = LabResult(test_code='GLU', test_value='6.1 mmol/L', normal_range='', result_status='Pending')
+        text = LabResult(test_code='GLU', test_value='Positive', normal_range='', result_status='Pending')
+
+        with self.assertNumQueries(1):
+            classify([own_range, from_table, other_unit, text])
+
+        self.assertEqual((own_range.flag, own_range.result_status), ('Normal', 'Normal'))
+        self.assertEqual((from_table.flag, from_table.result_status), ('High', 'Abnormal'))
+        self.assertEqual(from_table.normal_range, '70-100 mg/dL')
+        self.assertEqual((other_unit.flag, other_unit.reference_low), ('', None))
+        self.assertEqual((text.numeric_value, text.flag, text.result_status), (None, '', 'Pending'))
+
+    def test_backfill_classifies_existing_results_in_chunks(self):
+        tech, bookings = create_lab_bookings(0)
+        DiagnosticTest.objects.update(test_code='HBA1C')
+        doctor = DoctorProfile.objects.get()
+        for value in ('5.0', '7.5', 'Pending'):
+            LabResult.objects.create(
+                patient=PatientProfile.objects.get(), doctor=doctor, lab_technician=tech, test_name='HbA1c',
+                test_value=value, normal_range='4.0-5.6', result_status='Completed', remarks='',
+                test_date=date.today(),
+            )
+
+        self.assertEqual(backfill(chunk_size=2), 3)
+
+        self.assertEqual(
+            list(LabResult.objects.order_by('id').values_list('test_code', 'numeric_value', 'flag')),
+            [('HBA1C', 5.0, 'Normal'), ('HBA1C', 7.5, 'High'), ('HBA1C', None, '')],
+        )
+        self.assertEqual(backfill(), 0)
+
+class LabSeriesTests(TestCase):
+    def setUp(self):
+        self.tech, _ = create_lab_bookings(0)
+        self.patient = PatientProfile.objects.get()
+        self.doctor = DoctorProfile.objects.get()
+        start = date(2024, 1, 1)
+        LabResult.objects.bulk_create([
+            LabResult(
+                patient=self.patient, doctor=self.doctor, lab_technician=self.tech, test_name='HbA1c',
+                test_code='HBA1C', test_value=str(value), numeric_value=value, unit='%', result_status='Normal',
+                remarks='', test_date=start + timedelta(days=7 * i),
+            )
+            for i, value in enumerate([6.0] * 50 + [9.5] + [6.0] * 49)
+        ] + [
+            LabResult(
+                patient=self.patient, doctor=self.doctor, lab_technician=self.tech, test_name='Urine culture',
+                test_value='Negative', result_status='Pending', remarks='', test_date=start,
+            ),
+        ])
+
+    def test_lttb_keeps_ends_and_spikes(self):
+        ys = [0.0] * 100
+        ys[37] = 10.0
+        keep = lttb_indices(list(range(100)), ys, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertIn(37, keep)
+        self.assertEqual(lttb_indices([1, 2], [1, 2], 10), [0, 1])
+
+    def test_series_per_test_downsampled(self):
+        with self.assertNumQueries(1):
+            series = patient_series(self.patient, max_points=20)
+
+        self.assertEqual(len(series), 1)  # text results have no series
+        hba1c = series[0]
+        self.assertEqual((hba1c['key'], hba1c['count'], hba1c['unit']), ('HBA1C', 100, '%'))
+        self.assertEqual(len(hba1c['dates']), 20)
+        self.assertEqual(hba1c['dates'], sorted(hba1c['dates']))
+        self.assertIn(9.5, hba1c['values'])
+
+    def test_endpoint_access(self):
+        url = reverse('patient_lab_series', args=[self.patient.id])
+        self.client.login(username='patient', password='secret123')
+        response = self.client.get(url, {'test': 'HBA1C', 'from': '2024-03-01', 'points': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['series'][0]['values']), 5)
+        self.assertEqual(self.client.get(url, {'points': 1}).status_code, 400)
+
+        create_frontdesk()
+        for username in ('tech', 'frontdesk'):
+            self.client.login(username=username, password='secret123')
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.doctor.user)  # has an appointment with the patient
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+class LabWorkQueueTests(TestCase):
+    def setUp(self):
+        self.tech, self.bookings = create_lab_bookings(4)
+        self.other_tech = LabTechnicianProfile.objects.create(
+            user=User.objects.create_user(username='tech2', password='secret123'), lab=self.tech.lab, phone='2',
+        )
+
+    def test_parses_durations(self):
+        self.assertEqual(parse_duration('24 hours'), timedelta(hours=24))
+        self.assertEqual(parse_duration('2-3 days'), timedelta(days=3))
+        self.assertEqual(parse_duration('45 min'), timedelta(minutes=45))
+        self.assertIsNone(parse_duration('Same day'))
+
+    def test_due_at_follows_result_duration(self):
+        booking = self.bookings[0]
+        self.assertAlmostEqual(booking.due_at, booking.created_at + timedelta(days=1), delta=timedelta(seconds=1))
+
+        test = booking.test
+        test.result_duration = '2-3 days'
+        test.save()
+        booking.refresh_from_db()
+        self.assertEqual(booking.due_at, booking.created_at + timedelta(days=3))
+
+    def test_claims_most_urgent_first_without_overlap(self):
+        TestBooking.objects.filter(id=self.bookings[3].id).update(due_at=timezone.now() - timedelta(hours=1))
+
+        first = claim_next(self.tech, 2)
+        second = claim_next(self.other_tech, 5)
+
+        self.assertEqual([b.id for b in first], [self.bookings[3].id, self.bookings[0].id])
+        self.assertEqual([b.id for b in second], [self.bookings[1].id, self.bookings[2].id])
+        self.assertEqual(claim_next(self.tech), [])
+        self.assertEqual(TestBooking.objects.get(id=self.bookings[3].id).status, 'In Progress')
+
+    def test_lapsed_and_released_claims_return_to_queue(self):
+        claimed = claim_next(self.tech, 2)
+        self.assertEqual(release(self.other_tech, [claimed[0].id]), 0)
+        self.assertEqual(release(self.tech, [claimed[0].id]), 1)
+        TestBooking.objects.filter(id=claimed[1].id).update(claimed_at=timezone.now() - timedelta(hours=3))
+
+        self.assertEqual(
+            [b.id for b in next_due(self.tech.lab)],
+            [self.bookings[0].id, self.bookings[1].id, self.bookings[2].id, self.bookings[3].id],
+        )
+
+    def test_queue_endpoints(self):
+        self.client.login(username='tech', password='secret123')
+        response = self.client.get(reverse('lab_queue_next'), {'limit': 2})
+        self.assertEqual([t['id'] for t in response.json()['tests']], [b.id for b in self.bookings[:2]])
+
+        response = self.client.post(reverse('lab_queue_claim'), {'count': 1})
+        self.assertEqual([t['id'] for t in response.json()['claimed']], [self.bookings[0].id])
+        self.assertEqual(self.client.get(reverse('lab_queue_claim')).status_code, 405)
+
+        self.client.login(username='patient', password='secret123')
+        self.assertEqual(self.client.post(reverse('lab_queue_claim')).status_code, 403)
+
+    def test_due_times_are_only_rewritten_when_the_duration_changes(self):
+        test = DiagnosticTest.objects.get(id=self.bookings[0].test_id)
+        test.price = 350
+        with self.assertNumQueries(1):
+            test.save()
+
+        test.result_duration = '2 days'
+        with self.assertNumQueries(2):
+            test.save()
+        with self.assertNumQueries(1):
+            test.save()
+
+    def test_claimed_tests_stay_on_the_pending_tabs(self):
+        claimed = claim_next(self.tech)[0]
+        self.client.login(username='tech', password='secret123')
+        for name in ('lab_tests', 'lab_results'):
+            with self.subTest(page=name):
+                response = self.client.get(reverse(name), {'status': 'Pending'})
+                self.assertIn(claimed.id, [booking.id for booking in response.context['page']])
+                self.assertEqual(response.context['pending_count'], 4)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentFinalizePaymentTests(TransactionTestCase):
+    """Duplicate submits racing in separate connections (needs row locks)."""
+
+    def test_concurrent_duplicate_submits_finalize_once(self):
+        patient = create_patient()
+        appointment, payment = create_appointment_payment(patient)
+        submits = 4
+        barrier = threading.Barrier(submits)
+        results, errors = [], []
+
+        def submit():
+            try:
+                barrier.wait()
+                results.append(finalize_payment(payment.id, 'Card', idempotency_key='same-key'))
+            except Exception as e:  # collected and asserted below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with EventRecorder() as events:
+            threads = [threading.Thread(target=submit) for _ in range(submits)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(result.replayed for result in results), [False] + [True] * (submits - 1))
+        self.assertEqual(len({result.payment.transaction_id for result in results}), 1)
+        self.assertEqual(events.payments, [payment.id])
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, 'Scheduled')
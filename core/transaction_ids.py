@@ -0,0 +1,116 @@
+"""
+Time-ordered payment transaction ids.
+
+An id is ``TXN`` followed by 16 Crockford base32 characters encoding 80
+bits, most significant first:
+
+* 48 bits - milliseconds since the Unix epoch
+* 20 bits - random id of the issuing process, redrawn after a fork
+* 12 bits - sequence within the millisecond in that process
+
+Ids from one process are strictly increasing (the clock is never allowed
+to go backwards and the sequence waits for the next millisecond when it
+runs out), and since the encoding is fixed width, ids sort by issue time
+as strings too. New rows therefore land at the end of the unique index
+on ``Payment.transaction_id``, and a time range maps to an id range
+(``id_bounds()``).
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+
+PREFIX = 'TXN'
+
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_LENGTH = 16
+_NODE_BITS = 20
+_SEQUENCE_BITS = 12
+_MAX_SEQUENCE = (1 << _SEQUENCE_BITS) - 1
+
+
+def _encode(value):
+    chars = []
+    for _ in range(_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return PREFIX + ''.join(reversed(chars))
+
+
+def _decode(transaction_id):
+    value = 0
+    for char in transaction_id[len(PREFIX):].upper():
+        value = value * 32 + _ALPHABET.index(char)
+    return value
+
+
+class TransactionIdGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.node = secrets.randbits(_NODE_BITS)
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _now_ms(self):
+        return time.time_ns() // 1_000_000
+
+    def next_id(self):
+        with self._lock:
+            now = max(self._now_ms(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence += 1
+                if self._sequence > _MAX_SEQUENCE:
+                    # Out of ids for this millisecond
+                    while now <= self._last_ms:
+                        now = self._now_ms()
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return _encode(
+                (now << (_NODE_BITS + _SEQUENCE_BITS)) | (self.node << _SEQUENCE_BITS) | self._sequence
+            )
+
+
+_generator = TransactionIdGenerator()
+
+if hasattr(os, 'register_at_fork'):
+    # A forked worker must not share its parent's process id and sequence
+    os.register_at_fork(after_in_child=_generator._reset)
+
+
+def new_transaction_id():
+    return _generator.next_id()
+
+
+def issued_at(transaction_id):
+    """When a transaction id was issued (UTC), or None if it is not one of ours."""
+    if not is_transaction_id(transaction_id):
+        return None
+    ms = _decode(transaction_id) >> (_NODE_BITS + _SEQUENCE_BITS)
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+def is_transaction_id(value):
+    value = (value or '').upper()
+    return (
+        len(value) == len(PREFIX) + _LENGTH
+        and value.startswith(PREFIX)
+        and all(char in _ALPHABET for char in value[len(PREFIX):])
+    )
+
+
+def id_bounds(start, end):
+    """
+    ``(low, high)`` such that ids issued in ``[start, end)`` satisfy
+    ``low <= transaction_id < high``.
+    """
+    def floor(moment):
+        return _encode(int(moment.timestamp() * 1000) << (_NODE_BITS + _SEQUENCE_BITS))
+    return floor(start), floor(end)
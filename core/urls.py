@@ -60,6 +60,7 @@ urlpatterns = [
     # ===== PAYMENTS =====
     path('dashboard/admin/payments/', views.admin_payments, name='admin_payments'),
     path('dashboard/admin/payments/receipt/<int:payment_id>/', views.admin_payment_receipt, name='admin_payment_receipt'),
+    path('payments/receipts/reprint/', views.payment_receipts_reprint, name='payment_receipts_reprint'),
 
     # ===== REPORTS =====
     path('dashboard/admin/reports/', views.admin_reports, name='admin_reports'),
@@ -82,6 +83,10 @@ urlpatterns = [
     path('dashboard/patient/book-test/<int:test_id>/', views.book_diagnostic_tests, name='book_diagnostic_tests'),
     # AJAX endpoint - Get doctors by specialization
     path('api/get-doctors/', views.get_doctors_by_specialization, name='get_doctors_by_specialization'),
+    path('api/doctors/', views.doctor_directory_json, name='doctor_directory_json'),
+    path('api/patients/duplicates/', views.patient_duplicates, name='patient_duplicates'),
+    path('api/search/', views.global_search_json, name='global_search'),
+    path('api/patients/<int:patient_id>/lab-series/', views.patient_lab_series, name='patient_lab_series'),
     # Search/Browse Doctors (optional - directory page)
     path('patient/search-doctors/', views.search_doctors, name='patient_search_doctors'),
 
@@ -148,6 +153,9 @@ urlpatterns = [
     path('patient/payments/', views.payments, name='payments'),
     path('patient/payments/<int:payment_id>/', views.payment_detail, name='payment_detail'),
     path('patient/payments/<int:payment_id>/pay/', views.process_payment, name='process_payment'),
+    path('patient/payments/<int:payment_id>/processing/', views.payment_processing, name='payment_processing'),
+    path('patient/api/payments/<int:payment_id>/status/', views.payment_status_json, name='payment_status_json'),
+    path('payments/webhook/<str:gateway>/', views.payment_webhook, name='payment_webhook'),
     path('patient/payment/test/<int:payment_id>/', views.process_test_payment, name='process_test_payment'),
     
     path('patient/settings/', views.patient_settings, name='patient_settings'),
@@ -186,6 +194,7 @@ urlpatterns = [
         path('prescription/<int:prescription_id>/edit/', views.doctor_edit_prescription, name='doctor_edit_prescription'),
         path('prescription/<int:prescription_id>/delete/', views.doctor_delete_prescription, name='doctor_delete_prescription'),
         path('prescription/<int:prescription_id>/print/', views.doctor_prescription_print, name='doctor_prescription_print'),
+        path('prescriptions/print/', views.doctor_prescriptions_batch_print, name='doctor_prescriptions_batch_print'),
     ])),
     
     path('doctor/patients/', 
@@ -265,6 +274,10 @@ urlpatterns = [
     path('test-details/<int:test_id>/', views.view_test_details, name='view_test_details'),
     path('lab/tests/', views.lab_tests, name='lab_tests'),
     path('lab/results/', views.lab_results, name='lab_results'),
+    path('lab/results/import/', views.lab_results_import, name='lab_results_import'),
+    path('lab/api/queue/next/', views.lab_queue_next, name='lab_queue_next'),
+    path('lab/api/queue/claim/', views.lab_queue_claim, name='lab_queue_claim'),
+    path('lab/api/queue/release/', views.lab_queue_release, name='lab_queue_release'),
     path('lab/prices/', views.lab_prices, name='lab_prices'),
     path('lab/add-test/', views.lab_add_test, name='lab_add_test'),
     path('lab/edit-test/<int:test_id>/', views.lab_edit_test, name='lab_edit_test'),
@@ -284,6 +297,8 @@ urlpatterns = [
     path('frontdesk/appointment/confirmation/<int:appointment_id>/', views.frontdesk_appointment_confirmation, name='frontdesk_appointment_confirmation'),
     path('frontdesk/api/available-slots/', views.frontdesk_get_available_slots, name='frontdesk_get_available_slots'),
     path('frontdesk/api/search-patient/', views.frontdesk_search_patient, name='frontdesk_search_patient'),
+    path('frontdesk/api/caller-lookup/', views.frontdesk_caller_lookup, name='frontdesk_caller_lookup'),
+    path('frontdesk/api/patient-typeahead/', views.frontdesk_patient_typeahead, name='frontdesk_patient_typeahead'),
     path('frontdesk/today-appointments/', views.frontdesk_today_appointments, name='frontdesk_today_appointments'),
     path('frontdesk/quick-checkin/<int:appointment_id>/', views.frontdesk_quick_checkin, name='frontdesk_quick_checkin'),
     path('frontdesk/check-in/', views.frontdesk_patient_checkin, name='frontdesk_patient_checkin'),
@@ -317,6 +332,8 @@ urlpatterns = [
     path('frontdesk/doctors/<int:doctor_id>/', views.frontdesk_doctor_detail, name='frontdesk_doctor_detail'),
     path('frontdesk/payments/', views.frontdesk_payments, name='frontdesk_payments'),
     path('frontdesk/payments/<int:payment_id>/', views.frontdesk_payment_detail, name='frontdesk_payment_detail'),
+    path('frontdesk/payments/settle-cash/', views.frontdesk_cash_settlement, name='frontdesk_cash_settlement'),
+    path('frontdesk/payments/<int:payment_id>/receipt/', views.frontdesk_payment_receipt, name='frontdesk_payment_receipt'),
     path('frontdesk/reports/', views.frontdesk_reports, name='frontdesk_reports'),
     path('frontdesk/settings/', views.frontdesk_settings, name='frontdesk_settings'),
     
@@ -1,8 +1,40 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.shortcuts import render, redirect
-from django.db.models import Count, Sum
+from django.db.models import Count, Sum, FilteredRelation
 from django.db.models.functions import TruncMonth
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from .forms import LabTechnicianForm
+from .exports import (
+    get_export_format,
+    export_response,
+    PAYMENT_EXPORT_COLUMNS,
+    APPOINTMENT_EXPORT_COLUMNS,
+    TEST_BOOKING_EXPORT_COLUMNS,
+    PRESCRIPTION_EXPORT_COLUMNS,
+    LAB_RESULT_EXPORT_COLUMNS,
+)
+from .report_cache import get_or_render_report, cached_pdf_response, write_back_result_file
+from .render_pool import render_pdf, render_xlsx, render_busy_response, RenderUnavailable
+from .patient_search import search_patients, search_patient_ids
+from .phones import caller_lookup_filter
+from .patient_typeahead import patient_typeahead, mask_phone
+from .patient_dedup import find_duplicates, likely_duplicates, duplicate_warning
+from .test_catalogue import get_catalogue
+from .doctor_directory import get_directory, directory_json_response
+from .pagination import keyset_paginate
+from .global_search import search as global_search
+from .payment_stats import overall_totals, status_totals
+from .payments import finalize_payment, new_idempotency_key, settle_cash_payments, PaymentError
+from .transaction_ids import PREFIX as TRANSACTION_ID_PREFIX, new_transaction_id
+from .payment_gateway import GATEWAYS, WebhookError, get_gateway, start_payment
+from .webhook_inbox import record_event
+from .receipts import receipt_html, receipts_between
+from .lab_results import entries_from_post, save_results
+from .lab_series import MIN_POINTS as MIN_SERIES_POINTS, patient_series
+from .lab_queue import MAX_CLAIM as MAX_QUEUE_CLAIM, claim_next, next_due, release as release_claims
+from .analyzer_ingest import IngestFileError, ingest_results, text_stream
 
 
 import core
@@ -205,7 +237,7 @@ def patient_dashboard(request):
         # Get pending test bookings
         pending_tests = TestBooking.objects.filter(
             patient=patient_profile,
-            status__in=['Booked', 'Pending']
+            status__in=['Booked', 'In Progress', 'Pending']
         )
         
         context['pending_tests_count'] = pending_tests.count()
@@ -348,9 +380,11 @@ def is_admin(user):
 
 def admin_users(request):
     patients = User.objects.filter(patientprofile__isnull=False)
+    page = keyset_paginate(request, patients, ('-id',))
 
     return render(request, "core/dashboard/admin_users.html", {
-        "users": patients
+        "users": page,
+        "page": page,
     })
 
 @user_passes_test(is_admin)
@@ -375,6 +409,8 @@ def admin_patient_add(request):
             last_name=last_name
         )
 
+        duplicates = likely_duplicates(f"{first_name} {last_name}", phone, email, dob)
+
         # Create patient profile
         PatientProfile.objects.create(
             user=user,
@@ -386,6 +422,8 @@ def admin_patient_add(request):
             status="Active"
         )
 
+        if duplicates:
+            messages.warning(request, duplicate_warning(duplicates))
         return redirect("admin_users")
 
     return render(request, "core/dashboard/admin_patient_add.html")
@@ -603,15 +641,64 @@ def admin_payments(request):
         'patient', 'appointment'
     ).order_by('-payment_date')
 
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(payments, PAYMENT_EXPORT_COLUMNS, 'payments', export_format)
+
+    page = keyset_paginate(request, payments, ('-payment_date', '-id'))
+
     return render(request, 'core/dashboard/admin_payments.html', {
-        'payments': payments
+        'payments': page,
+        'page': page,
     })
     
+@login_required
+@user_passes_test(is_admin)
 def admin_payment_receipt(request, payment_id):
-    payment = get_object_or_404(Payment, id=payment_id)
+    try:
+        html = receipt_html(payment_id)
+    except Payment.DoesNotExist:
+        raise Http404("Payment not found")
+
+    return render(request, 'core/receipts/receipt_page.html', {
+        'payment_id': payment_id,
+        'receipt_html': html,
+        'back_url': reverse('admin_payments'),
+    })
+
+
+# Receipts printed per page of the reprint view
+RECEIPT_REPRINT_PAGE_SIZE = 100
+
 
-    return render(request, 'core/dashboard/admin_payment_receipt.html', {
-        'payment': payment
+@login_required
+def payment_receipts_reprint(request):
+    """Print the stored receipts of a date range, a page at a time"""
+    if not (is_admin(request.user) or get_frontdesk_profile(request.user)):
+        messages.error(request, "You don't have access to this page.")
+        return redirect('login')
+
+    today = timezone.localdate()
+    try:
+        start = date.fromisoformat(request.GET.get('from') or today.isoformat())
+        end = date.fromisoformat(request.GET.get('to') or start.isoformat())
+    except ValueError:
+        start = end = today
+    if end < start:
+        start, end = end, start
+    # A bounded print run
+    end = min(end, start + timedelta(days=31))
+    page = keyset_paginate(
+        request, receipts_between(start, end), ('issued_at', 'id'),
+        per_page=RECEIPT_REPRINT_PAGE_SIZE,
+    )
+
+    return render(request, 'core/receipts/reprint.html', {
+        'start': start,
+        'end': end,
+        'receipts': page,
+        'page': page,
+        'back_url': reverse('admin_payments' if is_admin(request.user) else 'frontdesk_payments'),
     })
     
 @login_required
@@ -1119,17 +1206,11 @@ def patient_book_appointment(request):
             return redirect('core/dashboard/patient_book_appointment')  # ✅ FIXED
     
     # GET request - show form
-    specializations = DoctorProfile.objects.filter(
-        status='Active'
-    ).values_list('specialization', flat=True).distinct().order_by('specialization')
-    
-    all_doctors = DoctorProfile.objects.filter(
-        status='Active'
-    ).select_related('user').order_by('user__first_name')
+    directory = get_directory()
     
     context = {
-        'specializations': specializations,
-        'all_doctors': all_doctors,
+        'specializations': directory.specializations,
+        'all_doctors': directory.active,
         'today': date.today().isoformat(),
     }
     
@@ -1168,33 +1249,98 @@ def create_payment_for_appointment(appointment):
 def get_doctors_by_specialization(request):
     """
     AJAX endpoint to get doctors filtered by specialization
-    Returns JSON response with doctor details
+    Returns JSON response with doctor details (304 if unchanged)
     """
     specialization = request.GET.get('specialization', '')
-    
-    if not specialization:
-        return JsonResponse({'doctors': []})
-    
-    # Filter doctors by specialization and active status
-    doctors = DoctorProfile.objects.filter(
-        specialization=specialization,
-        status='Active'
-    ).select_related('user').order_by('user__first_name')
-    
-    # Build response data
-    doctors_data = []
-    for doctor in doctors:
-        doctors_data.append({
-            'id': doctor.id,
-            'name': doctor.user.get_full_name() or doctor.user.username,
-            'specialization': doctor.specialization,
-            'department': doctor.department,
-            'experience': doctor.experience,
-            'consultation_fee': str(doctor.consultation_fee),
-            'bio': doctor.bio or '',
-        })
-    
-    return JsonResponse({'doctors': doctors_data})
+    body, etag = get_directory().for_specialization(specialization)
+    return directory_json_response(request, body, etag)
+
+
+@login_required
+def doctor_directory_json(request):
+    """
+    AJAX endpoint with every active doctor plus the specialization and
+    department lists, for pages that filter the directory client-side
+    """
+    directory = get_directory()
+    return directory_json_response(request, directory.json, directory.etag)
+
+
+@login_required
+def patient_duplicates(request):
+    """
+    AJAX endpoint for the registration forms: existing patients that may be
+    the one being registered, from name, phone, email and date of birth
+    """
+    if not (is_admin(request.user) or get_frontdesk_profile(request.user)):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    matches = find_duplicates(
+        full_name=request.GET.get('name', '').strip(),
+        phone=request.GET.get('phone', ''),
+        email=request.GET.get('email', ''),
+        dob=request.GET.get('dob', '').strip() or None,
+    )
+    return JsonResponse({'matches': [
+        {'id': match.id, 'name': match.name, 'phone': mask_phone(match.phone),
+         'score': match.score, 'reasons': match.reasons}
+        for match in matches
+    ]})
+
+
+@login_required
+def global_search_json(request):
+    """
+    AJAX endpoint for staff: patients, appointments, lab bookings, payments
+    and prescriptions matching ``q``, grouped by type and ranked
+    """
+    if not (is_admin(request.user) or get_frontdesk_profile(request.user)):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'query': query, 'groups': []})
+    return JsonResponse({'query': query, 'groups': global_search(query)})
+
+
+# Largest chart a series is downsampled to
+LAB_SERIES_MAX_POINTS = 2000
+
+
+@login_required
+def patient_lab_series(request, patient_id):
+    """
+    AJAX endpoint for trend charts: a patient's numeric lab results as
+    date / value arrays per test, downsampled to ``points`` per test if
+    given. Open to the patient, doctors with an appointment with them and
+    admins; front desk and lab staff are refused.
+    """
+    patient = get_object_or_404(PatientProfile, id=patient_id)
+    allowed = (
+        patient.user_id == request.user.id
+        or is_admin(request.user)
+        or Appointment.objects.filter(patient=patient, doctor__user=request.user).exists()
+    )
+    if not allowed:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+        points = int(request.GET['points']) if request.GET.get('points') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+    if points is not None and not MIN_SERIES_POINTS <= points <= LAB_SERIES_MAX_POINTS:
+        return JsonResponse(
+            {'error': f'points must be between {MIN_SERIES_POINTS} and {LAB_SERIES_MAX_POINTS}'}, status=400,
+        )
+
+    return JsonResponse({
+        'patient_id': patient.id,
+        'series': patient_series(
+            patient, tests=request.GET.getlist('test'), start=start, end=end, max_points=points,
+        ),
+    })
 
 
 @login_required
@@ -1204,23 +1350,16 @@ def search_doctors(request):
     This is a separate page for browsing doctors (not booking)
     """
     specialization_filter = request.GET.get('specialization', '')
-    
-    # Get all specializations for filter dropdown
-    specializations = DoctorProfile.objects.filter(
-        status='Active'
-    ).values_list('specialization', flat=True).distinct().order_by('specialization')
-    
-    # Filter doctors
-    doctors = DoctorProfile.objects.filter(status='Active').select_related('user')
+    directory = get_directory()
     
     if specialization_filter:
-        doctors = doctors.filter(specialization=specialization_filter)
-    
-    doctors = doctors.order_by('user__first_name')
+        doctors = directory.by_specialization.get(specialization_filter, [])
+    else:
+        doctors = directory.active
     
     context = {
         'doctors': doctors,
-        'specializations': specializations,
+        'specializations': directory.specializations,
         'selected_specialization': specialization_filter,
     }
     
@@ -1242,28 +1381,29 @@ def payments(request):
         return redirect('patient_dashboard')
     
     # Get all payments for this patient
-    all_payments = Payment.objects.filter(
-        patient=patient_profile
-    ).select_related('appointment', 'appointment__doctor', 'appointment__doctor__user').order_by('-payment_date')
+    payments = Payment.objects.filter(patient=patient_profile)
+    all_payments = list(payments.select_related(
+        'appointment', 'appointment__doctor', 'appointment__doctor__user'
+    ).order_by('-payment_date'))
     
     # Separate by status
-    pending_payments = all_payments.filter(payment_status='Pending')
-    paid_payments = all_payments.filter(payment_status='Paid')
-    failed_payments = all_payments.filter(payment_status='Failed')
+    pending_payments = [p for p in all_payments if p.payment_status == 'Pending']
+    paid_payments = [p for p in all_payments if p.payment_status == 'Paid']
+    failed_payments = [p for p in all_payments if p.payment_status == 'Failed']
     
-    # Calculate totals
-    total_pending = pending_payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    total_paid = paid_payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    # Counts and totals of every status in one query
+    stats = status_totals(payments)
     
     context = {
         'all_payments': all_payments,
         'pending_payments': pending_payments,
         'paid_payments': paid_payments,
         'failed_payments': failed_payments,
-        'total_pending': total_pending,
-        'total_paid': total_paid,
-        'pending_count': pending_payments.count(),
-        'paid_count': paid_payments.count(),
+        'total_pending': stats['pending_total'],
+        'total_paid': stats['paid_total'],
+        'pending_count': stats['pending_count'],
+        'paid_count': stats['paid_count'],
+        'payment_count': stats['count'],
     }
     
     return render(request, 'core/dashboard/payments.html', context)
@@ -1302,7 +1442,7 @@ def process_payment(request, payment_id):
     )
 
     payment = get_object_or_404(
-        Payment,
+        Payment.objects.select_related('appointment', 'test_booking__test'),
         id=payment_id,
         patient=patient_profile
     )
@@ -1312,58 +1452,114 @@ def process_payment(request, payment_id):
 
         if not payment_method:
             messages.error(request, "Please select a payment method.")
-            return redirect('core/dashboard/process_payment', payment_id=payment.id)
+            return redirect('process_payment', payment_id=payment.id)
+
+        try:
+            charge = start_payment(
+                payment.id,
+                payment_method,
+                idempotency_key=request.POST.get("idempotency_key"),
+                patient=patient_profile,
+                webhook_url=request.build_absolute_uri(
+                    reverse('payment_webhook', args=[get_gateway().name])
+                ),
+            )
+        except PaymentError as e:
+            messages.error(request, str(e))
+            return redirect('process_payment', payment_id=payment.id)
+
+        payment = charge.payment
 
-        transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
+        # =========================
+        # Confirmed by the gateway's webhook: wait for it on the status page
+        # =========================
+        if not charge.confirmed and charge.reference:
+            return redirect('payment_processing', payment_id=payment.id)
 
-        payment.payment_method = payment_method
-        payment.transaction_id = transaction_id
-        payment.payment_status = "Paid"
-        payment.save()
+        # =========================
+        # Not handled online (cash): collected at the reception
+        # =========================
+        if not charge.confirmed:
+            messages.info(
+                request,
+                f"Please pay ₹{payment.amount} in cash at the reception. "
+                f"Your booking is confirmed once the payment is received."
+            )
+            return redirect('payments')
 
         # =========================
         # CASE 1 → Appointment
         # =========================
         if payment.appointment:
-            appointment = payment.appointment
-            appointment.status = "Scheduled"
-            appointment.save()
-
             messages.success(
                 request,
                 f"Payment successful! Your appointment is confirmed. "
-                f"Transaction ID: {transaction_id}"
+                f"Transaction ID: {payment.transaction_id}"
             )
 
         # =========================
         # CASE 2 → Diagnostic Test
         # =========================
         elif payment.test_booking:
-            # Find related booking
-            booking = TestBooking.objects.filter(
-                patient=patient_profile,
-                test=payment.test_booking.test,
-                status="Pending Payment"
-            ).first()
-
-            if booking:
-                booking.status = "Booked"
-                booking.save()
-
             messages.success(
                 request,
                 f"Payment successful! Your diagnostic test "
                 f"{payment.test_booking.test.test_name} is confirmed. "
-                f"Transaction ID: {transaction_id}"
+                f"Transaction ID: {payment.transaction_id}"
             )
 
         return redirect("patient_dashboard")
 
     return render(request, "core/dashboard/process_payment.html", {
-        "payment": payment
+        "payment": payment,
+        "idempotency_key": new_idempotency_key(),
     })
 
 
+@login_required
+def payment_processing(request, payment_id):
+    """Wait for the payment gateway to confirm a payment"""
+    patient_profile = get_object_or_404(PatientProfile, user=request.user)
+    payment = get_object_or_404(
+        Payment.objects.select_related('appointment__doctor__user', 'test_booking__test'),
+        id=payment_id,
+        patient=patient_profile
+    )
+
+    return render(request, "core/dashboard/payment_processing.html", {"payment": payment})
+
+
+@login_required
+def payment_status_json(request, payment_id):
+    """Polled by the payment processing page"""
+    payment = get_object_or_404(
+        Payment.objects.only('payment_status', 'transaction_id'),
+        id=payment_id,
+        patient__user=request.user
+    )
+
+    return JsonResponse({
+        'status': payment.payment_status,
+        'transaction_id': payment.transaction_id if payment.payment_status == 'Paid' else None,
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def payment_webhook(request, gateway):
+    """Record a payment gateway webhook in the inbox (applied by process_webhooks)"""
+    if gateway not in GATEWAYS:
+        return JsonResponse({'error': 'Unknown gateway'}, status=404)
+
+    try:
+        event_id, event_type, data = get_gateway(gateway).parse_webhook(request)
+    except WebhookError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    created = record_event(gateway, event_id, event_type, data)
+    return JsonResponse({'received': True, 'duplicate': not created})
+
+
 
 from decimal import Decimal
 
@@ -1418,24 +1614,17 @@ def patient_diagnostic_tests(request):
         messages.error(request, "Patient profile not found")
         return redirect('patient_dashboard')
 
-    # Base queryset
-    tests = DiagnosticTest.objects.select_related('lab').all()
-
-    # Search
+    # Search and lab filter run against the in-memory catalogue
+    catalogue = get_catalogue()
     search_query = request.GET.get('search', '').strip()
-    if search_query:
-        tests = tests.filter(
-            Q(test_name__icontains=search_query) |
-            Q(lab__name__icontains=search_query)
-        )
-
-    # Lab filter
     lab_filter = request.GET.get('lab', '').strip()
-    if lab_filter:
-        tests = tests.filter(lab__id=lab_filter)
+    if lab_filter and not lab_filter.isdigit():
+        tests = []
+    else:
+        tests = catalogue.search(search_query, lab_id=int(lab_filter) if lab_filter else None)
 
     # Active labs for dropdown
-    labs = Lab.objects.filter(status='Active')
+    labs = catalogue.active_labs()
 
     # IDs of tests this patient has already booked (non-cancelled)
     user_bookings = list(
@@ -1635,7 +1824,6 @@ def book_diagnostic_tests(request, test_id):
 # ── process_test_payment ────────────────────────────────────────
 def process_test_payment(request, payment_id):
     from .models import PatientProfile, TestBooking, Payment
-    import uuid
 
     try:
         patient_profile = PatientProfile.objects.get(user=request.user)
@@ -1646,12 +1834,18 @@ def process_test_payment(request, payment_id):
 
     from django.shortcuts import get_object_or_404
     payment = get_object_or_404(
-        Payment,
+        Payment.objects.select_related('test_booking__test', 'test_booking__lab'),
         id=payment_id,
         patient=patient_profile,
-        payment_status='Pending'
+        payment_status__in=['Pending', 'Paid', 'Failed']
     )
 
+    # A resubmitted form finds the payment already done
+    if payment.payment_status == 'Paid':
+        from django.contrib import messages
+        messages.info(request, f"This payment is already complete. Transaction ID: {payment.transaction_id}")
+        return redirect('patient_booked_tests')
+
     test_booking = payment.test_booking
 
     if not test_booking:
@@ -1667,23 +1861,38 @@ def process_test_payment(request, payment_id):
             messages.error(request, "Please select a payment method.")
             return redirect('process_test_payment', payment_id=payment_id)  # ← FIXED
 
-        transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
-
-        payment.payment_method = payment_method
-        payment.transaction_id = transaction_id
-        payment.payment_status = 'Paid'
-        payment.save()
-
-        test_booking.status = 'Booked'
-        test_booking.save()
-
         from django.contrib import messages
+        try:
+            charge = start_payment(
+                payment.id,
+                payment_method,
+                idempotency_key=request.POST.get('idempotency_key'),
+                patient=patient_profile,
+                webhook_url=request.build_absolute_uri(
+                    reverse('payment_webhook', args=[get_gateway().name])
+                ),
+            )
+        except PaymentError as e:
+            messages.error(request, str(e))
+            return redirect('process_test_payment', payment_id=payment_id)
+
+        payment = charge.payment
+        if not charge.confirmed and charge.reference:
+            return redirect('payment_processing', payment_id=payment.id)
+        if not charge.confirmed:
+            messages.info(
+                request,
+                f"Please pay ₹{payment.amount} in cash at the lab reception. "
+                f"Your test booking is confirmed once the payment is received."
+            )
+            return redirect('patient_booked_tests')
+
         messages.success(
             request,
             f"Payment successful! Your test booking for {test_booking.test.test_name} "
             f"on {test_booking.booking_date.strftime('%d %B %Y')} "
             f"at {test_booking.lab.name} is now confirmed. "
-            f"Transaction ID: {transaction_id}"
+            f"Transaction ID: {payment.transaction_id}"
         )
 
         return redirect('patient_booked_tests')
@@ -1692,6 +1901,7 @@ def process_test_payment(request, payment_id):
     context = {
         'payment': payment,
         'test_booking': test_booking,
+        'idempotency_key': new_idempotency_key(),
     }
     return render(request, 'core/dashboard/process_test_payment.html', context)
 
@@ -2260,159 +2470,95 @@ def add_blood_donation(request):
 @login_required
 def download_medical_history(request):
     """Download medical history as PDF"""
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.units import inch
-    from io import BytesIO
-
     try:
         patient_profile = PatientProfile.objects.get(user=request.user)
     except PatientProfile.DoesNotExist:
         messages.error(request, "Patient profile not found.")
         return redirect('core/dashboard/medical_history')
 
-    # Create PDF in memory
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=20,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=10,
-        alignment=1,  # Center
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=8,
-        spaceBefore=8,
+    # Conditions, medications and surgeries have no last-modified column,
+    # so the report is fingerprinted by the content it shows
+    allergies = list(patient_profile.allergies.values_list('name', 'severity', 'reaction'))
+    conditions = list(patient_profile.medical_conditions.values_list('name', 'status', 'diagnosis_date'))
+    medications = list(
+        patient_profile.current_medications.filter(end_date__isnull=True)
+        .values_list('name', 'dosage', 'frequency')
     )
+    surgeries = list(patient_profile.surgeries.values_list('name', 'date', 'hospital')[:5])
+
+    fingerprint = {
+        'patient': [
+            patient_profile.id,
+            patient_profile.full_name,
+            patient_profile.gender,
+            patient_profile.dob,
+            patient_profile.phone,
+        ],
+        'allergies': allergies,
+        'conditions': conditions,
+        'medications': medications,
+        'surgeries': surgeries,
+    }
 
-    # Title
-    elements.append(Paragraph("MEDICAL HISTORY REPORT", title_style))
-    elements.append(Spacer(1, 12))
-
-    # Patient Information
-    patient_info = [
-        ['Patient Name:', patient_profile.full_name],
-        ['Gender:', patient_profile.gender or 'N/A'],
-        ['Date of Birth:', str(patient_profile.dob) if patient_profile.dob else 'N/A'],
-        ['Phone:', patient_profile.phone or 'N/A'],
-        ['Report Generated:', datetime.now().strftime("%d-%m-%Y %H:%M")],
-    ]
+    def render():
+        sections = [{'table': {
+            'rows': [
+                ['Patient Name:', patient_profile.full_name],
+                ['Gender:', patient_profile.gender or 'N/A'],
+                ['Date of Birth:', str(patient_profile.dob) if patient_profile.dob else 'N/A'],
+                ['Phone:', patient_profile.phone or 'N/A'],
+            ],
+            'col_widths': [2, 4],
+            'style': 'info',
+        }}]
+
+        allergy_rows = [
+            [name, severity, reaction[:50] + '...' if len(reaction) > 50 else reaction]
+            for name, severity, reaction in allergies
+        ]
+        if allergy_rows:
+            sections.append({'heading': 'ALLERGIES', 'heading_style': 'section', 'table': {
+                'rows': [['Name', 'Severity', 'Reaction']] + allergy_rows,
+                'col_widths': [2, 1.5, 2.5],
+                'style': 'allergies',
+            }})
+
+        if conditions:
+            sections.append({'heading': 'MEDICAL CONDITIONS', 'heading_style': 'section', 'table': {
+                'rows': [['Condition', 'Status', 'Diagnosis Date']] + conditions,
+                'col_widths': [2.5, 1.5, 1.5],
+                'style': 'conditions',
+            }})
+
+        if medications:
+            sections.append({'heading': 'CURRENT MEDICATIONS', 'heading_style': 'section', 'table': {
+                'rows': [['Medication', 'Dosage', 'Frequency']] + medications,
+                'col_widths': [2.5, 1.5, 1.5],
+                'style': 'medications',
+            }})
+
+        surgery_lines = [
+            [name, f"on {surgery_date}" + (f" at {hospital}" if hospital else '')]
+            for name, surgery_date, hospital in surgeries
+        ]
+        if surgery_lines:
+            sections.append({
+                'heading': 'SURGERIES & PROCEDURES',
+                'heading_style': 'section',
+                'paragraphs': surgery_lines,
+            })
 
-    patient_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f4f8')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-    ]))
-    elements.append(patient_table)
-    elements.append(Spacer(1, 20))
-
-    # Allergies
-    allergies = patient_profile.allergies.all()
-    if allergies.exists():
-        elements.append(Paragraph("ALLERGIES", heading_style))
-        allergy_data = [['Name', 'Severity', 'Reaction']]
-        for allergy in allergies:
-            allergy_data.append([
-                allergy.name,
-                allergy.severity,
-                allergy.reaction[:50] + '...' if len(allergy.reaction) > 50 else allergy.reaction
-            ])
-
-        allergy_table = Table(allergy_data, colWidths=[2*inch, 1.5*inch, 2.5*inch])
-        allergy_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ffcccc')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#ffe6e6')]),
-        ]))
-        elements.append(allergy_table)
-        elements.append(Spacer(1, 12))
-
-    # Medical Conditions
-    conditions = patient_profile.medical_conditions.all()
-    if conditions.exists():
-        elements.append(Paragraph("MEDICAL CONDITIONS", heading_style))
-        condition_data = [['Condition', 'Status', 'Diagnosis Date']]
-        for condition in conditions:
-            condition_data.append([
-                condition.name,
-                condition.status,
-                str(condition.diagnosis_date)
-            ])
-
-        condition_table = Table(condition_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
-        condition_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#cce5ff')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#e6f2ff')]),
-        ]))
-        elements.append(condition_table)
-        elements.append(Spacer(1, 12))
-
-    # Current Medications
-    medications = patient_profile.current_medications.filter(end_date__isnull=True)
-    if medications.exists():
-        elements.append(Paragraph("CURRENT MEDICATIONS", heading_style))
-        med_data = [['Medication', 'Dosage', 'Frequency']]
-        for med in medications:
-            med_data.append([med.name, med.dosage, med.frequency])
-
-        med_table = Table(med_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
-        med_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ccffcc')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#e6ffe6')]),
-        ]))
-        elements.append(med_table)
-        elements.append(Spacer(1, 12))
-
-    # Surgeries
-    surgeries = patient_profile.surgeries.all()
-    if surgeries.exists():
-        elements.append(Paragraph("SURGERIES & PROCEDURES", heading_style))
-        for surgery in surgeries[:5]:  # Limit to 5
-            surgery_text = f"<b>{surgery.name}</b> on {surgery.date}"
-            if surgery.hospital:
-                surgery_text += f" at {surgery.hospital}"
-            elements.append(Paragraph(surgery_text, styles['Normal']))
-            elements.append(Spacer(1, 6))
-
-    # Build PDF
-    doc.build(elements)
-    pdf_buffer.seek(0)
-
-    response = FileResponse(pdf_buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="medical_history_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    return response
+        return render_pdf({'title': 'MEDICAL HISTORY REPORT', 'sections': sections})
+
+    try:
+        return cached_pdf_response(
+            'medical_history',
+            fingerprint,
+            render,
+            f"medical_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+        )
+    except RenderUnavailable as e:
+        return render_busy_response(e)
 
 
 @login_required
@@ -3891,7 +4037,7 @@ def lab_dashboard(request):
 
     if assigned_lab:
         recent_bookings = TestBooking.objects.filter(lab=assigned_lab).order_by('-created_at')[:10]
-        pending_tests_count = TestBooking.objects.filter(lab=assigned_lab, status__in=['Booked', 'Pending']).count()
+        pending_tests_count = TestBooking.objects.filter(lab=assigned_lab, status__in=['Booked', 'In Progress', 'Pending']).count()
         completed_tests_count = TestBooking.objects.filter(lab=assigned_lab, status='Completed').count()
 
     context = {
@@ -3924,35 +4070,101 @@ def lab_tests(request):
         # Get all bookings for this lab
         bookings = TestBooking.objects.filter(
             lab=assigned_lab
-        ).select_related('patient', 'patient__user', 'test').order_by('-created_at')
+        ).select_related('patient', 'patient__user', 'test', 'claimed_by__user').order_by('-created_at')
 
     # Filter by status if provided
     status_filter = request.GET.get('status', '')
     if status_filter:
         if status_filter == 'Pending':
-            bookings = bookings.filter(status__in=['Booked', 'Pending'])
+            bookings = bookings.filter(status__in=['Booked', 'In Progress', 'Pending'])
         elif status_filter == 'Completed':
             bookings = bookings.filter(status='Completed')
         # 'All Bookings' shows everything (no filter)
 
-    # Calculate statistics
-    all_bookings = TestBooking.objects.filter(lab=assigned_lab) if assigned_lab else TestBooking.objects.none()
-    total_count = all_bookings.count()
-    pending_count = all_bookings.filter(status__in=['Booked', 'Pending']).count()
-    completed_count = all_bookings.filter(status='Completed').count()
+    # Calculate statistics in one query
+    counts = TestBooking.objects.filter(lab=assigned_lab).aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status__in=['Booked', 'In Progress', 'Pending'])),
+        completed=Count('id', filter=Q(status='Completed')),
+    ) if assigned_lab else {'total': 0, 'pending': 0, 'completed': 0}
+
+    page = keyset_paginate(request, bookings, ('-created_at', '-id'))
 
     context = {
-        'bookings': bookings,
+        'bookings': page,
+        'page': page,
         'status_filter': status_filter,
-        'total_count': total_count,
-        'pending_count': pending_count,
-        'completed_count': completed_count,
+        'total_count': counts['total'],
+        'pending_count': counts['pending'],
+        'completed_count': counts['completed'],
         'assigned_lab': assigned_lab,
+        'now': timezone.now(),
     }
 
     return render(request, 'core/dashboard/lab_tests.html', context)
 
 
+def _queue_entry(booking, now):
+    return {
+        'id': booking.id,
+        'patient': booking.patient.full_name,
+        'test': booking.test.test_name,
+        'status': booking.status,
+        'due_at': booking.due_at.isoformat() if booking.due_at else None,
+        'overdue': bool(booking.due_at and booking.due_at < now),
+        'url': reverse('lab_booking_detail', args=[booking.id]),
+    }
+
+
+def _lab_technician(request):
+    return LabTechnicianProfile.objects.select_related('lab').filter(user=request.user, lab__isnull=False).first()
+
+
+@login_required
+def lab_queue_next(request):
+    """AJAX endpoint: the next ``limit`` tests due in the technician's lab, without claiming them"""
+    tech_profile = _lab_technician(request)
+    if not tech_profile:
+        return JsonResponse({'error': 'Lab technician profile not found'}, status=403)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_QUEUE_CLAIM)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    now = timezone.now()
+    return JsonResponse({'tests': [_queue_entry(booking, now) for booking in next_due(tech_profile.lab, limit)]})
+
+
+@login_required
+@require_http_methods(['POST'])
+def lab_queue_claim(request):
+    """AJAX endpoint: claim the next ``count`` tests due and mark them In Progress"""
+    tech_profile = _lab_technician(request)
+    if not tech_profile:
+        return JsonResponse({'error': 'Lab technician profile not found'}, status=403)
+
+    try:
+        count = int(request.POST.get('count', 1))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid count'}, status=400)
+
+    now = timezone.now()
+    return JsonResponse({'claimed': [_queue_entry(booking, now) for booking in claim_next(tech_profile, count)]})
+
+
+@login_required
+@require_http_methods(['POST'])
+def lab_queue_release(request):
+    """AJAX endpoint: put claimed tests back in the queue"""
+    tech_profile = _lab_technician(request)
+    if not tech_profile:
+        return JsonResponse({'error': 'Lab technician profile not found'}, status=403)
+
+    booking_ids = [int(value) for value in request.POST.getlist('booking_id') if value.isdigit()]
+    return JsonResponse({'released': release_claims(tech_profile, booking_ids)})
+
+
 @login_required
 def lab_results(request):
     """
@@ -3975,77 +4187,104 @@ def lab_results(request):
             lab=assigned_lab
         ).select_related('patient', 'patient__user', 'test', 'lab').order_by('-created_at')
 
-    # Handle POST request - Save result
-    if request.method == 'POST':
+    # Handle POST request - Save one row (Save Result) or the whole grid (Save All)
+    entries, entry_errors = {}, {}
+    if request.method == 'POST' and assigned_lab:
         booking_id = request.POST.get('save')
-        if booking_id:
-            try:
-                booking = TestBooking.objects.get(id=int(booking_id), lab=assigned_lab)
-                result_val = request.POST.get(f'result_{booking_id}', '').strip()
-                status_val = request.POST.get(f'status_{booking_id}', booking.status)
-                
-                # Update booking status
-                booking.status = status_val
-                booking.save()
-
-                # Create a LabResult if marking as completed
-                if status_val == 'Completed' and result_val:
-                    from datetime import date as _date
-                    
-                    # Get a doctor (you may want to improve this logic)
-                    doctor = DoctorProfile.objects.first()
-                    
-                    if doctor:
-                        LabResult.objects.create(
-                            patient=booking.patient,
-                            doctor=doctor,
-                            lab_technician=tech_profile,
-                            test_name=booking.test.test_name,
-                            test_value=result_val or 'N/A',
-                            normal_range='',  # You can add this field to the form
-                            result_status=status_val,
-                            remarks='',  # You can add this field to the form
-                            test_date=_date.today()
-                        )
-                        messages.success(request, f"Result saved and marked as {status_val} for {booking.patient.full_name}")
-                    else:
-                        messages.warning(request, "Status updated but couldn't create lab result - no doctor available")
-                else:
-                    messages.success(request, f"Status updated to {status_val} for {booking.patient.full_name}")
-
-            except TestBooking.DoesNotExist:
-                messages.error(request, "Booking not found")
-            except Exception as e:
-                messages.error(request, f"Error saving result: {str(e)}")
-
+        if booking_id and booking_id.isdigit():
+            entries = entries_from_post(request.POST, booking_ids={int(booking_id)})
+        elif 'save_all' in request.POST:
+            entries = entries_from_post(request.POST)
+
+        batch = save_results(tech_profile, entries)
+        if not batch.errors:
+            if batch.results:
+                messages.success(request, f"Saved {len(batch.results)} result(s) and updated {len(batch.bookings)} test(s)")
+            elif batch.bookings:
+                messages.success(request, f"Updated the status of {len(batch.bookings)} test(s)")
+            else:
+                messages.info(request, "No changes to save")
+            return redirect(request.get_full_path())
+
+        entry_errors = batch.errors
+        if None in entry_errors:
+            messages.error(request, entry_errors[None])
+        row_errors = len([key for key in entry_errors if key is not None])
+        if row_errors:
+            messages.error(request, f"Nothing was saved: {row_errors} row(s) need fixing")
+    elif request.method == 'POST':
         return redirect('lab_results')
 
     # Filter by status if provided
     status_filter = request.GET.get('status', '')
     if status_filter:
         if status_filter == 'Pending':
-            bookings = bookings.filter(status__in=['Booked', 'Pending'])
+            bookings = bookings.filter(status__in=['Booked', 'In Progress', 'Pending'])
         elif status_filter == 'Completed':
             bookings = bookings.filter(status='Completed')
         # All results shows everything (no filter)
 
-    # Calculate statistics
-    all_bookings = TestBooking.objects.filter(lab=assigned_lab) if assigned_lab else TestBooking.objects.none()
-    total_count = all_bookings.count()
-    pending_count = all_bookings.filter(status__in=['Booked', 'Pending']).count()
-    completed_count = all_bookings.filter(status='Completed').count()
+    # Calculate statistics in one query
+    counts = TestBooking.objects.filter(lab=assigned_lab).aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status__in=['Booked', 'In Progress', 'Pending'])),
+        completed=Count('id', filter=Q(status='Completed')),
+    ) if assigned_lab else {'total': 0, 'pending': 0, 'completed': 0}
+
+    page = keyset_paginate(request, bookings, ('-created_at', '-id'))
+    # Keep what was typed into a grid that failed validation
+    for booking in page:
+        booking.entry = entries.get(booking.id)
+        booking.entry_error = entry_errors.get(booking.id)
 
     context = {
-        'bookings': bookings,
+        'bookings': page,
+        'page': page,
         'status_filter': status_filter,
-        'total_count': total_count,
-        'pending_count': pending_count,
-        'completed_count': completed_count,
+        'total_count': counts['total'],
+        'pending_count': counts['pending'],
+        'completed_count': counts['completed'],
         'assigned_lab': assigned_lab,
     }
 
     return render(request, 'core/dashboard/lab_results.html', context)
 
+
+@login_required
+def lab_results_import(request):
+    """Import an analyzer result file for the technician's lab"""
+    try:
+        tech_profile = LabTechnicianProfile.objects.select_related('lab').get(user=request.user)
+    except LabTechnicianProfile.DoesNotExist:
+        messages.error(request, "Lab technician profile not found")
+        return redirect('login')
+
+    report = None
+    if request.method == 'POST':
+        upload = request.FILES.get('results_file')
+        if not tech_profile.lab:
+            messages.error(request, "No lab assigned to your profile")
+        elif not upload:
+            messages.error(request, "Choose a result file to import")
+        else:
+            try:
+                with text_stream(upload.open('rb')) as stream:
+                    report = ingest_results(stream, tech_profile)
+            except IngestFileError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(
+                    request,
+                    f"Imported {report.created} result(s) from {report.lines} line(s) of {upload.name}",
+                )
+                if report.error_count:
+                    messages.warning(request, f"{report.error_count} line(s) could not be imported")
+
+    return render(request, 'core/dashboard/lab_results_import.html', {
+        'report': report,
+        'assigned_lab': tech_profile.lab,
+    })
+
 @login_required
 def lab_prices(request):
     """Display all diagnostic tests for the lab with real data from backend"""
@@ -4276,7 +4515,7 @@ def api_lab_reports_data(request):
         total_tests = current_bookings.count()
         completed_tests = current_results.filter(result_status='Normal') | current_results.filter(result_status='Abnormal')
         completed_tests = completed_tests.count()
-        pending_tests = current_bookings.filter(status__in=['Booked', 'Pending']).count()
+        pending_tests = current_bookings.filter(status__in=['Booked', 'In Progress', 'Pending']).count()
         
         # Calculate total revenue
         total_revenue = current_bookings.aggregate(
@@ -4420,14 +4659,7 @@ def export_lab_report(request):
         format: 'pdf' or 'excel' (default: 'pdf')
     """
     from core.models import LabTechnicianProfile, TestBooking, LabResult
-    from io import BytesIO
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from django.http import FileResponse
-    
+
     try:
         lab_technician = LabTechnicianProfile.objects.get(user=request.user)
         assigned_lab = lab_technician.lab
@@ -4460,157 +4692,146 @@ def export_lab_report(request):
     
     except LabTechnicianProfile.DoesNotExist:
         return JsonResponse({'error': 'Lab technician profile not found'}, status=400)
+    except RenderUnavailable as e:
+        return render_busy_response(e)
     except Exception as e:
         return JsonResponse({'error': f'Error exporting report: {str(e)}'}, status=500)
 
 
-def generate_pdf_report(lab, bookings, results, start_date, end_date):
-    """Generate PDF report"""
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from io import BytesIO
-    from django.http import FileResponse
-    
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=10,
-        alignment=1
+def lab_report_totals(bookings, results):
+    """Summary figures of the lab report, aggregated in the database."""
+    totals = bookings.aggregate(
+        total=Count('id'),
+        revenue=Sum('test__price'),
     )
-    
-    elements.append(Paragraph(f"Lab Report - {lab.name}", title_style))
-    elements.append(Paragraph(f"Period: {start_date} to {end_date}", styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Summary
-    total_tests = bookings.count()
-    total_completed = results.count()
-    total_revenue = bookings.aggregate(Sum(F('test__price'), output_field=DecimalField()))['test__price__sum'] or 0
-    
-    summary_data = [
-        ['Metric', 'Value'],
-        ['Total Tests', str(total_tests)],
-        ['Completed Tests', str(total_completed)],
-        ['Total Revenue', f'₹{total_revenue:.2f}'],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-    ]))
-    elements.append(summary_table)
-    elements.append(Spacer(1, 20))
-    
-    # Test Results Table
-    elements.append(Paragraph("Test Results", styles['Heading2']))
-    results_data = [['Patient', 'Test Name', 'Result Status', 'Date']]
-    
-    for result in results[:10]:  # Limit to first 10
-        results_data.append([
-            result.patient.full_name,
-            result.test_name,
-            result.result_status,
-            result.test_date.strftime('%d-%m-%Y')
-        ])
-    
-    results_table = Table(results_data, colWidths=[1.5*inch, 2*inch, 1*inch, 1.5*inch])
-    results_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')]),
-    ]))
-    elements.append(results_table)
-    
-    # Build PDF
-    doc.build(elements)
-    pdf_buffer.seek(0)
-    
-    response = FileResponse(pdf_buffer, content_type='application/pdf')
+    totals.update(results.aggregate(
+        completed=Count('id'),
+        normal=Count('id', filter=Q(result_status='Normal')),
+        abnormal=Count('id', filter=Q(result_status='Abnormal')),
+    ))
+    totals['revenue'] = totals['revenue'] or 0
+    return totals
+
+
+def write_lab_report_rows(results):
+    """
+    Stream every result row of the lab report into a temporary CSV file
+    and return its path; the caller removes it.
+    """
+    import csv
+    import tempfile
+
+    rows_file = tempfile.NamedTemporaryFile(
+        'w', newline='', encoding='utf-8', suffix='.csv', delete=False
+    )
+    with rows_file:
+        writer = csv.writer(rows_file)
+        for full_name, test_name, result_status, test_date in results.order_by(
+            'test_date', 'id'
+        ).values_list(
+            'patient__full_name', 'test_name', 'result_status', 'test_date'
+        ).iterator(chunk_size=2000):
+            writer.writerow([full_name, test_name, result_status, test_date.strftime('%d-%m-%Y')])
+    return rows_file.name
+
+
+def generate_pdf_report(lab, bookings, results, start_date, end_date):
+    """
+    Generate the full-period PDF report.
+
+    Summary figures are aggregated in the database. Result rows are
+    streamed from the database into a temporary CSV file, which the
+    renderer reads back in chunks, so memory stays flat however long the
+    period is.
+    """
+    import os
+    from django.conf import settings
+
+    totals = lab_report_totals(bookings, results)
+    per_test = results.order_by().values('test_name').annotate(
+        count=Count('id'),
+    ).order_by('-count', 'test_name')
+
+    rows_file = write_lab_report_rows(results)
+    try:
+        pdf_bytes = render_pdf({
+            'title': f"Lab Report - {lab.name}",
+            'subtitle': [f"Period: {start_date} to {end_date}"],
+            'sections': [
+                {'table': {
+                    'rows': [
+                        ['Metric', 'Value'],
+                        ['Total Tests', totals['total']],
+                        ['Completed Tests', totals['completed']],
+                        ['Normal Results', totals['normal']],
+                        ['Abnormal Results', totals['abnormal']],
+                        ['Total Revenue', f"₹{totals['revenue']:.2f}"],
+                    ],
+                    'col_widths': [2, 2],
+                    'style': 'summary',
+                }},
+                {'heading': 'Results by Test', 'table': {
+                    'rows': [['Test Name', 'Results']] + [
+                        [row['test_name'], row['count']] for row in per_test
+                    ],
+                    'col_widths': [4, 2],
+                    'style': 'data',
+                    'repeat_rows': 1,
+                }},
+                {'heading': 'Test Results', 'table': {
+                    'header': ['Patient', 'Test Name', 'Result Status', 'Date'],
+                    'rows_file': rows_file,
+                    'col_widths': [1.5, 2, 1, 1.5],
+                    'style': 'data',
+                }},
+            ],
+        }, timeout=getattr(settings, 'LAB_REPORT_PDF_TIMEOUT', None))
+    finally:
+        os.remove(rows_file)
+
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="lab_report_{datetime.now().strftime("%Y%m%d")}.pdf"'
     return response
 
 
 def generate_excel_report(lab, bookings, results, start_date, end_date):
-    """Generate Excel report"""
+    """
+    Generate the full-period Excel report: the same figures and every
+    result row, streamed through a temporary CSV file like the PDF.
+    """
+    import os
+    from django.conf import settings
+
+    totals = lab_report_totals(bookings, results)
+    rows_file = write_lab_report_rows(results)
     try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from io import BytesIO
-        from django.http import HttpResponse
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Lab Report"
-        
-        # Headers
-        ws['A1'] = f"Lab Report - {lab.name}"
-        ws['A2'] = f"Period: {start_date} to {end_date}"
-        
-        # Summary
-        ws['A4'] = 'Metric'
-        ws['B4'] = 'Value'
-        ws['A5'] = 'Total Tests'
-        ws['B5'] = bookings.count()
-        ws['A6'] = 'Completed Tests'
-        ws['B6'] = results.count()
-        ws['A7'] = 'Total Revenue'
-        ws['B7'] = float(bookings.aggregate(Sum(F('test__price'), output_field=DecimalField()))['test__price__sum'] or 0)
-        
-        # Results
-        row = 9
-        ws[f'A{row}'] = 'Patient'
-        ws[f'B{row}'] = 'Test Name'
-        ws[f'C{row}'] = 'Result Status'
-        ws[f'D{row}'] = 'Date'
-        
-        row += 1
-        for result in results[:100]:  # Limit to 100
-            ws[f'A{row}'] = result.patient.full_name
-            ws[f'B{row}'] = result.test_name
-            ws[f'C{row}'] = result.result_status
-            ws[f'D{row}'] = result.test_date.strftime('%d-%m-%Y')
-            row += 1
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="lab_report_{datetime.now().strftime("%Y%m%d")}.xlsx"'
-        return response
-    
-    except ImportError:
-        return JsonResponse({'error': 'Excel export requires openpyxl library'}, status=500)
+        xlsx_bytes = render_xlsx({
+            'sheet_title': 'Lab Report',
+            'rows': [
+                [f"Lab Report - {lab.name}"],
+                [f"Period: {start_date} to {end_date}"],
+                [],
+                ['Metric', 'Value'],
+                ['Total Tests', totals['total']],
+                ['Completed Tests', totals['completed']],
+                ['Normal Results', totals['normal']],
+                ['Abnormal Results', totals['abnormal']],
+                ['Total Revenue', float(totals['revenue'])],
+                [],
+                ['Patient', 'Test Name', 'Result Status', 'Date'],
+            ],
+            'rows_file': rows_file,
+            'column_widths': {'A': 20, 'B': 25, 'C': 15, 'D': 15},
+        }, timeout=getattr(settings, 'LAB_REPORT_PDF_TIMEOUT', None))
+    finally:
+        os.remove(rows_file)
+
+    response = HttpResponse(
+        xlsx_bytes,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="lab_report_{datetime.now().strftime("%Y%m%d")}.xlsx"'
+    return response
 
 
 def get_chart_data(lab_results, test_bookings, start_date, end_date):
@@ -4708,6 +4929,9 @@ def lab_report_export_pdf(request):
     except LabTechnicianProfile.DoesNotExist:
         return JsonResponse({'error': 'Lab Technician profile not found'}, status=404)
 
+    if not lab_technician.lab:
+        return JsonResponse({'error': 'No lab assigned'}, status=400)
+
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
 
@@ -4732,19 +4956,10 @@ def lab_report_export_pdf(request):
         lab=lab_technician.lab
     )
 
-    # For PDF generation, you would use a library like reportlab or weasyprint
-    # This is a placeholder implementation
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="lab_report.pdf"'
-
-    # Generate PDF content here using reportlab or weasyprint
-    # For now, return a message
-    return JsonResponse({
-        'message': 'PDF export - Implement with reportlab or weasyprint',
-        'total_tests': lab_results.count(),
-        'total_bookings': test_bookings.count()
-    })
+    try:
+        return generate_pdf_report(lab_technician.lab, test_bookings, lab_results, start_date, end_date)
+    except RenderUnavailable as e:
+        return render_busy_response(e)
 
 
 @login_required
@@ -5029,7 +5244,7 @@ def download_test_report(request, booking_id):
         return redirect('patient_dashboard')
     
     booking = get_object_or_404(
-        TestBooking,
+        TestBooking.objects.select_related('test', 'lab'),
         id=booking_id,
         patient=patient,
         status='Completed'
@@ -5045,85 +5260,51 @@ def download_test_report(request, booking_id):
         messages.error(request, "No results found for this test")
         return redirect('booking_detail', booking_id=booking_id)
     
-    # Generate PDF (implement with reportlab or similar)
-    from io import BytesIO
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from django.http import FileResponse
-    
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=10,
-        alignment=1,
+    fingerprint = {
+        'booking': [booking.id, booking.updated_at, booking.test.test_name, booking.lab.name],
+        'patient': [patient.full_name, patient.phone],
+        'results': list(lab_results.values_list('id', 'updated_at')),
+    }
+
+    def render():
+        result_rows = [['Test Name', 'Value', 'Normal Range', 'Status']]
+        result_rows += lab_results.values_list(
+            'test_name', 'test_value', 'normal_range', 'result_status'
+        )
+        return render_pdf({
+            'title': 'Test Report',
+            'sections': [
+                {'table': {
+                    'rows': [
+                        ['Patient Name:', patient.full_name],
+                        ['Phone:', patient.phone],
+                        ['Test:', booking.test.test_name],
+                        ['Lab:', booking.lab.name],
+                    ],
+                    'col_widths': [2, 4],
+                    'style': 'info',
+                }},
+                {'heading': 'Test Results', 'table': {
+                    'rows': result_rows,
+                    'col_widths': [2, 1.5, 1.5, 1],
+                    'style': 'data',
+                    'repeat_rows': 1,
+                }},
+            ],
+        })
+
+    try:
+        name, path = get_or_render_report('test_report', fingerprint, render)
+    except RenderUnavailable as e:
+        return render_busy_response(e)
+    write_back_result_file(booking, name)
+
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=f"test_report_{booking_id}.pdf",
+        content_type='application/pdf',
     )
-    
-    elements.append(Paragraph("Test Report", title_style))
-    elements.append(Spacer(1, 12))
-    
-    # Patient Info
-    patient_info = [
-        ['Patient Name:', patient.full_name],
-        ['Phone:', patient.phone],
-        ['Test:', booking.test.test_name],
-        ['Lab:', booking.lab.name],
-    ]
-    
-    patient_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f4f8')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-    ]))
-    elements.append(patient_table)
-    elements.append(Spacer(1, 20))
-    
-    # Results Table
-    elements.append(Paragraph("Test Results", styles['Heading2']))
-    results_data = [['Test Name', 'Value', 'Normal Range', 'Status']]
-    
-    for result in lab_results:
-        results_data.append([
-            result.test_name,
-            result.test_value,
-            result.normal_range,
-            result.result_status,
-        ])
-    
-    results_table = Table(results_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1*inch])
-    results_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')]),
-    ]))
-    elements.append(results_table)
-    
-    # Build PDF
-    doc.build(elements)
-    pdf_buffer.seek(0)
-    
-    response = FileResponse(pdf_buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="test_report_{booking_id}.pdf"'
-    return response
 
 
 # forms.py - Patient Appointment Reschedule Forms
@@ -6189,7 +6370,7 @@ def frontdesk_book_appointment(request):
                 )
                 
                 # Create payment
-                transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
+                transaction_id = new_transaction_id()
                 payment = Payment.objects.create(
                     patient=patient,
                     appointment=appointment,
@@ -6617,6 +6798,10 @@ def doctor_prescriptions(request):
     if status_filter:
         prescriptions = prescriptions.filter(status=status_filter)
 
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(prescriptions, PRESCRIPTION_EXPORT_COLUMNS, 'prescriptions', export_format)
+
     # Get statistics for dashboard
     all_prescriptions = Prescription.objects.filter(doctor=doctor_profile)
     
@@ -6627,8 +6812,11 @@ def doctor_prescriptions(request):
         'cancelled': all_prescriptions.filter(status='Cancelled').count(),
     }
 
+    page = keyset_paginate(request, prescriptions, ('-created_at', '-id'))
+
     context = {
-        'prescriptions': prescriptions,
+        'prescriptions': page,
+        'page': page,
         'status_filter': status_filter,
         'stats': stats,
         'doctor_profile': doctor_profile,
@@ -6803,30 +6991,159 @@ def doctor_delete_prescription(request, prescription_id):
     return render(request, 'core/dashboard/doctor_confirm_delete_prescription.html', context)
 
 
+def doctor_letterhead(doctor_profile):
+    """Letterhead lines printed at the top of a doctor's prescriptions."""
+    return [
+        f"Dr. {doctor_profile.user.get_full_name()}",
+        f"{doctor_profile.specialization} - {doctor_profile.department}",
+        f"Phone: {doctor_profile.phone or 'N/A'}",
+    ]
+
+
+def prescription_patient_section(patient_row, prescription_rows, page_break_before=False):
+    """
+    Report section for one patient's prescriptions.
+
+    ``patient_row`` is (full_name, dob, gender, phone, appointment_date) and
+    each prescription row is (medicine, dosage, frequency, duration,
+    instructions, created_at).
+    """
+    full_name, dob, gender, phone, appointment_date = patient_row
+    return {
+        'page_break_before': page_break_before,
+        'letterhead': True,
+        'table': {
+            'rows': [
+                ['Patient Name:', full_name],
+                ['Date of Birth:', dob.strftime('%d-%m-%Y') if dob else 'N/A'],
+                ['Gender:', gender or 'N/A'],
+                ['Phone:', phone or 'N/A'],
+                ['Appointment Date:', appointment_date.strftime('%d-%m-%Y')],
+                ['Prescribed On:', prescription_rows[0][5].strftime('%d-%m-%Y')],
+            ],
+            'col_widths': [2, 4],
+            'style': 'info',
+        },
+    }, {
+        'heading': 'Rx',
+        'paragraphs': [
+            [f"{row[0]}:", row[4]] for row in prescription_rows if row[4]
+        ],
+        'table': {
+            'rows': [['Medicine', 'Dosage', 'Frequency', 'Duration']] + [
+                list(row[:4]) for row in prescription_rows
+            ],
+            'col_widths': [2.5, 1.25, 1.25, 1],
+            'style': 'data',
+            'repeat_rows': 1,
+        },
+    }
+
+
 @login_required
 def doctor_prescription_print(request, prescription_id):
     """
-    Generate printable view of prescription
+    Generate printable PDF of a prescription
     """
     try:
-        doctor_profile = DoctorProfile.objects.get(user=request.user)
+        doctor_profile = DoctorProfile.objects.select_related('user').get(user=request.user)
     except DoctorProfile.DoesNotExist:
         messages.error(request, "Doctor profile not found.")
         return redirect('doctor_dashboard')
 
     prescription = get_object_or_404(
-        Prescription,
+        Prescription.objects.select_related('patient', 'appointment'),
         id=prescription_id,
         doctor=doctor_profile
     )
+    patient = prescription.patient
 
-    context = {
-        'prescription': prescription,
-        'doctor_profile': doctor_profile,
-        'is_print': True,  # Flag for template to show print-only layout
-    }
+    sections = prescription_patient_section(
+        (patient.full_name, patient.dob, patient.gender, patient.phone,
+         prescription.appointment.appointment_date),
+        [(prescription.medicine_name, prescription.dosage, prescription.frequency,
+          prescription.duration, prescription.instructions, prescription.created_at)],
+    )
+
+    try:
+        pdf_bytes = render_pdf({
+            'title': 'PRESCRIPTION',
+            'letterhead': doctor_letterhead(doctor_profile),
+            'sections': list(sections),
+        })
+    except RenderUnavailable as e:
+        return render_busy_response(e)
+
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="prescription_{prescription.id}.pdf"'
+    return response
 
-    return render(request, 'core/dashboard/doctor_prescription_print.html', context)
+
+@login_required
+def doctor_prescriptions_batch_print(request):
+    """
+    Print all of the doctor's prescriptions for a day (?date=YYYY-MM-DD,
+    default today) or for one appointment (?appointment=<id>) as a single
+    PDF, one patient per page.
+    """
+    try:
+        doctor_profile = DoctorProfile.objects.select_related('user').get(user=request.user)
+    except DoctorProfile.DoesNotExist:
+        messages.error(request, "Doctor profile not found.")
+        return redirect('doctor_dashboard')
+
+    prescriptions = Prescription.objects.filter(doctor=doctor_profile)
+
+    appointment_id = request.GET.get('appointment')
+    if appointment_id:
+        if not appointment_id.isdigit():
+            return HttpResponse("Invalid appointment", status=400)
+        prescriptions = prescriptions.filter(appointment_id=appointment_id)
+        label = f"appointment_{appointment_id}"
+    else:
+        try:
+            print_date = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            print_date = timezone.localdate()
+        prescriptions = prescriptions.filter(created_at__date=print_date)
+        label = print_date.strftime('%Y%m%d')
+
+    # One query for everything on the sheet, grouped by patient
+    rows = prescriptions.exclude(status='Cancelled').order_by(
+        'patient__full_name', 'patient_id', 'appointment__appointment_date', 'created_at'
+    ).values_list(
+        'patient_id', 'patient__full_name', 'patient__dob', 'patient__gender', 'patient__phone',
+        'appointment__appointment_date',
+        'medicine_name', 'dosage', 'frequency', 'duration', 'instructions', 'created_at',
+    )
+
+    sections = []
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[0], []).append(row)
+
+    for patient_rows in groups.values():
+        sections.extend(prescription_patient_section(
+            patient_rows[0][1:6],
+            [row[6:] for row in patient_rows],
+            page_break_before=bool(sections),
+        ))
+
+    if not sections:
+        messages.info(request, "No prescriptions to print.")
+        return redirect('doctor_prescriptions')
+
+    try:
+        pdf_bytes = render_pdf({
+            'letterhead': doctor_letterhead(doctor_profile),
+            'sections': sections,
+        })
+    except RenderUnavailable as e:
+        return render_busy_response(e)
+
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="prescriptions_{label}.pdf"'
+    return response
 
 # ============================================================
 # FIXED view for doctor_prescription_detail
@@ -6981,11 +7298,7 @@ def doctor_patients(request):
     # Search functionality
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        patients = patients.filter(
-            Q(full_name__icontains=search_query) |
-            Q(phone__icontains=search_query) |
-            Q(user__email__icontains=search_query)
-        )
+        patients = search_patients(patients, search_query)
 
     # Add appointment count and last visit for each patient
     for patient in patients:
@@ -7603,7 +7916,7 @@ def patient_reschedule_appointment(request, appointment_id):
         form = RescheduleAppointmentForm(instance=appointment)
     
     # Get available doctors for selection
-    available_doctors = DoctorProfile.objects.filter(status='Active')
+    available_doctors = get_directory().active
     
     # Calculate minimum date (tomorrow)
     min_date = timezone.now().date() + timedelta(days=1)
@@ -7791,12 +8104,23 @@ def frontdesk_appointments(request):
             Q(doctor__user__first_name__icontains=search) |
             Q(doctor__user__last_name__icontains=search)
         )
+
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(appointments, APPOINTMENT_EXPORT_COLUMNS, 'appointments', export_format)
     
     # Status choices for filter
     status_choices = Appointment.STATUS_CHOICES
 
+    page = keyset_paginate(
+        request, appointments, ('-appointment_date', '-appointment_time', '-id')
+    )
+
     context = {
-        'appointments': appointments,
+        'appointments': page,
+        'page': page,
+        # The page holds one screen of rows; the header shows every match
+        'appointment_count': appointments.count(),
         'status_choices': status_choices,
         'current_status': status,
         'search_query': search,
@@ -7960,32 +8284,39 @@ def frontdesk_doctors_list(request):
         messages.error(request, "You don't have access to this page.")
         return redirect('login')
 
-    doctors = DoctorProfile.objects.all().order_by('user__first_name')
+    directory = get_directory()
+    doctors = directory.doctors
     
-    # Search by name or specialization
+    # Search by name, specialization or department
     search = request.GET.get('search')
     if search:
-        doctors = doctors.filter(
-            Q(user__first_name__icontains=search) |
-            Q(user__last_name__icontains=search) |
-            Q(specialization__icontains=search) |
-            Q(department__icontains=search)
-        )
+        needle = search.lower()
+        doctors = [
+            doctor for doctor in doctors
+            if needle in doctor['name'].lower()
+            or needle in doctor['specialization'].lower()
+            or needle in doctor['department'].lower()
+        ]
     
-    # Filter by specialization
+    # Filter by specialization / department
     specialization = request.GET.get('specialization')
     if specialization:
-        doctors = doctors.filter(specialization=specialization)
+        doctors = [doctor for doctor in doctors if doctor['specialization'] == specialization]
+    department = request.GET.get('department')
+    if department:
+        doctors = [doctor for doctor in doctors if doctor['department'] == department]
     
     # Filter by status
     status = request.GET.get('status')
     if status:
-        doctors = doctors.filter(status=status)
+        doctors = [doctor for doctor in doctors if doctor['status'] == status]
 
     context = {
         'doctors': doctors,
         'search_query': search,
         'current_specialization': specialization,
+        'current_department': department,
+        'departments': directory.departments,
         'current_status': status,
     }
 
@@ -8036,27 +8367,36 @@ def frontdesk_payments(request):
     if status:
         payments = payments.filter(payment_status=status)
     
-    # Search by patient name
+    # Search by transaction id (exact) or patient name
     search = request.GET.get('search')
-    if search:
+    if search and search.strip().upper().startswith(TRANSACTION_ID_PREFIX):
+        payments = payments.filter(transaction_id=search.strip().upper())
+    elif search:
         payments = payments.filter(
             Q(patient__full_name__icontains=search) |
             Q(patient__user__email__icontains=search)
         )
+
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(payments, PAYMENT_EXPORT_COLUMNS, 'frontdesk_payments', export_format)
     
-    # Statistics
-    total_payments = payments.aggregate(total=Sum('amount'))['total'] or 0
-    paid_payments = payments.filter(payment_status='Paid').aggregate(total=Sum('amount'))['total'] or 0
-    pending_payments = payments.filter(payment_status='Pending').aggregate(total=Sum('amount'))['total'] or 0
+    # Statistics: a search needs its own aggregation, otherwise closed
+    # days come from the daily summaries
+    stats = status_totals(payments) if search else overall_totals(status)
+
+    page = keyset_paginate(request, payments, ('-payment_date', '-id'))
 
     context = {
-        'payments': payments,
+        'payments': page,
+        'page': page,
         'status_choices': Payment.PAYMENT_STATUS,
         'current_status': status,
         'search_query': search,
-        'total_payments': total_payments,
-        'paid_payments': paid_payments,
-        'pending_payments': pending_payments,
+        'total_payments': stats['total'],
+        'paid_payments': stats['paid_total'],
+        'pending_payments': stats['pending_total'],
+        'payment_count': stats['count'],
     }
 
     return render(request, 'core/dashboard/frontdesk_payments.html', context)
@@ -8071,10 +8411,18 @@ def frontdesk_payment_detail(request, payment_id):
         messages.error(request, "You don't have access to this page.")
         return redirect('login')
 
-    payment = get_object_or_404(Payment, id=payment_id)
+    payment = get_object_or_404(
+        Payment.objects.select_related('patient__user', 'appointment__doctor__user', 'test_booking__lab', 'test_booking__test'),
+        id=payment_id,
+    )
 
     if request.method == 'POST':
         new_status = request.POST.get('payment_status')
+        if new_status == 'Paid':
+            # Also confirms the appointment / test booking paid for
+            finalize_payment(payment.id, payment.payment_method)
+            messages.success(request, f"Payment status updated to {new_status}")
+            return redirect('frontdesk_payment_detail', payment_id=payment_id)
         if new_status in dict(Payment.PAYMENT_STATUS):
             payment.payment_status = new_status
             payment.save()
@@ -8089,6 +8437,85 @@ def frontdesk_payment_detail(request, payment_id):
 
     return render(request, 'core/dashboard/frontdesk_payment_detail.html', context)
 
+
+@login_required
+def frontdesk_payment_receipt(request, payment_id):
+    """Printable receipt of a payment"""
+    if not get_frontdesk_profile(request.user):
+        messages.error(request, "You don't have access to this page.")
+        return redirect('login')
+
+    try:
+        html = receipt_html(payment_id)
+    except Payment.DoesNotExist:
+        raise Http404("Payment not found")
+
+    return render(request, 'core/receipts/receipt_page.html', {
+        'payment_id': payment_id,
+        'receipt_html': html,
+        'back_url': reverse('frontdesk_payment_detail', args=[payment_id]),
+    })
+
+
+@login_required
+def frontdesk_cash_settlement(request):
+    """Settle the shift's pending cash payments in one go"""
+    frontdesk = get_frontdesk_profile(request.user)
+
+    if not frontdesk:
+        messages.error(request, "You don't have access to this page.")
+        return redirect('login')
+
+    today = timezone.localdate()
+    settlement = None
+
+    if request.method == 'POST':
+        try:
+            if request.POST.get('all_today'):
+                settlement = settle_cash_payments(day=today, settled_by=request.user)
+            else:
+                payment_ids = [int(pk) for pk in request.POST.getlist('payment_ids') if pk.isdigit()]
+                if not payment_ids:
+                    raise PaymentError("Select at least one payment to settle.")
+                settlement = settle_cash_payments(payment_ids, settled_by=request.user)
+        except PaymentError as e:
+            messages.error(request, str(e))
+            return redirect('frontdesk_cash_settlement')
+
+        if settlement.payments:
+            messages.success(
+                request,
+                f"Settled {len(settlement.payments)} cash payment(s) totalling ₹{settlement.total}."
+            )
+        else:
+            messages.info(request, "There were no pending cash payments to settle.")
+        if settlement.skipped:
+            messages.warning(
+                request,
+                "Skipped payment(s) that are no longer pending cash: "
+                + ", ".join(f"#{pk}" for pk in settlement.skipped)
+            )
+
+    pending = (
+        Payment.objects
+        .filter(payment_method='Cash', payment_status='Pending')
+        .select_related('patient', 'appointment__doctor__user', 'test_booking__lab')
+        .order_by('payment_date', 'id')
+    )
+    todays_pending = pending.filter(payment_date__date=today).aggregate(
+        count=Count('id'), total=Sum('amount'),
+    )
+
+    context = {
+        'today': today,
+        'pending_payments': pending,
+        'todays_pending_count': todays_pending['count'],
+        'todays_pending_total': todays_pending['total'] or 0,
+        'settlement': settlement,
+    }
+
+    return render(request, 'core/dashboard/frontdesk_cash_settlement.html', context)
+
 @login_required
 def frontdesk_reports(request):
     """View reports and analytics"""
@@ -8291,6 +8718,12 @@ def frontdesk_book_appointment(request):
                     return redirect('frontdesk_book_appointment')
             
             elif new_patient_name and new_patient_phone:
+                if not request.POST.get('confirm_new'):
+                    duplicates = likely_duplicates(new_patient_name, new_patient_phone, new_patient_email)
+                    if duplicates:
+                        messages.warning(request, duplicate_warning(duplicates))
+                        return redirect('frontdesk_book_appointment')
+
                 # Create new patient - FIXED
                 try:
                     # Generate unique username
@@ -8402,7 +8835,7 @@ def frontdesk_book_appointment(request):
                 )
                 
                 # Create payment
-                transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
+                transaction_id = new_transaction_id()
                 payment = Payment.objects.create(
                     patient=patient,
                     appointment=appointment,
@@ -8437,7 +8870,6 @@ def frontdesk_book_appointment(request):
                 return redirect('frontdesk_book_appointment')
     
     # GET request - Show form
-    patients = PatientProfile.objects.all().order_by('full_name')
     doctors = DoctorProfile.objects.filter(status='Active').order_by('user__first_name')
     
     # Check if we're in the middle of booking
@@ -8452,7 +8884,6 @@ def frontdesk_book_appointment(request):
             pass
     
     context = {
-        'patients': patients,
         'doctors': doctors,
         'selected_patient': selected_patient,
         'appointment_data': appointment_data,
@@ -8597,9 +9028,10 @@ def frontdesk_search_patient(request):
         if not query or len(query) < 2:
             return JsonResponse({'patients': []})
         
-        patients = PatientProfile.objects.filter(
-            full_name__icontains=query
-        )[:10]
+        # Ranked ids from the search index, then one query for the rows
+        patient_ids = search_patient_ids(query, limit=10)
+        patients_by_id = PatientProfile.objects.select_related('user').in_bulk(patient_ids)
+        patients = [patients_by_id[pk] for pk in patient_ids if pk in patients_by_id]
         
         patients_data = []
         for patient in patients:
@@ -8617,6 +9049,81 @@ def frontdesk_search_patient(request):
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+def frontdesk_caller_lookup(request):
+    """
+    AJAX endpoint: find the caller by phone number (full or last digits)
+    together with their upcoming appointments, in a single query.
+    """
+    if not (is_admin(request.user) or get_frontdesk_profile(request.user)):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    lookup = caller_lookup_filter(request.GET.get('phone', ''))
+    if lookup is None:
+        return JsonResponse({'patients': []})
+
+    # Matching patients (capped) LEFT JOINed to their upcoming appointments:
+    # one row per appointment, or a single row with NULLs if there are none
+    matches = PatientProfile.objects.filter(**lookup).order_by('full_name').values('id')[:5]
+    rows = (
+        PatientProfile.objects
+        .filter(id__in=matches)
+        .annotate(upcoming=FilteredRelation(
+            'appointment',
+            condition=Q(appointment__appointment_date__gte=date.today())
+            & ~Q(appointment__status__in=['Completed', 'Cancelled', 'No Show']),
+        ))
+        .order_by('full_name', 'id', 'upcoming__appointment_date', 'upcoming__appointment_time')
+        .values_list(
+            'id', 'full_name', 'phone', 'user__email', 'gender', 'dob',
+            'upcoming__id', 'upcoming__appointment_date', 'upcoming__appointment_time',
+            'upcoming__status', 'upcoming__doctor__user__first_name',
+            'upcoming__doctor__user__last_name',
+        )
+    )
+
+    patients = {}
+    for (patient_id, name, phone, email, gender, dob,
+         appointment_id, appointment_date, appointment_time, status,
+         doctor_first_name, doctor_last_name) in rows:
+        patient = patients.setdefault(patient_id, {
+            'id': patient_id,
+            'name': name,
+            'phone': phone,
+            'email': email,
+            'gender': gender or 'Not specified',
+            'dob': str(dob) if dob else 'N/A',
+            'upcoming_appointments': [],
+        })
+        if appointment_id is not None:
+            patient['upcoming_appointments'].append({
+                'id': appointment_id,
+                'date': appointment_date.strftime('%Y-%m-%d'),
+                'time': appointment_time.strftime('%H:%M'),
+                'status': status,
+                'doctor': f"Dr. {doctor_first_name} {doctor_last_name}".strip(),
+            })
+
+    return JsonResponse({'patients': list(patients.values())})
+
+
+@login_required
+def frontdesk_patient_typeahead(request):
+    """
+    AJAX endpoint for the patient pickers on the booking pages: up to ten
+    matching patients as id, name and masked phone number.
+    """
+    if not get_frontdesk_profile(request.user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    active_only = request.GET.get('active') == '1'
+    return JsonResponse({'results': patient_typeahead(request.GET.get('q', ''), active_only)})
+
+
 def generate_token(appointment):
     """
     Generate appointment token - SIMPLE VERSION
@@ -8858,14 +9365,13 @@ def frontdesk_book_lab_test(request):
             )
 
             # Create payment (mark as Paid since front desk collects payment)
-            import uuid
             payment = Payment.objects.create(
                 patient=patient,
                 test_booking=booking,
                 amount=test.price,
                 payment_method=payment_method,
                 payment_status='Paid',
-                transaction_id=f"TXN{uuid.uuid4().hex[:12].upper()}"
+                transaction_id=new_transaction_id()
             )
 
             messages.success(
@@ -8886,13 +9392,12 @@ def frontdesk_book_lab_test(request):
         return redirect('frontdesk_book_lab_test')
 
     # GET - Load form data
-    patients = PatientProfile.objects.filter(status='Active').order_by('full_name')
-    labs = Lab.objects.filter(status='Active').order_by('name')
-    tests = DiagnosticTest.objects.filter(is_active=True).select_related('lab').order_by('test_name')
+    catalogue = get_catalogue()
+    labs = catalogue.active_labs()
+    tests = catalogue.search(active_only=True)
 
     from datetime import date
     context = {
-        'patients': patients,
         'labs': labs,
         'tests': tests,
         'today': date.today().isoformat(),
@@ -8966,11 +9471,16 @@ def frontdesk_get_tests_by_lab(request):
     if not frontdesk:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
 
-    lab_id = request.GET.get('lab_id', '')
-    if not lab_id:
-        tests = DiagnosticTest.objects.filter(is_active=True).select_related('lab')
-    else:
-        tests = DiagnosticTest.objects.filter(lab__id=lab_id, is_active=True).select_related('lab')
+    lab_id = request.GET.get('lab_id', '').strip()
+    if lab_id and not lab_id.isdigit():
+        return JsonResponse({'tests': []})
+
+    tests = get_catalogue().search(
+        request.GET.get('q', ''),
+        lab_id=int(lab_id) if lab_id else None,
+        category=request.GET.get('category', '').strip() or None,
+        active_only=True,
+    )
 
     tests_data = []
     for test in tests:
@@ -9028,6 +9538,13 @@ def frontdesk_add_patient(request):
         messages.error(request, f"A patient with the email '{email}' already exists.")
         return redirect(f"/frontdesk/patients/?open_modal=1")
 
+    # ── Check for likely duplicates ────────────────────────────────
+    if not request.POST.get('confirm_new'):
+        duplicates = likely_duplicates(f"{first_name} {last_name}", phone, email, dob)
+        if duplicates:
+            messages.warning(request, duplicate_warning(duplicates))
+            return redirect(f"/frontdesk/patients/?open_modal=1")
+
     try:
         # ── Create Django User ─────────────────────────────────────
         username = generate_unique_username(email)
@@ -9091,11 +9608,7 @@ def frontdesk_patients_list(request):
 
     search = request.GET.get('search', '').strip()
     if search:
-        patients = patients.filter(
-            Q(full_name__icontains=search) |
-            Q(phone__icontains=search) |
-            Q(user__email__icontains=search)
-        )
+        patients = search_patients(patients, search)
 
     status = request.GET.get('status', '').strip()
     if status:
@@ -9103,8 +9616,12 @@ def frontdesk_patients_list(request):
 
     all_patients = PatientProfile.objects.all()
 
+    page = keyset_paginate(request, patients, ('full_name', 'id'))
+
     context = {
-        'patients':       patients,
+        'patients':       page,
+        'page':           page,
+        'patient_count':  patients.count(),
         'search_query':   search,
         'current_status': status,
         # counts for the stat cards (optional — only needed if your
@@ -9175,6 +9692,10 @@ def patient_lab_results(request):
             Q(doctor__user__first_name__icontains=search_query) |
             Q(doctor__user__last_name__icontains=search_query)
         )
+
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(results, LAB_RESULT_EXPORT_COLUMNS, 'lab_results', export_format)
     
     # Calculate statistics
     all_results = LabResult.objects.filter(patient=patient)
@@ -9194,6 +9715,7 @@ def patient_lab_results(request):
         'recent_count': recent_count,
         'status_filter': status_filter,
         'search_query': search_query,
+        'patient': patient,
     }
     
     return render(request, 'core/dashboard/patient_lab_results.html', context)
@@ -9254,127 +9776,66 @@ def download_lab_result_pdf(request, result_id):
         return redirect('patient_dashboard')
     
     result = get_object_or_404(
-        LabResult,
+        LabResult.objects.select_related(
+            'doctor__user', 'lab_technician__user'
+        ),
         id=result_id,
         patient=patient
     )
+
+    fingerprint = {
+        'result': [result.id, result.updated_at],
+        'patient': [patient.full_name, patient.gender, patient.dob, patient.phone],
+        'doctor': [result.doctor.user.get_full_name(), result.doctor.specialization],
+        'technician': result.lab_technician.user.get_full_name(),
+    }
     
-    # Generate PDF using reportlab
-    from io import BytesIO
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from django.http import FileResponse
-    
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=10,
-        alignment=1
-    )
-    
-    elements.append(Paragraph("LAB RESULT REPORT", title_style))
-    elements.append(Spacer(1, 20))
-    
-    # Patient Info
-    patient_info = [
-        ['Patient Name:', result.patient.full_name],
-        ['Gender:', result.patient.gender or 'N/A'],
-        ['Date of Birth:', str(result.patient.dob) if result.patient.dob else 'N/A'],
-        ['Phone:', result.patient.phone or 'N/A'],
-        ['Test Date:', result.test_date.strftime('%d-%m-%Y')],
-    ]
-    
-    patient_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f4f8')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-    ]))
-    elements.append(patient_table)
-    elements.append(Spacer(1, 20))
-    
-    # Test Results
-    elements.append(Paragraph("TEST RESULTS", styles['Heading2']))
-    elements.append(Spacer(1, 10))
-    
-    result_data = [
-        ['Test Name', 'Result Value', 'Normal Range', 'Status'],
-        [
-            result.test_name,
-            result.test_value,
-            result.normal_range,
-            result.result_status
+    def render():
+        status_color = '#10b981' if result.result_status == 'Normal' else '#f59e0b'
+        sections = [
+            {'table': {
+                'rows': [
+                    ['Patient Name:', result.patient.full_name],
+                    ['Gender:', result.patient.gender or 'N/A'],
+                    ['Date of Birth:', str(result.patient.dob) if result.patient.dob else 'N/A'],
+                    ['Phone:', result.patient.phone or 'N/A'],
+                    ['Test Date:', result.test_date.strftime('%d-%m-%Y')],
+                ],
+                'col_widths': [2, 4],
+                'style': 'info',
+            }},
+            {'heading': 'TEST RESULTS', 'table': {
+                'rows': [
+                    ['Test Name', 'Result Value', 'Normal Range', 'Status'],
+                    [result.test_name, result.test_value, result.normal_range, result.result_status],
+                ],
+                'col_widths': [2, 1.5, 1.5, 1],
+                'style': 'data',
+                'highlight': [{'cell': [3, 1], 'color': status_color}],
+            }},
         ]
-    ]
-    
-    result_table = Table(result_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1*inch])
-    
-    # Color code the status
-    if result.result_status == 'Normal':
-        status_color = colors.HexColor('#10b981')
-    else:
-        status_color = colors.HexColor('#f59e0b')
-    
-    result_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#cccccc')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white]),
-        ('TEXTCOLOR', (3, 1), (3, 1), status_color),
-        ('FONTNAME', (3, 1), (3, 1), 'Helvetica-Bold'),
-    ]))
-    elements.append(result_table)
-    elements.append(Spacer(1, 20))
-    
-    # Remarks
-    if result.remarks:
-        elements.append(Paragraph("REMARKS", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        elements.append(Paragraph(result.remarks, styles['Normal']))
-        elements.append(Spacer(1, 20))
-    
-    # Doctor Info
-    elements.append(Paragraph("AUTHORIZED BY", styles['Heading2']))
-    elements.append(Spacer(1, 10))
-    
-    doctor_info = [
-        ['Doctor:', f"Dr. {result.doctor.user.get_full_name()}"],
-        ['Specialization:', result.doctor.specialization],
-        ['Lab Technician:', result.lab_technician.user.get_full_name()],
-    ]
-    
-    doctor_table = Table(doctor_info, colWidths=[2*inch, 4*inch])
-    doctor_table.setStyle(TableStyle([
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(doctor_table)
-    
-    # Build PDF
-    doc.build(elements)
-    pdf_buffer.seek(0)
-    
-    response = FileResponse(pdf_buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="lab_result_{result.id}_{datetime.now().strftime("%Y%m%d")}.pdf"'
-    return response
+        if result.remarks:
+            sections.append({'heading': 'REMARKS', 'paragraphs': [result.remarks]})
+        sections.append({'heading': 'AUTHORIZED BY', 'table': {
+            'rows': [
+                ['Doctor:', f"Dr. {result.doctor.user.get_full_name()}"],
+                ['Specialization:', result.doctor.specialization],
+                ['Lab Technician:', result.lab_technician.user.get_full_name()],
+            ],
+            'col_widths': [2, 4],
+            'style': 'plain',
+        }})
+        return render_pdf({'title': 'LAB RESULT REPORT', 'sections': sections})
+
+    try:
+        return cached_pdf_response(
+            'lab_result',
+            fingerprint,
+            render,
+            f"lab_result_{result.id}_{datetime.now().strftime('%Y%m%d')}.pdf",
+        )
+    except RenderUnavailable as e:
+        return render_busy_response(e)
 
 @login_required
 def lab_booking_detail(request, booking_id):
@@ -9461,10 +9922,18 @@ def frontdesk_lab_bookings(request):
             Q(test__test_name__icontains=search)
         )
 
+    export_format = get_export_format(request)
+    if export_format:
+        return export_response(bookings, TEST_BOOKING_EXPORT_COLUMNS, 'lab_bookings', export_format)
+
     labs = Lab.objects.filter(status='Active')
 
+    page = keyset_paginate(request, bookings, ('-created_at', '-id'))
+
     context = {
-        'bookings':       bookings,
+        'bookings':       page,
+        'page':           page,
+        'booking_count':  bookings.count(),
         'status_filter':  status_filter,
         'search_query':   search,
         'lab_filter':     lab_filter,
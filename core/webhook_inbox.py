@@ -0,0 +1,82 @@
+"""
+Durable inbox for payment gateway webhooks.
+
+The webhook endpoint only verifies a delivery and stores it with
+``record_event()``, so the gateway gets its 200 at once and nothing is
+lost if applying the event fails. Deliveries of an event already stored
+(gateways retry, and sometimes send the same event twice) are dropped by
+the unique (gateway, event id) constraint.
+
+``process_inbox()``, run by the ``process_webhooks`` command, applies
+pending events oldest first, one transaction per event. Where the
+database supports ``SKIP LOCKED`` several workers can run side by side.
+A failed event is retried with exponential backoff and given up after
+``WEBHOOK_MAX_ATTEMPTS`` tries.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .payment_gateway import apply_event
+
+
+def record_event(gateway, event_id, event_type, data):
+    """Store a webhook delivery; returns False for a duplicate."""
+    from .models import WebhookEvent
+
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(gateway=gateway, event_id=event_id, event_type=event_type, payload=data)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _next_event():
+    from .models import WebhookEvent
+
+    events = WebhookEvent.objects.filter(
+        status='Pending', available_at__lte=timezone.now(),
+    ).order_by('available_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        events = events.select_for_update(skip_locked=True)
+    else:
+        events = events.select_for_update()
+    return events.first()
+
+
+def process_next():
+    """Apply the oldest pending event; returns False when there is none."""
+    max_attempts = getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 5)
+    with transaction.atomic():
+        event = _next_event()
+        if event is None:
+            return False
+
+        event.attempts += 1
+        try:
+            with transaction.atomic():
+                apply_event(event.event_type, event.payload)
+        except Exception as e:  # recorded on the event and retried
+            event.last_error = f"{type(e).__name__}: {e}"
+            if event.attempts >= max_attempts:
+                event.status = 'Failed'
+            else:
+                event.available_at = timezone.now() + timedelta(seconds=2 ** event.attempts)
+        else:
+            event.status = 'Processed'
+            event.processed_at = timezone.now()
+            event.last_error = ''
+        event.save(update_fields=['attempts', 'status', 'available_at', 'processed_at', 'last_error'])
+    return True
+
+
+def process_inbox(limit=None):
+    """Apply pending events until none is left (or ``limit``); returns how many."""
+    count = 0
+    while (limit is None or count < limit) and process_next():
+        count += 1
+    return count
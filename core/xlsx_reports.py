@@ -0,0 +1,39 @@
+"""
+Excel counterpart of ``core.pdf_reports``: renders a plain spec into
+XLSX bytes so the work can run in the render pool.
+
+    {
+        'sheet_title': 'Lab Report',
+        'rows': [['Lab Report - Main Lab'], [], ['Metric', 'Value'], ...],
+        'column_widths': {'A': 20, 'B': 25},
+    }
+
+As with PDF reports, a long table is passed as ``'rows_file'`` (a CSV
+file of further rows, appended after ``'rows'``) and streamed into the
+write-only worksheet one row at a time.
+"""
+
+import csv
+from io import BytesIO
+
+import openpyxl
+
+
+def render_workbook(spec):
+    """Render a workbook spec and return the XLSX bytes."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(spec.get('sheet_title', 'Sheet1'))
+
+    for column, width in spec.get('column_widths', {}).items():
+        ws.column_dimensions[column].width = width
+
+    for row in spec['rows']:
+        ws.append(list(row))
+    if spec.get('rows_file'):
+        with open(spec['rows_file'], newline='', encoding='utf-8') as rows_file:
+            for row in csv.reader(rows_file):
+                ws.append(row)
+
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()